@@ -5,21 +5,34 @@ from flask_caching import Cache
 from datetime import datetime, timedelta
 from contextlib import contextmanager
 from functools import wraps
-from time import time, sleep
+from time import time, sleep, monotonic
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import atexit
+import base64
 import hashlib
+import math
 import os
 import json
+import socket
+import uuid
 import logging
 import threading
 from logging.handlers import RotatingFileHandler
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, CheckConstraint, func, case, desc
-from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey, CheckConstraint, Index, and_, func, case, desc, event, inspect, insert, or_, select, tuple_, update
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker, declarative_base, relationship, joinedload, contains_eager, Session as OrmSession
 from sqlalchemy.ext.hybrid import hybrid_property
 import pandas as pd
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from config import Config
 from smart_noise_simulator import SmartNoiseSimulator
+from ingest_buffer import IngestBuffer
+from stream_broadcaster import StreamBroadcaster, StreamItem, matches_filters
+from scheduler import PeriodicTask
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -99,6 +112,37 @@ def get_pagination_params():
     return max(page, 1), min(max(per_page, 1), 100)  # 限制每页最多100条
 
 
+def encode_cursor(timestamp, key):
+    """把排序键 (时间, ID) 编码为不透明的游标字符串"""
+    payload = json.dumps([timestamp.isoformat(), key])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，返回 (时间, ID)，格式错误时抛出 ValueError"""
+    try:
+        timestamp, key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.fromisoformat(timestamp), int(key)
+    except (ValueError, TypeError) as e:
+        raise ValueError('无效的分页游标') from e
+
+
+def keyset_page(query, time_column, id_column, cursor, per_page):
+    """按 (时间, ID) 倒序的游标分页，返回 (本页数据, 下一页游标)
+    
+    只取游标之后的 per_page + 1 条判断是否还有下一页，耗时与翻页深度无关；最后一页的下一页游标为None。
+    """
+    if cursor:
+        timestamp, key = decode_cursor(cursor)
+        query = query.filter(tuple_(time_column, id_column) < tuple_(timestamp, key))
+    rows = query.order_by(time_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(getattr(rows[-1], time_column.key), getattr(rows[-1], id_column.key))
+    return rows, next_cursor
+
+
 def setup_logging(app):
     """配置日志"""
     if not os.path.exists(Config.LOG_DIR):
@@ -334,8 +378,8 @@ class RealtimeData(Base):
     Humidity = Column(Float)  # 环境湿度（%）
     WindSpeed = Column(Float)  # 风速（m/s）
     WeatherCondition = Column(String(50))  # 天气状况
-    SensorID = Column(String(50), ForeignKey('sensor.SensorID'), nullable=False, index=True)
-    PointID = Column(Integer, ForeignKey('monitoring_point.PointID'), nullable=False, index=True)
+    SensorID = Column(String(50), ForeignKey('sensor.SensorID'), nullable=False)
+    PointID = Column(Integer, ForeignKey('monitoring_point.PointID'), nullable=False)
     
     # 计算字段：是否超标
     @hybrid_property
@@ -349,6 +393,18 @@ class RealtimeData(Base):
                 return self.NoiseValue > point.NoiseThresholdNight
         return False
     
+    @is_exceeded.expression
+    def is_exceeded(cls):
+        # SQL 表达式：通过关联子查询读取监测点阈值，无需 join 即可用于 filter 和 SUM(CASE ...)
+        hour_expr = func.extract('hour', cls.Timestamp)
+        threshold = select(
+            case(
+                ((hour_expr >= 6) & (hour_expr < 22), MonitoringPoint.NoiseThresholdDay),
+                else_=MonitoringPoint.NoiseThresholdNight
+            )
+        ).where(MonitoringPoint.PointID == cls.PointID).scalar_subquery()
+        return cls.NoiseValue > threshold
+    
     # 关系
     sensor = relationship('Sensor', back_populates='realtime_data')
     monitoring_point = relationship('MonitoringPoint', back_populates='realtime_data')
@@ -361,6 +417,10 @@ class RealtimeData(Base):
         CheckConstraint('Temperature >= -50 AND Temperature <= 60', name='chk_temperature'),
         CheckConstraint('Humidity >= 0 AND Humidity <= 100', name='chk_humidity'),
         CheckConstraint('WindSpeed >= 0 AND WindSpeed <= 100', name='chk_wind_speed'),
+        # 查询几乎都是“监测点/传感器 + 时间范围，按时间排序”，复合索引同时覆盖过滤和排序；
+        # 前缀列也可用于只按监测点/传感器过滤的查询，因此不再单独为两列建索引
+        Index('idx_realtime_data_point_time', 'PointID', 'Timestamp'),
+        Index('idx_realtime_data_sensor_time', 'SensorID', 'Timestamp'),
     )
     
     def to_dict(self):
@@ -587,6 +647,306 @@ class Report(Base):
         }
 
 
+class ReportJob(Base):
+    """报告生成任务表"""
+    __tablename__ = 'report_job'
+    
+    JobID = Column(Integer, primary_key=True, autoincrement=True)
+    ReportType = Column(String(20), nullable=False)
+    StartDate = Column(DateTime, nullable=False)  # 报告周期开始时间
+    EndDate = Column(DateTime, nullable=False)  # 报告周期结束时间
+    GeneratedBy = Column(Integer, ForeignKey('system_user.UserID'), nullable=False)
+    IsPublic = Column(Integer, default=0)
+    JobStatus = Column(String(20), nullable=False, default='排队中')  # 排队中、进行中、已完成、失败
+    Progress = Column(Integer, default=0)  # 完成百分比
+    ActiveKey = Column(String(100), unique=True)  # 未结束任务的去重键（类型+周期），结束后置空
+    ReportID = Column(Integer, ForeignKey('report.ReportID'))  # 生成的报告
+    ErrorMessage = Column(String(500))
+    ClaimToken = Column(String(32))  # 当前执行者认领时生成的令牌，重新排队后失效，只有持有令牌的执行者能更新进度和结果
+    CreatedAt = Column(DateTime, default=datetime.now)
+    StartedAt = Column(DateTime)
+    HeartbeatAt = Column(DateTime)  # 执行者最近一次汇报进度的时间
+    FinishedAt = Column(DateTime)
+    
+    __table_args__ = (
+        CheckConstraint("JobStatus IN ('排队中', '进行中', '已完成', '失败')", name='chk_job_status'),
+        Index('idx_report_job_status', 'JobStatus'),
+    )
+    
+    def to_dict(self):
+        return {
+            'job_id': self.JobID,
+            'report_type': self.ReportType,
+            'start_date': self.StartDate.isoformat() if self.StartDate else None,
+            'end_date': self.EndDate.isoformat() if self.EndDate else None,
+            'job_status': self.JobStatus,
+            'progress': self.Progress or 0,
+            'report_id': self.ReportID,
+            'error_message': self.ErrorMessage,
+            'created_at': self.CreatedAt.isoformat() if self.CreatedAt else None,
+            'started_at': self.StartedAt.isoformat() if self.StartedAt else None,
+            'finished_at': self.FinishedAt.isoformat() if self.FinishedAt else None
+        }
+
+
+class HourlyRollup(Base):
+    """小时汇总表 - 按传感器、监测点和小时增量维护的噪音统计"""
+    __tablename__ = 'hourly_rollup'
+    
+    SensorID = Column(String(50), ForeignKey('sensor.SensorID'), primary_key=True)
+    PointID = Column(Integer, ForeignKey('monitoring_point.PointID'), primary_key=True)
+    HourStart = Column(DateTime, primary_key=True)  # 小时起点，如 2025-01-01 08:00:00
+    NoiseSum = Column(Float, nullable=False, default=0)  # 噪音值之和
+    SampleCount = Column(Integer, nullable=False, default=0)  # 数据条数
+    NoiseMin = Column(Float)  # 最小噪音值
+    NoiseMax = Column(Float)  # 最大噪音值
+    EnergySum = Column(Float, nullable=False, default=0)  # 声能之和 Σ10^(L/10)，用于计算等效声级
+    ExceedCount = Column(Integer, nullable=False, default=0)  # 超标次数
+    
+    __table_args__ = (
+        Index('idx_hourly_rollup_hour', 'HourStart'),
+    )
+    
+    def to_dict(self):
+        return {
+            'sensor_id': self.SensorID,
+            'point_id': self.PointID,
+            'hour_start': self.HourStart.isoformat() if self.HourStart else None,
+            'avg_noise': round(self.NoiseSum / self.SampleCount, 2) if self.SampleCount else None,
+            'leq': round(10 * math.log10(self.EnergySum / self.SampleCount), 2) if self.SampleCount and self.EnergySum else None,
+            'max_noise': self.NoiseMax,
+            'min_noise': self.NoiseMin,
+            'count': self.SampleCount,
+            'exceed_count': self.ExceedCount
+        }
+
+
+class SensorLatest(Base):
+    """传感器最新读数表 - 写入实时数据时在同一事务内维护，地图和设备列表直接读取"""
+    __tablename__ = 'sensor_latest'
+    
+    SensorID = Column(String(50), ForeignKey('sensor.SensorID'), primary_key=True)
+    PointID = Column(Integer, ForeignKey('monitoring_point.PointID'), nullable=False)  # 最新读数所属监测点
+    NoiseValue = Column(Float, nullable=False)  # 最新噪音值
+    Timestamp = Column(DateTime, nullable=False)  # 最新读数的采集时间
+    IsExceeded = Column(Integer, nullable=False, default=0)  # 按读数所在时段（昼/夜）阈值判断是否超标
+    
+    def to_dict(self):
+        return {
+            'sensor_id': self.SensorID,
+            'point_id': self.PointID,
+            'noise_value': self.NoiseValue,
+            'timestamp': self.Timestamp.isoformat() if self.Timestamp else None,
+            'is_exceeded': bool(self.IsExceeded)
+        }
+
+
+class PointLatest(Base):
+    """监测点最近读数窗口表 - 保存监测点最近 N 条读数（POINT_RECENT_WINDOW）及其平均值"""
+    __tablename__ = 'point_latest'
+    
+    PointID = Column(Integer, ForeignKey('monitoring_point.PointID'), primary_key=True)
+    RecentValues = Column(String(4000), nullable=False)  # 最近 N 条读数 [[时间, 噪音值], ...]，按时间升序，JSON格式存储
+    AvgNoise = Column(Float, nullable=False)  # 窗口内读数的平均值
+    UpdatedAt = Column(DateTime, nullable=False)  # 窗口内最新读数的采集时间
+    
+    def to_dict(self):
+        return {
+            'point_id': self.PointID,
+            'avg_noise': self.AvgNoise,
+            'recent_values': json.loads(self.RecentValues) if self.RecentValues else [],
+            'updated_at': self.UpdatedAt.isoformat() if self.UpdatedAt else None
+        }
+
+
+class WorkerLease(Base):
+    """后台任务租约表 - 多进程部署时选出唯一执行后台任务的进程"""
+    __tablename__ = 'worker_lease'
+    
+    LeaseName = Column(String(50), primary_key=True)  # 租约名称，如"realtime_generation"
+    Enabled = Column(Integer, nullable=False, default=0)  # 后台任务是否开启（所有进程共享的期望状态）
+    HolderID = Column(String(100))  # 当前持有租约的进程标识
+    AcquiredAt = Column(DateTime)  # 当前持有者获得租约的时间
+    RenewedAt = Column(DateTime)  # 最近一次续租时间
+    ExpiresAt = Column(DateTime)  # 租约到期时间，过期后其他进程可接管
+    Status = Column(String(4000))  # 持有者上报的运行指标，JSON格式存储
+    
+    def to_dict(self):
+        return {
+            'lease_name': self.LeaseName,
+            'enabled': bool(self.Enabled),
+            'holder_id': self.HolderID,
+            'acquired_at': self.AcquiredAt.isoformat() if self.AcquiredAt else None,
+            'renewed_at': self.RenewedAt.isoformat() if self.RenewedAt else None,
+            'expires_at': self.ExpiresAt.isoformat() if self.ExpiresAt else None
+        }
+
+
+class SchemaMigration(Base):
+    """数据迁移记录表 - 记录已执行的一次性数据迁移（如根据历史数据重建汇总表）"""
+    __tablename__ = 'schema_migration'
+    
+    Name = Column(String(100), primary_key=True)  # 迁移名称，如"hourly_rollup"
+    AppliedAt = Column(DateTime, nullable=False, default=datetime.now)  # 执行时间
+
+
+# 旧版本为 realtime_data 的 SensorID、PointID 单列建立的索引，已被复合索引的前缀覆盖
+LEGACY_REALTIME_INDEXES = ('ix_realtime_data_SensorID', 'ix_realtime_data_PointID')
+
+
+def migrate_realtime_indexes(bind):
+    """为已有数据库补建 realtime_data 复合索引并删除被覆盖的单列索引（create_all 不会修改已存在的表）"""
+    for index in RealtimeData.__table__.indexes:
+        index.create(bind, checkfirst=True)
+    for name in LEGACY_REALTIME_INDEXES:
+        legacy = Index(name, RealtimeData.__table__.c[name.rsplit('_', 1)[1]])
+        RealtimeData.__table__.indexes.discard(legacy)  # 只用于删除，不能留在模型定义中（否则 create_all 会重新创建）
+        legacy.drop(bind, checkfirst=True)
+
+
+# 列表接口序列化（to_dict）用到的关联对象随主查询一起加载，避免逐行懒加载产生 N+1 查询
+REALTIME_DATA_LOADS = (joinedload(RealtimeData.sensor), joinedload(RealtimeData.monitoring_point))
+SENSOR_LOADS = (joinedload(Sensor.monitoring_point).joinedload(MonitoringPoint.city),)
+ALERT_LOADS = (
+    joinedload(AlertInfo.realtime_data).joinedload(RealtimeData.sensor),
+    joinedload(AlertInfo.realtime_data).joinedload(RealtimeData.monitoring_point),
+    joinedload(AlertInfo.handler)
+)
+
+
+# ==================== 传感器元数据缓存 ====================
+
+PointMeta = namedtuple('PointMeta', [
+    'PointID', 'PointName', 'PointCode', 'PointType', 'District', 'CityID',
+    'Longitude', 'Latitude', 'NoiseThresholdDay', 'NoiseThresholdNight'
+])
+SensorMeta = namedtuple('SensorMeta', ['SensorID', 'SensorName', 'Status', 'PointID', 'point'])
+
+
+class SensorRegistry:
+    """传感器/监测点元数据的进程内缓存
+    
+    数据接入和告警判断只读取这里的快照，不再逐条查询传感器和监测点。
+    Sensor/MonitoringPoint 的变更提交后版本号递增，下次读取时整表重新加载；
+    其他进程（多 worker）的修改由 ttl 兜底，未命中时另外按 miss_reload_interval 限流重新加载，
+    其他进程刚新增或启用的传感器不必等到 ttl 过期。
+    """
+    
+    def __init__(self, ttl=300, miss_reload_interval=1.0):
+        self.ttl = ttl
+        self.miss_reload_interval = miss_reload_interval
+        self._version = 0
+        self._version_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded_version = None
+        self._loaded_at = 0
+        self._sensors = {}
+        self._points = {}
+    
+    @property
+    def version(self):
+        return self._version
+    
+    def invalidate(self):
+        """标记缓存失效"""
+        with self._version_lock:
+            self._version += 1
+    
+    def _is_fresh(self):
+        return self._loaded_version == self._version and time() - self._loaded_at < self.ttl
+    
+    def _load(self, session):
+        points = {}
+        for row in session.query(
+            MonitoringPoint.PointID, MonitoringPoint.PointName, MonitoringPoint.PointCode,
+            MonitoringPoint.PointType, MonitoringPoint.District, MonitoringPoint.CityID,
+            MonitoringPoint.Longitude, MonitoringPoint.Latitude,
+            MonitoringPoint.NoiseThresholdDay, MonitoringPoint.NoiseThresholdNight
+        ):
+            points[row.PointID] = PointMeta(*row)
+        
+        sensors = {}
+        for row in session.query(Sensor.SensorID, Sensor.SensorName, Sensor.Status, Sensor.PointID):
+            sensors[row.SensorID] = SensorMeta(*row, point=points.get(row.PointID))
+        return sensors, points
+    
+    def _reload(self, session):
+        version = self._version
+        if session is None:
+            with get_db_session() as load_session:
+                sensors, points = self._load(load_session)
+        else:
+            sensors, points = self._load(session)
+        self._sensors, self._points = sensors, points
+        self._loaded_version = version
+        self._loaded_at = time()
+    
+    def _ensure_loaded(self, session=None):
+        if self._is_fresh():
+            return
+        with self._load_lock:
+            if not self._is_fresh():
+                self._reload(session)
+    
+    def _reload_on_miss(self, session=None):
+        """缓存未命中时重新加载，距上次加载不足 miss_reload_interval 时不加载，返回是否已重新加载"""
+        if time() - self._loaded_at < self.miss_reload_interval:
+            return False
+        with self._load_lock:
+            if time() - self._loaded_at < self.miss_reload_interval:
+                return False
+            self._reload(session)
+        return True
+    
+    def get(self, sensor_id, session=None, online=False):
+        """获取传感器元数据（含所属监测点），不存在时返回None
+        
+        未命中（online=True 时还包括状态不是"在线"）时限流重新加载一次后再判断。
+        """
+        self._ensure_loaded(session)
+        sensor = self._sensors.get(sensor_id)
+        if (sensor is None or (online and sensor.Status != '在线')) and self._reload_on_miss(session):
+            sensor = self._sensors.get(sensor_id)
+        return sensor
+    
+    def get_point(self, point_id, session=None):
+        """获取监测点元数据，不存在时返回None（未命中时限流重新加载一次）"""
+        self._ensure_loaded(session)
+        point = self._points.get(point_id)
+        if point is None and self._reload_on_miss(session):
+            point = self._points.get(point_id)
+        return point
+    
+    def sensors(self, session=None):
+        """获取全部传感器元数据快照"""
+        self._ensure_loaded(session)
+        return list(self._sensors.values())
+
+
+sensor_registry = SensorRegistry(ttl=Config.SENSOR_REGISTRY_TTL, miss_reload_interval=Config.SENSOR_REGISTRY_MISS_RELOAD_SECONDS)
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def track_metadata_changes(session, flush_context):
+    """记录本次事务是否修改了传感器或监测点"""
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Sensor, MonitoringPoint)):
+            session.info['metadata_changed'] = True
+            break
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def invalidate_sensor_registry(session):
+    """元数据变更提交后使缓存失效"""
+    if session.info.pop('metadata_changed', False):
+        sensor_registry.invalidate()
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_metadata_changes(session):
+    session.info.pop('metadata_changed', None)
+
+
 # ==================== 辅助函数 ====================
 
 def allowed_file(filename):
@@ -619,44 +979,1379 @@ def calculate_noise_level(noise_value, region_type):
         return '重度污染'
 
 
+def to_local_naive(timestamp):
+    """带时区的时间转换为本地时间并去掉时区信息（数据库统一存储不带时区的本地时间），不带时区的原样返回"""
+    if timestamp is not None and timestamp.tzinfo is not None:
+        return timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+
+def get_noise_threshold(point, timestamp):
+    """获取监测点在指定时刻适用的阈值：昼间（6:00-22:00）/夜间（22:00-6:00）"""
+    if 6 <= timestamp.hour < 22:
+        return point.NoiseThresholdDay
+    return point.NoiseThresholdNight
+
+
+def is_noise_exceeded(noise_value, timestamp, point):
+    """判断噪音值是否超过监测点阈值"""
+    if not point:
+        return False
+    return noise_value > get_noise_threshold(point, timestamp)
+
+
+def noise_exceeded_condition():
+    """超标判断的 SQL 表达式（查询中需关联 MonitoringPoint）
+    
+    昼间（6:00-22:00）使用 NoiseThresholdDay，夜间（22:00-6:00）使用 NoiseThresholdNight，
+    与 is_noise_exceeded 的判断规则一致。已关联 MonitoringPoint 的聚合查询用它代替
+    RealtimeData.is_exceeded，省去逐行的关联子查询。
+    """
+    hour_expr = func.extract('hour', RealtimeData.Timestamp)
+    return case(
+        (
+            (hour_expr >= 6) & (hour_expr < 22),
+            RealtimeData.NoiseValue > MonitoringPoint.NoiseThresholdDay
+        ),
+        else_=RealtimeData.NoiseValue > MonitoringPoint.NoiseThresholdNight
+    )
+
+
+def get_alert_level(noise_value, timestamp, point):
+    """根据超标程度确定告警级别，未超标（或没有监测点）时返回None"""
+    if not point:
+        return None
+    
+    exceed_amount = noise_value - get_noise_threshold(point, timestamp)
+    if exceed_amount <= 0:
+        return None
+    if exceed_amount <= 5:
+        return '低'
+    elif exceed_amount <= 10:
+        return '中'
+    elif exceed_amount <= 15:
+        return '高'
+    return '紧急'
+
+
+def build_alert(realtime_data, point):
+    """根据监测点阈值构建告警记录（不刷新会话），未超标时返回None
+    
+    point 可以是 MonitoringPoint 实例，也可以是 sensor_registry 中的 PointMeta。
+    """
+    level = get_alert_level(realtime_data.NoiseValue, realtime_data.Timestamp, point)
+    if not level:
+        return None
+    
+    return AlertInfo(
+        AlertLevel=level,
+        TriggerTime=realtime_data.Timestamp,
+        DataID=realtime_data.DataID,
+        AlertStatus='未处理',
+        AlertType='噪音超标'
+    )
+
+
 def check_and_generate_alert(realtime_data, session):
     """检查实时噪音数据是否超标并生成告警"""
-    if realtime_data.is_exceeded:
-        # 计算告警级别
-        exceed_amount = 0
-        hour = realtime_data.Timestamp.hour
-        point = realtime_data.monitoring_point
-        
-        if point:
-            if 6 <= hour < 22:  # 昼间
-                exceed_amount = realtime_data.NoiseValue - point.NoiseThresholdDay
-            else:  # 夜间
-                exceed_amount = realtime_data.NoiseValue - point.NoiseThresholdNight
+    point = sensor_registry.get_point(realtime_data.PointID, session) or realtime_data.monitoring_point
+    alert = build_alert(realtime_data, point)
+    if alert:
+        session.add(alert)
+        session.flush()  # 刷新以获取AlertID
+    return alert
+
+
+def parse_reading(item):
+    """校验并解析一条批量上传的读数，返回 (字段字典, 错误信息)"""
+    if not isinstance(item, dict):
+        return None, '数据格式错误'
+    
+    sensor_id = item.get('sensor_id') or item.get('device_id')
+    if not sensor_id:
+        return None, '缺少设备ID（sensor_id或device_id）'
+    if item.get('noise_value') is None:
+        return None, '缺少参数: noise_value'
+    
+    try:
+        noise_value = float(item['noise_value'])
+    except (TypeError, ValueError):
+        return None, '噪音值格式错误'
+    if not 0 <= noise_value <= 200:
+        return None, '噪音值超出范围（0-200）'
+    
+    timestamp = item.get('timestamp')
+    if isinstance(timestamp, str):
+        try:
+            timestamp = to_local_naive(datetime.fromisoformat(timestamp.replace('Z', '+00:00')))
+        except ValueError:
+            return None, '时间格式错误'
+    elif timestamp is None:
+        timestamp = datetime.now()
+    else:
+        return None, '时间格式错误'
+    
+    data_quality = item.get('data_quality', '良好')
+    if data_quality not in ('优秀', '良好', '一般', '较差', '无效'):
+        return None, f'数据质量取值无效: {data_quality}'
+    
+    # 与 realtime_data 表的检查约束保持一致，避免单条数据导致整批写入失败
+    environment = {}
+    for field, (low, high) in (('temperature', (-50, 60)), ('humidity', (0, 100)), ('wind_speed', (0, 100))):
+        value = item.get(field)
+        if value is not None:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return None, f'{field} 格式错误'
+            if not low <= value <= high:
+                return None, f'{field} 超出范围（{low}-{high}）'
+        environment[field] = value
+    
+    spectrum = item.get('frequency_spectrum') or item.get('frequency_analysis')
+    spectrum = json.dumps(spectrum) if spectrum else None
+    if spectrum and len(spectrum) > 2000:
+        return None, '频率谱数据过长'
+    
+    return {
+        'NoiseValue': noise_value,
+        'Timestamp': timestamp,
+        'FrequencySpectrum': spectrum,
+        'DataQuality': data_quality,
+        'Temperature': environment['temperature'],
+        'Humidity': environment['humidity'],
+        'WindSpeed': environment['wind_speed'],
+        'WeatherCondition': item.get('weather_condition') or item.get('weather'),
+        'SensorID': str(sensor_id)
+    }, None
+
+
+def write_buffered_readings(batch):
+    """写入线程回调：在一个事务内批量写入一组读数及其告警"""
+    with get_db_session() as session:
+        records = [RealtimeData(**fields) for fields in batch]
+        session.add_all(records)
+        session.flush()
         
-        # 根据超标程度确定告警级别
-        if exceed_amount <= 5:
-            level = '低'
-        elif exceed_amount <= 10:
-            level = '中'
-        elif exceed_amount <= 15:
-            level = '高'
+        alerts = [build_alert(record, sensor_registry.get_point(record.PointID, session)) for record in records]
+        session.add_all([alert for alert in alerts if alert])
+
+
+ingest_buffer = IngestBuffer(
+    write_buffered_readings,
+    max_size=Config.INGEST_QUEUE_MAX_SIZE,
+    flush_rows=Config.INGEST_FLUSH_ROWS,
+    flush_interval_ms=Config.INGEST_FLUSH_INTERVAL_MS,
+    max_retries=Config.INGEST_MAX_RETRIES,
+    retry_backoff_ms=Config.INGEST_RETRY_BACKOFF_MS,
+    logger=app.logger
+)
+atexit.register(ingest_buffer.stop)  # 进程退出前写完队列中的数据
+
+
+def enqueue_reading(data, point_id):
+    """write-behind 模式：校验读数后放入写入队列，立即返回202"""
+    fields, error = parse_reading(data)
+    if error:
+        return jsonify({'status': 'error', 'message': error}), 400
+    
+    fields['PointID'] = point_id
+    if not ingest_buffer.submit(fields):
+        return jsonify({'status': 'error', 'message': '写入队列已满，请稍后重试'}), 503
+    
+    return jsonify({
+        'status': 'success',
+        'message': '数据已接收，等待写入',
+        'queued': True
+    }), 202
+
+
+# ==================== 小时汇总 ====================
+
+def rollup_bucket(sensor_id, point_id, timestamp):
+    """读数所属的小时汇总桶 (传感器, 监测点, 小时起点)"""
+    return sensor_id, point_id, timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def accumulate_hourly_rollups(session, readings, points=None):
+    """将一批读数累加到小时汇总表
+    
+    readings 为 (SensorID, PointID, Timestamp, NoiseValue) 序列。
+    先在内存中按 (传感器, 监测点, 小时) 合并，再每个桶执行一次 upsert。
+    points 为 {PointID: 监测点}，优先于 sensor_registry 用于超标判断（如本事务刚修改了阈值）。
+    """
+    points = points or {}
+    buckets = {}
+    for sensor_id, point_id, timestamp, noise_value in readings:
+        key = rollup_bucket(sensor_id, point_id, timestamp)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                'NoiseSum': 0.0, 'SampleCount': 0, 'NoiseMin': noise_value, 'NoiseMax': noise_value,
+                'EnergySum': 0.0, 'ExceedCount': 0
+            }
+        point = points.get(point_id) or sensor_registry.get_point(point_id, session) or session.get(MonitoringPoint, point_id)
+        bucket['NoiseSum'] += noise_value
+        bucket['SampleCount'] += 1
+        bucket['NoiseMin'] = min(bucket['NoiseMin'], noise_value)
+        bucket['NoiseMax'] = max(bucket['NoiseMax'], noise_value)
+        bucket['EnergySum'] += 10 ** (noise_value / 10)
+        bucket['ExceedCount'] += 1 if is_noise_exceeded(noise_value, timestamp, point) else 0
+    
+    if not buckets:
+        return
+    
+    rows = [
+        dict(bucket, SensorID=sensor_id, PointID=point_id, HourStart=hour_start)
+        for (sensor_id, point_id, hour_start), bucket in buckets.items()
+    ]
+    upsert_hourly_rollups(session.connection(), rows)
+
+
+def upsert_hourly_rollups(connection, rows):
+    """按数据库方言将汇总增量合并到 hourly_rollup
+    
+    upsert 语句不内联行数据，以 executemany 执行：语句只编译一次（可被缓存），
+    也不受单条语句绑定参数数量的限制。
+    """
+    table = HourlyRollup.__table__
+    dialect = connection.dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = sqlite.insert(table) if dialect == 'sqlite' else postgresql.insert(table)
+        excluded = stmt.excluded
+        least, greatest = (func.min, func.max) if dialect == 'sqlite' else (func.least, func.greatest)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.SensorID, table.c.PointID, table.c.HourStart],
+            set_={
+                'NoiseSum': table.c.NoiseSum + excluded.NoiseSum,
+                'SampleCount': table.c.SampleCount + excluded.SampleCount,
+                'NoiseMin': least(table.c.NoiseMin, excluded.NoiseMin),
+                'NoiseMax': greatest(table.c.NoiseMax, excluded.NoiseMax),
+                'EnergySum': table.c.EnergySum + excluded.EnergySum,
+                'ExceedCount': table.c.ExceedCount + excluded.ExceedCount
+            }
+        )
+        connection.execute(stmt, rows)
+    elif dialect == 'mysql':
+        stmt = mysql.insert(table)
+        inserted = stmt.inserted
+        stmt = stmt.on_duplicate_key_update(
+            NoiseSum=table.c.NoiseSum + inserted.NoiseSum,
+            SampleCount=table.c.SampleCount + inserted.SampleCount,
+            NoiseMin=func.least(table.c.NoiseMin, inserted.NoiseMin),
+            NoiseMax=func.greatest(table.c.NoiseMax, inserted.NoiseMax),
+            EnergySum=table.c.EnergySum + inserted.EnergySum,
+            ExceedCount=table.c.ExceedCount + inserted.ExceedCount
+        )
+        connection.execute(stmt, rows)
+    else:
+        # 其他数据库：先尝试更新，不存在时插入
+        for row in rows:
+            result = connection.execute(
+                update(table).where(
+                    table.c.SensorID == row['SensorID'],
+                    table.c.PointID == row['PointID'],
+                    table.c.HourStart == row['HourStart']
+                ).values(
+                    NoiseSum=table.c.NoiseSum + row['NoiseSum'],
+                    SampleCount=table.c.SampleCount + row['SampleCount'],
+                    NoiseMin=case((table.c.NoiseMin < row['NoiseMin'], table.c.NoiseMin), else_=row['NoiseMin']),
+                    NoiseMax=case((table.c.NoiseMax > row['NoiseMax'], table.c.NoiseMax), else_=row['NoiseMax']),
+                    EnergySum=table.c.EnergySum + row['EnergySum'],
+                    ExceedCount=table.c.ExceedCount + row['ExceedCount']
+                )
+            )
+            if result.rowcount == 0:
+                connection.execute(insert(table).values(**row))
+
+
+# 影响小时汇总的实时数据字段和监测点字段
+ROLLUP_READING_FIELDS = ('SensorID', 'PointID', 'Timestamp', 'NoiseValue')
+ROLLUP_POINT_FIELDS = ('NoiseThresholdDay', 'NoiseThresholdNight')
+
+
+def committed_value(obj, key):
+    """对象某个字段在本次 flush 前（数据库中）的值"""
+    history = inspect(obj).attrs[key].history
+    values = history.deleted or history.unchanged
+    return values[0] if values else getattr(obj, key)
+
+
+def is_field_changed(obj, keys):
+    """对象的指定字段在本次 flush 中是否有修改"""
+    state = inspect(obj)
+    return any(state.attrs[key].history.has_changes() for key in keys)
+
+
+@event.listens_for(OrmSession, 'before_flush')
+def collect_stale_rollups(session, flush_context, instances):
+    """删除或修改实时数据时，flush 前先删除受影响的小时汇总桶，flush 后按原始数据重新计算
+    
+    删除传感器或监测点时一并删除其小时汇总（外键约束要求先于传感器/监测点删除）。
+    """
+    stale = set()
+    for obj in session.deleted:
+        if isinstance(obj, RealtimeData):
+            stale.add(rollup_bucket(*(committed_value(obj, key) for key in ROLLUP_READING_FIELDS[:3])))
+        elif isinstance(obj, Sensor):
+            session.query(HourlyRollup).filter(HourlyRollup.SensorID == obj.SensorID).delete(synchronize_session=False)
+        elif isinstance(obj, MonitoringPoint):
+            session.query(HourlyRollup).filter(HourlyRollup.PointID == obj.PointID).delete(synchronize_session=False)
+    for obj in session.dirty:
+        if isinstance(obj, RealtimeData) and obj not in session.deleted and is_field_changed(obj, ROLLUP_READING_FIELDS):
+            stale.add(rollup_bucket(*(committed_value(obj, key) for key in ROLLUP_READING_FIELDS[:3])))
+            stale.add(rollup_bucket(obj.SensorID, obj.PointID, obj.Timestamp))
+    if not stale:
+        return
+    
+    buckets = list(stale)
+    for i in range(0, len(buckets), 500):
+        session.query(HourlyRollup).filter(
+            tuple_(HourlyRollup.SensorID, HourlyRollup.PointID, HourlyRollup.HourStart).in_(buckets[i:i + 500])
+        ).delete(synchronize_session=False)
+    session.info.setdefault('stale_rollups', set()).update(stale)
+
+
+def recompute_rollup_buckets(session, buckets, points=None):
+    """按 realtime_data 重新累加指定的小时汇总桶（桶内已有的汇总行须已删除）"""
+    buckets = list(buckets)
+    for i in range(0, len(buckets), 200):
+        rows = session.query(
+            RealtimeData.SensorID, RealtimeData.PointID, RealtimeData.Timestamp, RealtimeData.NoiseValue
+        ).filter(or_(*(
+            and_(
+                RealtimeData.SensorID == sensor_id, RealtimeData.PointID == point_id,
+                RealtimeData.Timestamp >= hour_start, RealtimeData.Timestamp < hour_start + timedelta(hours=1)
+            )
+            for sensor_id, point_id, hour_start in buckets[i:i + 200]
+        ))).all()
+        accumulate_hourly_rollups(session, [tuple(row) for row in rows], points)
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def maintain_hourly_rollups(session, flush_context):
+    """实时数据的写入、修改和删除在同一事务内同步到小时汇总表
+    
+    新写入的读数增量累加；修改或删除的读数所在的桶按原始数据重新计算；
+    监测点阈值修改后按新阈值重新计算该监测点全部小时汇总（超标次数与按当前阈值逐条统计一致）。
+    """
+    changed_points = {
+        obj.PointID: obj for obj in session.dirty
+        if isinstance(obj, MonitoringPoint) and obj not in session.deleted and is_field_changed(obj, ROLLUP_POINT_FIELDS)
+    }
+    stale = {bucket for bucket in session.info.pop('stale_rollups', ()) if bucket[1] not in changed_points}
+    readings = [
+        (obj.SensorID, obj.PointID, obj.Timestamp, obj.NoiseValue)
+        for obj in session.new if isinstance(obj, RealtimeData)
+        and obj.PointID not in changed_points and rollup_bucket(obj.SensorID, obj.PointID, obj.Timestamp) not in stale
+    ]
+    if not (changed_points or stale or readings):
+        return
+    with session.no_autoflush:
+        for point in changed_points.values():
+            rebuild_hourly_rollups(session, point=point)
+        if stale:
+            recompute_rollup_buckets(session, stale)
+        if readings:
+            accumulate_hourly_rollups(session, readings)
+
+
+def rebuild_hourly_rollups(session, start_time=None, end_time=None, point=None, chunk_size=10000):
+    """根据 realtime_data 重建指定时间范围（整小时）的汇总数据，用于历史数据迁移
+    
+    point 不为空时只重建该监测点，并按传入对象的阈值判断超标（用于阈值修改后重新计算）。
+    按 DataID 分块读取（每块先完整读入内存再写入汇总），不在同一连接上边读游标边写。
+    """
+    rollup_query = session.query(HourlyRollup)
+    data_query = session.query(
+        RealtimeData.DataID, RealtimeData.SensorID, RealtimeData.PointID, RealtimeData.Timestamp, RealtimeData.NoiseValue
+    )
+    points = None
+    if point is not None:
+        rollup_query = rollup_query.filter(HourlyRollup.PointID == point.PointID)
+        data_query = data_query.filter(RealtimeData.PointID == point.PointID)
+        points = {point.PointID: point}
+    if start_time:
+        start_time = start_time.replace(minute=0, second=0, microsecond=0)
+        rollup_query = rollup_query.filter(HourlyRollup.HourStart >= start_time)
+        data_query = data_query.filter(RealtimeData.Timestamp >= start_time)
+    if end_time:
+        end_time = end_time.replace(minute=0, second=0, microsecond=0)
+        rollup_query = rollup_query.filter(HourlyRollup.HourStart < end_time)
+        data_query = data_query.filter(RealtimeData.Timestamp < end_time)
+    
+    rollup_query.delete(synchronize_session=False)
+    
+    # 分块读取，避免一次性加载全部历史数据
+    total = 0
+    last_id = 0
+    while True:
+        chunk = data_query.filter(RealtimeData.DataID > last_id).order_by(RealtimeData.DataID).limit(chunk_size).all()
+        if not chunk:
+            return total
+        last_id = chunk[-1].DataID
+        accumulate_hourly_rollups(session, [(sensor_id, point_id, timestamp, noise_value) for _, sensor_id, point_id, timestamp, noise_value in chunk], points)
+        total += len(chunk)
+
+
+def aggregate_by_hour_of_day(session, start_time, point_id=None, sensor_id=None):
+    """按一天中的小时（0-23）聚合 start_time 之后的数据
+    
+    整小时部分读取 hourly_rollup，起始不足一小时的部分直接聚合 realtime_data，
+    结果与逐条统计原始数据一致。返回 {hour: (噪音值之和, 条数, 最小值, 最大值)}。
+    """
+    first_full_hour = start_time.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    
+    raw_hour = func.extract('hour', RealtimeData.Timestamp)
+    raw_query = session.query(
+        raw_hour.label('hour'),
+        func.sum(RealtimeData.NoiseValue).label('noise_sum'),
+        func.count(RealtimeData.DataID).label('count'),
+        func.min(RealtimeData.NoiseValue).label('min_noise'),
+        func.max(RealtimeData.NoiseValue).label('max_noise')
+    ).filter(
+        RealtimeData.Timestamp >= start_time,
+        RealtimeData.Timestamp < first_full_hour
+    )
+    
+    rollup_hour = func.extract('hour', HourlyRollup.HourStart)
+    rollup_query = session.query(
+        rollup_hour.label('hour'),
+        func.sum(HourlyRollup.NoiseSum).label('noise_sum'),
+        func.sum(HourlyRollup.SampleCount).label('count'),
+        func.min(HourlyRollup.NoiseMin).label('min_noise'),
+        func.max(HourlyRollup.NoiseMax).label('max_noise')
+    ).filter(HourlyRollup.HourStart >= first_full_hour)
+    
+    if point_id:
+        raw_query = raw_query.filter(RealtimeData.PointID == point_id)
+        rollup_query = rollup_query.filter(HourlyRollup.PointID == point_id)
+    if sensor_id:
+        raw_query = raw_query.filter(RealtimeData.SensorID == sensor_id)
+        rollup_query = rollup_query.filter(HourlyRollup.SensorID == sensor_id)
+    
+    hourly_stats = {}
+    for row in chain(raw_query.group_by(raw_hour).all(), rollup_query.group_by(rollup_hour).all()):
+        if not row.count:
+            continue
+        hour = int(row.hour)
+        if hour in hourly_stats:
+            noise_sum, count, min_noise, max_noise = hourly_stats[hour]
+            hourly_stats[hour] = (
+                noise_sum + row.noise_sum, count + row.count,
+                min(min_noise, row.min_noise), max(max_noise, row.max_noise)
+            )
         else:
-            level = '紧急'
-        
-        # 创建告警记录
-        alert = AlertInfo(
-            AlertLevel=level,
-            TriggerTime=realtime_data.Timestamp,
-            DataID=realtime_data.DataID,
-            AlertStatus='未处理',
-            AlertType='噪音超标'
+            hourly_stats[hour] = (row.noise_sum, row.count, row.min_noise, row.max_noise)
+    return hourly_stats
+
+
+def aggregate_by_point(session, start_time, end_time):
+    """按监测点聚合 [start_time, end_time] 内的数据
+    
+    整小时部分读取 hourly_rollup，首尾不足一小时的部分直接聚合 realtime_data，
+    查询量与时间跨度内的原始数据条数无关。返回 {PointID: [噪音值之和, 条数, 最小值, 最大值, 超标次数]}。
+    """
+    start_hour = start_time.replace(minute=0, second=0, microsecond=0)
+    first_full_hour = start_hour if start_hour == start_time else start_hour + timedelta(hours=1)
+    end_hour = end_time.replace(minute=0, second=0, microsecond=0)
+    
+    if first_full_hour <= end_hour:
+        raw_condition = (
+            ((RealtimeData.Timestamp >= start_time) & (RealtimeData.Timestamp < first_full_hour)) |
+            ((RealtimeData.Timestamp >= end_hour) & (RealtimeData.Timestamp <= end_time))
+        )
+        rollup_rows = session.query(
+            HourlyRollup.PointID,
+            func.sum(HourlyRollup.NoiseSum).label('noise_sum'),
+            func.sum(HourlyRollup.SampleCount).label('count'),
+            func.min(HourlyRollup.NoiseMin).label('min_noise'),
+            func.max(HourlyRollup.NoiseMax).label('max_noise'),
+            func.sum(HourlyRollup.ExceedCount).label('exceed_count')
+        ).filter(
+            HourlyRollup.HourStart >= first_full_hour,
+            HourlyRollup.HourStart < end_hour
+        ).group_by(HourlyRollup.PointID).all()
+    else:
+        # 时间范围不足一个整小时
+        raw_condition = (RealtimeData.Timestamp >= start_time) & (RealtimeData.Timestamp <= end_time)
+        rollup_rows = []
+    
+    raw_rows = session.query(
+        RealtimeData.PointID,
+        func.sum(RealtimeData.NoiseValue).label('noise_sum'),
+        func.count(RealtimeData.DataID).label('count'),
+        func.min(RealtimeData.NoiseValue).label('min_noise'),
+        func.max(RealtimeData.NoiseValue).label('max_noise'),
+        func.sum(case((RealtimeData.is_exceeded, 1), else_=0)).label('exceed_count')
+    ).filter(raw_condition).group_by(RealtimeData.PointID).all()
+    
+    point_stats = {}
+    for row in chain(rollup_rows, raw_rows):
+        if not row.count:
+            continue
+        stats = point_stats.get(row.PointID)
+        if stats is None:
+            point_stats[row.PointID] = [row.noise_sum, row.count, row.min_noise, row.max_noise, int(row.exceed_count or 0)]
+        else:
+            stats[0] += row.noise_sum
+            stats[1] += row.count
+            stats[2] = min(stats[2], row.min_noise)
+            stats[3] = max(stats[3], row.max_noise)
+            stats[4] += int(row.exceed_count or 0)
+    return point_stats
+
+
+def aggregate_by_clock_hour(query):
+    """把 RealtimeData 查询按自然小时分组聚合（超标次数由 RealtimeData.is_exceeded 在库内计算）
+    
+    返回按时间排序的列表 [(小时起点, 噪音值之和, 条数, 最小值, 最大值, 超标次数)]
+    """
+    day_expr = func.date(RealtimeData.Timestamp)
+    hour_expr = func.extract('hour', RealtimeData.Timestamp)
+    rows = query.with_entities(
+        day_expr.label('day'),
+        hour_expr.label('hour'),
+        func.sum(RealtimeData.NoiseValue).label('noise_sum'),
+        func.count(RealtimeData.DataID).label('count'),
+        func.min(RealtimeData.NoiseValue).label('min_noise'),
+        func.max(RealtimeData.NoiseValue).label('max_noise'),
+        func.sum(case((RealtimeData.is_exceeded, 1), else_=0)).label('exceed_count')
+    ).group_by(day_expr, hour_expr).all()
+    
+    return sorted(
+        (
+            datetime.strptime(str(row.day)[:10], '%Y-%m-%d') + timedelta(hours=int(row.hour)),
+            row.noise_sum, row.count, row.min_noise, row.max_noise, int(row.exceed_count or 0)
         )
+        for row in rows
+    )
+
+
+# ==================== 最新读数 ====================
+
+def upsert_rows(connection, table, key_columns, rows, newer_column=None):
+    """按数据库方言以 executemany 插入或覆盖 rows（各行字段相同）
+    
+    指定 newer_column 时，只有该列不早于现有值的行才覆盖，乱序到达的旧数据不会覆盖新数据。
+    """
+    if not rows:
+        return
+    value_columns = [column for column in rows[0] if column not in key_columns]
+    dialect = connection.dialect.name
+    
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = sqlite.insert(table) if dialect == 'sqlite' else postgresql.insert(table)
+        excluded = stmt.excluded
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c[column] for column in key_columns],
+            set_={column: excluded[column] for column in value_columns},
+            where=(table.c[newer_column] <= excluded[newer_column]) if newer_column else None
+        )
+        connection.execute(stmt, rows)
+    elif dialect == 'mysql':
+        stmt = mysql.insert(table)
+        inserted = stmt.inserted
+        if newer_column:
+            # MySQL 按书写顺序赋值，比较列最后更新，前面的条件判断读取的仍是旧值
+            newer = table.c[newer_column] <= inserted[newer_column]
+            stmt = stmt.on_duplicate_key_update([
+                (column, case((newer, inserted[column]), else_=table.c[column]))
+                for column in value_columns if column != newer_column
+            ] + [(newer_column, case((newer, inserted[newer_column]), else_=table.c[newer_column]))])
+        else:
+            stmt = stmt.on_duplicate_key_update({column: inserted[column] for column in value_columns})
+        connection.execute(stmt, rows)
+    else:
+        # 其他数据库：先尝试更新，不存在时插入
+        for row in rows:
+            key_condition = [table.c[column] == row[column] for column in key_columns]
+            condition = key_condition + ([table.c[newer_column] <= row[newer_column]] if newer_column else [])
+            result = connection.execute(
+                update(table).where(*condition).values({column: row[column] for column in value_columns})
+            )
+            if result.rowcount == 0 and connection.execute(select(*table.primary_key.columns).where(*key_condition)).first() is None:
+                connection.execute(insert(table).values(**row))
+
+
+def update_latest_readings(connection, readings, window=None):
+    """将一批读数合并到 sensor_latest 和 point_latest
+    
+    readings 为 (SensorID, PointID, Timestamp, NoiseValue, 是否超标) 序列。
+    每个传感器只保留采集时间最新的一条；每个监测点的最近 window 条读数与已有窗口按时间合并后截断，
+    并重新计算平均值。语句数与本批读数条数无关。
+    """
+    window = window or Config.POINT_RECENT_WINDOW
+    latest = {}
+    by_point = {}
+    for sensor_id, point_id, timestamp, noise_value, exceeded in readings:
+        timestamp = to_local_naive(timestamp)  # 统一为不带时区的本地时间，避免与已有窗口比较时报错
+        current = latest.get(sensor_id)
+        if current is None or timestamp >= current['Timestamp']:
+            latest[sensor_id] = {
+                'SensorID': sensor_id, 'PointID': point_id, 'NoiseValue': noise_value,
+                'Timestamp': timestamp, 'IsExceeded': 1 if exceeded else 0
+            }
+        by_point.setdefault(point_id, []).append((timestamp, noise_value))
+    if not latest:
+        return
+    upsert_rows(connection, SensorLatest.__table__, ['SensorID'], list(latest.values()), newer_column='Timestamp')
+    
+    # 读取已有窗口（按块查询，避免 IN 列表超出绑定参数数量限制）并加行锁，与其他事务的合并串行化
+    table = PointLatest.__table__
+    point_ids = list(by_point)
+    existing = {}
+    for i in range(0, len(point_ids), 500):
+        for point_id, recent_values in connection.execute(
+            select(table.c.PointID, table.c.RecentValues).where(table.c.PointID.in_(point_ids[i:i + 500])).with_for_update()
+        ):
+            existing[point_id] = [
+                (to_local_naive(datetime.fromisoformat(timestamp)), value) for timestamp, value in json.loads(recent_values)
+            ]
+    
+    rows = []
+    for point_id, values in by_point.items():
+        recent = sorted(existing.get(point_id, []) + values, key=lambda item: item[0])[-window:]
+        rows.append({
+            'PointID': point_id,
+            'RecentValues': json.dumps([[timestamp.isoformat(), value] for timestamp, value in recent]),
+            'AvgNoise': sum(value for _, value in recent) / len(recent),
+            'UpdatedAt': recent[-1][0]
+        })
+    upsert_rows(connection, table, ['PointID'], rows)
+
+
+def exceed_flags(session, readings):
+    """为 (SensorID, PointID, Timestamp, NoiseValue) 读数附加是否超标（阈值读取 sensor_registry）"""
+    flagged = []
+    for sensor_id, point_id, timestamp, noise_value in readings:
+        point = sensor_registry.get_point(point_id, session) or session.get(MonitoringPoint, point_id)
+        flagged.append((sensor_id, point_id, timestamp, noise_value, is_noise_exceeded(noise_value, timestamp, point)))
+    return flagged
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def maintain_latest_readings(session, flush_context):
+    """新写入的实时数据在同一事务内更新最新读数"""
+    readings = [
+        (obj.SensorID, obj.PointID, obj.Timestamp, obj.NoiseValue)
+        for obj in session.new if isinstance(obj, RealtimeData)
+    ]
+    if readings:
+        with session.no_autoflush:
+            update_latest_readings(session.connection(), exceed_flags(session, readings))
+
+
+def rebuild_latest_readings(session):
+    """根据 realtime_data 重建最新读数（各传感器最近一条、各监测点最近 N 条），用于历史数据迁移"""
+    session.query(SensorLatest).delete(synchronize_session=False)
+    session.query(PointLatest).delete(synchronize_session=False)
+    
+    columns = (RealtimeData.DataID, RealtimeData.SensorID, RealtimeData.PointID, RealtimeData.Timestamp, RealtimeData.NoiseValue)
+    readings = {}
+    for partition_by, limit in ((RealtimeData.PointID, Config.POINT_RECENT_WINDOW), (RealtimeData.SensorID, 1)):
+        ranked = select(
+            *columns,
+            func.row_number().over(
+                partition_by=partition_by,
+                order_by=(RealtimeData.Timestamp.desc(), RealtimeData.DataID.desc())
+            ).label('row_number')
+        ).subquery()
+        for data_id, *reading in session.execute(
+            select(*(ranked.c[column.key] for column in columns)).where(ranked.c.row_number <= limit)
+        ):
+            readings[data_id] = tuple(reading)
+    
+    update_latest_readings(session.connection(), exceed_flags(session, readings.values()))
+    return len(readings)
+
+
+# ==================== 数据库迁移 ====================
+
+# 一次性数据迁移：(名称, 执行函数)，执行函数返回处理的数据条数
+DATA_MIGRATIONS = (
+    ('hourly_rollup', rebuild_hourly_rollups),
+    ('latest_readings', rebuild_latest_readings)
+)
+migration_state = {'done': False}
+migration_lock = threading.Lock()
+
+
+def migrate_database():
+    """创建缺少的表和索引，并执行尚未执行过的数据迁移，返回本次执行的迁移名称列表
+    
+    可重复执行：已登记在 schema_migration 中的迁移直接跳过。迁移开始前先登记名称，
+    多个进程同时启动时只有登记成功的进程执行，登记和迁移结果在同一事务中提交，失败时一并回滚。
+    """
+    with get_db_session() as session:
+        bind = session.get_bind()
+    Base.metadata.create_all(bind)
+    migrate_realtime_indexes(bind)
+    
+    applied = []
+    for name, migration in DATA_MIGRATIONS:
+        try:
+            with get_db_session() as session:
+                if session.get(SchemaMigration, name):
+                    continue
+                session.add(SchemaMigration(Name=name))
+                session.flush()
+                count = migration(session)
+        except IntegrityError:
+            continue  # 其他进程已登记
+        app.logger.info(f'数据迁移 {name} 完成，处理 {count} 条数据')
+        applied.append(name)
+    return applied
+
+
+@app.before_request
+def run_startup_migration():
+    """每个进程处理第一个请求前执行数据库迁移（gunicorn 等 WSGI 部署不经过 __main__）"""
+    if not Config.AUTO_MIGRATE or migration_state['done']:
+        return
+    with migration_lock:
+        if migration_state['done']:
+            return
+        try:
+            migrate_database()
+        except Exception as e:
+            app.logger.error(f'数据库迁移失败: {e}')
+        migration_state['done'] = True
+
+
+@app.cli.command('migrate-db')
+def migrate_database_command():
+    """执行数据库迁移：flask --app app migrate-db"""
+    applied = migrate_database()
+    print(f'已执行数据迁移: {", ".join(applied)}' if applied else '没有需要执行的数据迁移')
+
+
+# ==================== 列表总数 ====================
+
+# 不影响列表总数的分页参数，不参与总数缓存键
+PAGINATION_ARGS = frozenset(['page', 'per_page', 'cursor', 'limit', 'exact', 'include_total'])
+
+
+def count_cache_key():
+    """按当前请求的接口和过滤条件生成总数缓存键（各页共用）"""
+    filters = sorted((key, value) for key, value in request.args.items(multi=True) if key not in PAGINATION_ARGS)
+    return 'count:' + hashlib.md5(f'{request.path}?{filters}'.encode()).hexdigest()
+
+
+def list_total(query, exact=False, estimate=None):
+    """列表接口的总数，返回 (总数, 是否为近似值)
+    
+    exact=True 时执行精确 COUNT；否则结果按接口和过滤条件缓存 COUNT_CACHE_TTL 秒，
+    未命中缓存时优先用 estimate 估算（如小时汇总），没有估算方式时执行一次精确 COUNT。
+    命中缓存或来自估算的结果都标记为近似值。
+    """
+    if exact:
+        return query.count(), False
+    
+    key = count_cache_key()
+    total = cache.get(key)
+    if total is not None:
+        return total, True
+    if estimate is not None:
+        total, approximate = estimate(), True
+    else:
+        total, approximate = query.count(), False
+    cache.set(key, total, timeout=Config.COUNT_CACHE_TTL)
+    return total, approximate
+
+
+def rollup_count(session, start_time=None, end_time=None, point_id=None, sensor_id=None, district=None):
+    """用小时汇总表估算 realtime_data 条数
+    
+    累加时间范围覆盖到的各小时的 SampleCount，首尾不完整的小时按覆盖时长折算（假定小时内采样均匀）；
+    当前小时只有已经过去的部分有数据，按已过去的时长折算。
+    """
+    start_time, end_time = to_local_naive(start_time), to_local_naive(end_time)  # HourStart 为不带时区的本地时间
+    query = session.query(HourlyRollup)
+    if district:
+        query = query.join(MonitoringPoint, MonitoringPoint.PointID == HourlyRollup.PointID).filter(MonitoringPoint.District == district)
+    elif point_id:
+        query = query.filter(HourlyRollup.PointID == point_id)
+    if sensor_id:
+        query = query.filter(HourlyRollup.SensorID == sensor_id)
+    
+    # 首尾小时单独分组，其余整小时合并为一组
+    edge_hours = []
+    if start_time:
+        edge_hours.append(start_time.replace(minute=0, second=0, microsecond=0))
+        query = query.filter(HourlyRollup.HourStart >= edge_hours[-1])
+    if end_time:
+        edge_hours.append(end_time.replace(minute=0, second=0, microsecond=0))
+        query = query.filter(HourlyRollup.HourStart <= edge_hours[-1])
+    if edge_hours:
+        bucket = case((HourlyRollup.HourStart.in_(edge_hours), HourlyRollup.HourStart), else_=None)
+        rows = query.with_entities(bucket, func.sum(HourlyRollup.SampleCount)).group_by(bucket).all()
+    else:
+        rows = [(None, query.with_entities(func.sum(HourlyRollup.SampleCount)).scalar())]
+    
+    total = 0.0
+    now = datetime.now()
+    for hour_start, count in rows:
+        if not count:
+            continue
+        if hour_start is None:
+            total += count
+            continue
+        sampled_end = min(hour_start + timedelta(hours=1), now)
+        covered_start = max(hour_start, start_time) if start_time else hour_start
+        covered_end = min(sampled_end, end_time) if end_time else sampled_end
+        sampled_seconds = (sampled_end - hour_start).total_seconds()
+        if sampled_seconds > 0:
+            total += count * max((covered_end - covered_start).total_seconds(), 0) / sampled_seconds
+        else:
+            total += count
+    return int(round(total))
+
+
+# ==================== 实时推送 ====================
+
+# 推送给实时数据流的读数快照（提交后才推送，不持有 ORM 对象）
+StreamReading = namedtuple('StreamReading', [
+    'DataID', 'SensorID', 'PointID', 'NoiseValue', 'Timestamp', 'DataQuality'
+])
+StreamAlert = namedtuple('StreamAlert', [
+    'AlertID', 'AlertLevel', 'AlertType', 'AlertStatus', 'TriggerTime'
+])
+
+stream_broadcaster = StreamBroadcaster(
+    queue_size=Config.STREAM_QUEUE_SIZE,
+    replay_seconds=Config.STREAM_REPLAY_SECONDS,
+    replay_max_frames=Config.STREAM_REPLAY_MAX_FRAMES
+)
+
+
+# 推送用的传感器短整数索引，进程内保持不变（紧凑格式用它代替传感器ID和静态信息）
+stream_sensor_indexes = {}
+stream_sensor_index_lock = threading.Lock()
+
+
+def get_stream_sensor_index(sensor_id):
+    index = stream_sensor_indexes.get(sensor_id)
+    if index is None:
+        with stream_sensor_index_lock:
+            index = stream_sensor_indexes.setdefault(sensor_id, len(stream_sensor_indexes))
+    return index
+
+
+def stream_sensor_meta(index, sensor_id, sensor, point):
+    """紧凑格式的传感器元数据片段，字段顺序见 META_FIELDS"""
+    return json.dumps([
+        index,
+        sensor_id,
+        sensor.SensorName if sensor else None,
+        point.PointID if point else None,
+        point.PointName if point else None,
+        point.PointCode if point else None,
+        point.District if point else None
+    ], ensure_ascii=False)
+
+
+def stream_snapshot(filters):
+    """紧凑格式连接时发送的传感器元数据快照（读取 sensor_registry，缓存有效时不访问数据库）"""
+    snapshot = []
+    for sensor in sensor_registry.sensors():
+        point = sensor.point
+        if not matches_filters(filters, sensor.SensorID, sensor.PointID, point.District if point else None):
+            continue
+        index = get_stream_sensor_index(sensor.SensorID)
+        snapshot.append((index, stream_sensor_meta(index, sensor.SensorID, sensor, point)))
+    return snapshot
+
+
+def publish_readings(readings, alerts=None):
+    """把一批已提交的读数推送给实时数据流的订阅方
+    
+    readings 为 StreamReading 列表，alerts 为 {DataID: StreamAlert}。传感器和监测点信息读取
+    sensor_registry，不经过 ORM flush 的批量写入路径也可以直接调用。每条读数只序列化一次
+    （完整格式和紧凑格式各一个片段），各订阅方按过滤条件拼接片段。
+    """
+    alerts = alerts or {}
+    items = []
+    for reading in readings:
+        sensor = sensor_registry.get(reading.SensorID)
+        point = sensor_registry.get_point(reading.PointID)
+        alert = alerts.get(reading.DataID)
+        is_exceeded = is_noise_exceeded(reading.NoiseValue, reading.Timestamp, point)
+        alert_dict = None
+        if alert:
+            alert_dict = {
+                'alert_id': alert.AlertID,
+                'alert_level': alert.AlertLevel,
+                'alert_type': alert.AlertType,
+                'trigger_time': alert.TriggerTime.isoformat() if alert.TriggerTime else None,
+                'alert_status': alert.AlertStatus,
+                'noise_value': reading.NoiseValue,
+                'point_id': reading.PointID,
+                'point_name': point.PointName if point else None,
+                'point_code': point.PointCode if point else None,
+                'sensor_id': reading.SensorID,
+                'sensor_name': sensor.SensorName if sensor else None,
+                'region_name': point.District if point else None,
+                'device_id': reading.SensorID
+            }
+        full = json.dumps({
+            'sensor_id': reading.SensorID,
+            'device_id': reading.SensorID,  # 兼容前端
+            'sensor_name': sensor.SensorName if sensor else None,
+            'point_id': reading.PointID,
+            'point_name': point.PointName if point else None,
+            'point_code': point.PointCode if point else None,
+            'noise_value': reading.NoiseValue,
+            'timestamp': reading.Timestamp.isoformat(),
+            'data_quality': reading.DataQuality,
+            'is_exceeded': is_exceeded,
+            'alert': alert_dict
+        }, ensure_ascii=False)
         
-        session.add(alert)
-        session.flush()  # 刷新以获取AlertID
+        # 紧凑格式：字段顺序见 COMPACT_FIELDS（各字段单独序列化，订阅方只发送变化的字段），时间戳为秒级 Unix 时间
+        index = get_stream_sensor_index(reading.SensorID)
+        compact = tuple(json.dumps(value, ensure_ascii=False) for value in (
+            reading.NoiseValue,
+            int(reading.Timestamp.timestamp()),
+            1 if is_exceeded else 0,
+            reading.DataQuality,
+            alert.AlertLevel if alert else None
+        ))
         
-        return alert
-    return None
+        items.append(StreamItem(
+            reading.SensorID, reading.PointID, point.District if point else None,
+            index, full, compact, stream_sensor_meta(index, reading.SensorID, sensor, point)
+        ))
+    
+    return stream_broadcaster.publish(items, datetime.now().isoformat())
+
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_stream_readings(session, flush_context):
+    """记录本事务新写入的实时数据和告警，没有订阅方（也没有可能重连的订阅方）时不做任何处理"""
+    if not stream_broadcaster.has_audience:
+        return
+    for obj in session.new:
+        if isinstance(obj, RealtimeData):
+            mark_local_stream_readings([obj.DataID])
+            session.info.setdefault('stream_readings', []).append(StreamReading(
+                obj.DataID, obj.SensorID, obj.PointID, obj.NoiseValue, obj.Timestamp, obj.DataQuality
+            ))
+        elif isinstance(obj, AlertInfo):
+            session.info.setdefault('stream_alerts', {})[obj.DataID] = StreamAlert(
+                obj.AlertID, obj.AlertLevel, obj.AlertType, obj.AlertStatus, obj.TriggerTime
+            )
+
+
+@event.listens_for(OrmSession, 'after_commit')
+def publish_stream_readings(session):
+    """事务提交后推送本事务写入的数据（每次提交序列化一次）"""
+    readings = session.info.pop('stream_readings', None)
+    alerts = session.info.pop('stream_alerts', None)
+    if not readings:
+        return
+    try:
+        publish_readings(readings, alerts)
+    except Exception as e:
+        app.logger.error(f'实时数据推送失败: {str(e)}')
+
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_stream_readings(session):
+    session.info.pop('stream_readings', None)
+    session.info.pop('stream_alerts', None)
+
+
+# 跨进程推送：多进程部署时读数可能由其他进程写入（采集任务只在租约持有者运行，上传请求分散到各 worker），
+# 有订阅方的进程定期按 DataID 读取其他进程新写入的数据并在本进程推送。
+# last_id 为已处理的最大 DataID；gaps 为小于 last_id 但尚未读到的 DataID（其他事务可能晚提交）及其发现时间；
+# local_ids 为本进程已直接推送、不需要转发的 DataID。
+stream_relay_state = {'last_id': None, 'gaps': {}, 'local_ids': set()}
+stream_relay_lock = threading.Lock()
+
+
+def mark_local_stream_readings(data_ids):
+    """登记本进程将直接推送的 DataID（在提交前登记，转发任务读到这些数据时跳过）"""
+    with stream_relay_lock:
+        stream_relay_state['local_ids'].update(data_ids)
+
+
+def relay_stream_readings(session=None):
+    """转发其他进程新写入的实时数据，返回转发条数；没有订阅方时不查询数据库"""
+    if not stream_broadcaster.has_audience:
+        with stream_relay_lock:
+            stream_relay_state.update(last_id=None, gaps={}, local_ids=set())
+        return 0
+    if session is None:
+        with get_db_session() as relay_session:
+            return relay_stream_readings(relay_session)
+    
+    last_id = stream_relay_state['last_id']
+    if last_id is None:
+        # 开始转发：从当前最大 DataID 之后开始，更早的数据由 Last-Event-ID 补发或客户端重新加载
+        stream_relay_state['last_id'] = session.query(func.max(RealtimeData.DataID)).scalar() or 0
+        return 0
+    
+    now = monotonic()
+    gaps = {data_id: found_at for data_id, found_at in stream_relay_state['gaps'].items()
+            if now - found_at <= Config.STREAM_RELAY_GAP_SECONDS}
+    condition = RealtimeData.DataID > last_id
+    if gaps:
+        condition = condition | RealtimeData.DataID.in_(list(gaps))
+    rows = session.query(
+        RealtimeData.DataID, RealtimeData.SensorID, RealtimeData.PointID,
+        RealtimeData.NoiseValue, RealtimeData.Timestamp, RealtimeData.DataQuality
+    ).filter(condition).order_by(RealtimeData.DataID).limit(Config.STREAM_RELAY_BATCH_SIZE).all()
+    
+    # DataID 不连续的部分可能是尚未提交的事务，记为缺口，在 STREAM_RELAY_GAP_SECONDS 内继续查询
+    seen = {row.DataID for row in rows}
+    new_last_id = max((data_id for data_id in seen if data_id > last_id), default=last_id)
+    for data_id in range(last_id + 1, min(new_last_id, last_id + 1 + Config.STREAM_RELAY_BATCH_SIZE)):
+        if data_id not in seen:
+            gaps[data_id] = now
+    for data_id in seen:
+        gaps.pop(data_id, None)
+    
+    with stream_relay_lock:
+        local_ids = stream_relay_state['local_ids']
+        readings = [StreamReading(*row) for row in rows if row.DataID not in local_ids]
+        stream_relay_state['local_ids'] = {data_id for data_id in local_ids if data_id > new_last_id or data_id in gaps}
+        stream_relay_state.update(last_id=new_last_id, gaps=gaps)
+    if not readings:
+        return 0
+    
+    alerts = {
+        alert.DataID: StreamAlert(alert.AlertID, alert.AlertLevel, alert.AlertType, alert.AlertStatus, alert.TriggerTime)
+        for alert in session.query(
+            AlertInfo.DataID, AlertInfo.AlertID, AlertInfo.AlertLevel, AlertInfo.AlertType,
+            AlertInfo.AlertStatus, AlertInfo.TriggerTime
+        ).filter(AlertInfo.DataID.in_([reading.DataID for reading in readings]))
+    }
+    publish_readings(readings, alerts)
+    return len(readings)
+
+
+stream_relay_task = PeriodicTask(
+    'stream_relay', relay_stream_readings, Config.STREAM_RELAY_INTERVAL_SECONDS, logger=app.logger
+)
+
+
+# ==================== 报告任务 ====================
+
+REPORT_JOB_ACTIVE_STATUSES = ('排队中', '进行中')
+
+
+def resolve_report_period(data):
+    """解析报告周期：优先使用 start_date/end_date，其次 report_period 字符串，否则按报告类型取本日/本周/本月/本年"""
+    start_date = None
+    end_date = None
+    if data.get('start_date') and data.get('end_date'):
+        start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
+        end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
+        # 结束日期设置为当天的23:59:59
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    elif data.get('report_period'):
+        # 从字符串解析日期范围（支持"至"和"到"）
+        period = data['report_period']
+        if '至' in period or '到' in period:
+            separator = '至' if '至' in period else '到'
+            parts = period.split(separator)
+            if len(parts) == 2:
+                try:
+                    start_date = datetime.strptime(parts[0].strip(), '%Y-%m-%d')
+                    end_date = datetime.strptime(parts[1].strip(), '%Y-%m-%d')
+                    end_date = end_date.replace(hour=23, minute=59, second=59)
+                except ValueError:
+                    # 如果解析失败，使用默认值
+                    pass
+    
+    # 如果没有提供日期，根据报告类型自动计算
+    if not start_date or not end_date:
+        today = datetime.now()
+        report_type = data['report_type']
+        if report_type == '日报':
+            start_date = today.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_date = today.replace(hour=23, minute=59, second=59, microsecond=999999)
+        elif report_type == '周报':
+            # 本周一
+            day_of_week = today.weekday()  # 0=Monday, 6=Sunday
+            start_date = today - timedelta(days=day_of_week)
+            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_date = start_date + timedelta(days=6)
+            end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        elif report_type == '月报':
+            # 本月第一天
+            start_date = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            # 本月最后一天
+            if today.month == 12:
+                end_date = today.replace(year=today.year + 1, month=1, day=1)
+            else:
+                end_date = today.replace(month=today.month + 1, day=1)
+            end_date = end_date - timedelta(days=1)
+            end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        elif report_type == '年报':
+            # 今年第一天
+            start_date = today.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+            # 今年最后一天
+            end_date = today.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
+        else:  # 专项报告，默认最近30天
+            end_date = today.replace(hour=23, minute=59, second=59, microsecond=999999)
+            start_date = end_date - timedelta(days=30)
+            start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    
+    return start_date, end_date
+
+
+def build_report_content(session, report_type, start_date, end_date, on_progress=None):
+    """统计报告周期内的数据并生成报告内容，返回 (报告周期字符串, 报告内容)
+    
+    on_progress: 可选的进度回调，参数为完成百分比
+    """
+    report_period = f"{start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}"
+    
+    # 查询该周期内的数据统计（按监测点分组聚合，整小时部分读取小时汇总）
+    point_stats = aggregate_by_point(session, start_date, end_date)
+    if on_progress:
+        on_progress(60)
+    
+    total_count = sum(stats[1] for stats in point_stats.values())
+    avg_noise = sum(stats[0] for stats in point_stats.values()) / total_count if total_count > 0 else 0
+    max_noise = max((stats[3] for stats in point_stats.values()), default=0)
+    min_noise = min((stats[2] for stats in point_stats.values()), default=0)
+    
+    # 超标统计
+    exceed_count = sum(stats[4] for stats in point_stats.values())
+    exceed_rate = (exceed_count / total_count * 100) if total_count > 0 else 0
+    
+    # 按区域统计
+    region_statistics = []
+    for point_id, (noise_sum, count, _, _, _) in sorted(point_stats.items()):
+        point = sensor_registry.get_point(point_id, session)
+        if not point:
+            continue
+        region_statistics.append({
+            'region_id': point_id,
+            'region_name': point.PointName,
+            'region_type': point.PointType,
+            'avg_noise': round(noise_sum / count, 2),
+            'data_count': count
+        })
+    
+    if on_progress:
+        on_progress(80)
+    
+    # 告警统计（一次按级别分组）
+    alert_by_level = {level: 0 for level in ['低', '中', '高', '紧急']}
+    level_counts = session.query(
+        AlertInfo.AlertLevel,
+        func.count(AlertInfo.AlertID)
+    ).filter(
+        AlertInfo.TriggerTime >= start_date,
+        AlertInfo.TriggerTime <= end_date
+    ).group_by(AlertInfo.AlertLevel).all()
+    for level, count in level_counts:
+        if level in alert_by_level:
+            alert_by_level[level] = count
+    alert_count = sum(count for _, count in level_counts)
+    
+    # 生成报告内容
+    report_content = {
+        'summary': f'{report_type}摘要',
+        'period': report_period,
+        'statistics': {
+            'total_data_count': total_count,
+            'avg_noise': round(avg_noise, 2),
+            'max_noise': round(max_noise, 2),
+            'min_noise': round(min_noise, 2),
+            'exceed_count': exceed_count,
+            'exceed_rate': round(exceed_rate, 2),
+            'alert_count': alert_count,
+            'alert_by_level': alert_by_level
+        },
+        'region_statistics': region_statistics,
+        'recommendations': []
+    }
+    
+    # 生成建议
+    if exceed_rate > 20:
+        report_content['recommendations'].append('超标率较高，建议加强监测和治理')
+    if alert_by_level.get('紧急', 0) > 0:
+        report_content['recommendations'].append('存在紧急告警，需要立即处理')
+    if avg_noise > 65:
+        report_content['recommendations'].append('平均噪音值偏高，建议采取降噪措施')
+    
+    return report_period, report_content
+
+
+def report_job_key(report_type, start_date, end_date):
+    """报告任务的去重键：相同类型和周期的进行中任务共用一次计算"""
+    return f"{report_type}|{start_date.isoformat()}|{end_date.isoformat()}"
+
+
+def submit_report_job(session, report_type, start_date, end_date, generated_by, is_public=0):
+    """创建报告任务，返回 (任务, 是否新建)
+    
+    已有相同类型和周期的进行中任务时直接返回该任务；排队任务数达到上限时返回 (None, False)。
+    去重依赖 ActiveKey 的唯一约束，多进程同时提交也只会创建一个任务。
+    """
+    active_key = report_job_key(report_type, start_date, end_date)
+    existing = session.query(ReportJob).filter(ReportJob.ActiveKey == active_key).first()
+    if existing:
+        return existing, False
+    
+    pending_count = session.query(func.count(ReportJob.JobID)).filter(
+        ReportJob.ActiveKey.isnot(None)
+    ).scalar()
+    if pending_count >= Config.REPORT_JOB_MAX_PENDING:
+        return None, False
+    
+    job = ReportJob(
+        ReportType=report_type,
+        StartDate=start_date,
+        EndDate=end_date,
+        GeneratedBy=generated_by,
+        IsPublic=is_public,
+        ActiveKey=active_key
+    )
+    session.add(job)
+    try:
+        session.flush()
+    except IntegrityError:
+        # 其他请求刚刚提交了相同任务
+        session.rollback()
+        return session.query(ReportJob).filter(ReportJob.ActiveKey == active_key).one(), False
+    return job, True
+
+
+def claimed_report_job(session, job_id, claim_token):
+    """本执行者仍持有的任务查询（任务被重新排队或由其他执行者认领后为空）"""
+    return session.query(ReportJob).filter(
+        ReportJob.JobID == job_id,
+        ReportJob.JobStatus == '进行中',
+        ReportJob.ClaimToken == claim_token
+    )
+
+
+def update_report_job(job_id, claim_token, **values):
+    """在独立事务中更新本执行者持有的任务，供工作线程汇报进度和结果，返回是否仍持有任务"""
+    with get_db_session() as session:
+        return bool(claimed_report_job(session, job_id, claim_token).update(values, synchronize_session=False))
+
+
+def run_report_job(job_id):
+    """工作线程入口：认领任务并生成报告
+    
+    认领时生成新的令牌，之后的进度和结果只在令牌仍有效时写入：任务超时被重新排队并由其他执行者认领后，
+    原执行者的结果直接丢弃，不会生成重复的报告。
+    """
+    # 认领：只有把状态从“排队中”改为“进行中”的工作线程会执行计算
+    claim_token = uuid.uuid4().hex
+    now = datetime.now()
+    with get_db_session() as session:
+        claimed = session.query(ReportJob).filter(
+            ReportJob.JobID == job_id,
+            ReportJob.JobStatus == '排队中'
+        ).update({
+            'JobStatus': '进行中',
+            'Progress': 0,
+            'ClaimToken': claim_token,
+            'StartedAt': now,
+            'HeartbeatAt': now
+        }, synchronize_session=False)
+    if not claimed:
+        return
+    
+    try:
+        with get_db_session() as session:
+            job = session.get(ReportJob, job_id)
+            report_period, report_content = build_report_content(
+                session, job.ReportType, job.StartDate, job.EndDate,
+                on_progress=lambda progress: update_report_job(job_id, claim_token, Progress=progress, HeartbeatAt=datetime.now())
+            )
+            
+            report = Report(
+                ReportType=job.ReportType,
+                ReportPeriod=report_period,
+                GeneratedBy=job.GeneratedBy,
+                Content=json.dumps(report_content, ensure_ascii=False),
+                IsPublic=job.IsPublic
+            )
+            session.add(report)
+            session.flush()
+            
+            # 条件更新：任务已不属于本执行者时回滚，丢弃刚生成的报告
+            finished = claimed_report_job(session, job_id, claim_token).update({
+                'ReportID': report.ReportID,
+                'JobStatus': '已完成',
+                'Progress': 100,
+                'ActiveKey': None,
+                'ClaimToken': None,
+                'FinishedAt': datetime.now()
+            }, synchronize_session=False)
+            if not finished:
+                session.rollback()
+                app.logger.warning(f'报告任务 {job_id} 已被重新排队，丢弃本次生成的报告')
+    except Exception as e:
+        app.logger.error(f'报告任务 {job_id} 执行失败: {str(e)}', exc_info=True)
+        update_report_job(
+            job_id,
+            claim_token,
+            JobStatus='失败',
+            ErrorMessage=str(e)[:500],
+            ActiveKey=None,
+            ClaimToken=None,
+            FinishedAt=datetime.now()
+        )
+
+
+def dispatch_report_job(job_id):
+    """把任务交给本进程的工作线程，本进程中已在排队或执行的任务不重复提交，返回是否提交"""
+    with report_futures_lock:
+        future = report_futures.get(job_id)
+        if future is not None and not future.done():
+            return False
+        report_futures[job_id] = report_executor.submit(run_report_job, job_id)
+        for finished in [key for key, value in report_futures.items() if value is None or value.done()]:
+            del report_futures[finished]
+        return True
+
+
+def recover_report_jobs():
+    """恢复任务：超时没有汇报进度的任务重新排队，并把排队中的任务交给本进程的工作线程
+    
+    启动时执行一次，之后由 report_recovery_task 定期执行：worker 进程退出后遗留的任务由其他进程接管。
+    多个进程同时恢复同一任务时，由 run_report_job 的认领保证只执行一次；重新排队使原执行者的令牌失效。
+    """
+    stale_before = datetime.now() - timedelta(seconds=Config.REPORT_JOB_TIMEOUT)
+    with get_db_session() as session:
+        session.query(ReportJob).filter(
+            ReportJob.JobStatus == '进行中',
+            func.coalesce(ReportJob.HeartbeatAt, ReportJob.StartedAt) < stale_before
+        ).update({'JobStatus': '排队中', 'Progress': 0, 'ClaimToken': None}, synchronize_session=False)
+        session.flush()
+        job_ids = [job_id for job_id, in session.query(ReportJob.JobID).filter(
+            ReportJob.JobStatus == '排队中'
+        ).order_by(ReportJob.JobID)]
+    return sum(1 for job_id in job_ids if dispatch_report_job(job_id))
+
+
+# 报告工作线程池：任务保存在 report_job 表中，无需外部消息队列
+report_executor = ThreadPoolExecutor(max_workers=Config.REPORT_WORKERS, thread_name_prefix='report-worker')
+atexit.register(report_executor.shutdown, wait=False, cancel_futures=True)  # 未开始的任务留在表中，由其他进程或下次启动时恢复
+report_futures = {}  # 本进程已提交给工作线程的任务 {JobID: Future}
+report_futures_lock = threading.Lock()
+
+report_recovery_task = PeriodicTask(
+    'report_job_recovery', recover_report_jobs, Config.REPORT_JOB_RECOVERY_SECONDS, logger=app.logger
+)
+
+
+@app.before_request
+def start_report_recovery():
+    """每个进程处理第一个请求时开始定期恢复报告任务"""
+    if Config.REPORT_JOB_RECOVERY_SECONDS > 0 and not report_recovery_task.running:
+        report_recovery_task.start()
 
 
 # ==================== API路由 ====================
@@ -794,52 +2489,57 @@ def upload_realtime_data():
     data = request.get_json()
     
     try:
+        # 验证传感器是否存在（读取元数据缓存，不查询数据库）
+        sensor = sensor_registry.get(data['sensor_id'], online=True)
+        if not sensor:
+            return jsonify({'status': 'error', 'message': '传感器不存在'}), 404
+        
+        if sensor.Status != '在线':
+            return jsonify({'status': 'error', 'message': f'传感器状态异常: {sensor.Status}'}), 400
+        
+        if Config.INGEST_MODE == 'buffered':
+            return enqueue_reading(data, sensor.PointID)
+        
         with get_db_session() as session:
-            # 验证传感器是否存在
-            sensor = session.query(Sensor).filter_by(SensorID=data['sensor_id']).first()
-            if not sensor:
-                return jsonify({'status': 'error', 'message': '传感器不存在'}), 404
-            
-            if sensor.Status != '在线':
-                return jsonify({'status': 'error', 'message': f'传感器状态异常: {sensor.Status}'}), 400
-    
             # 创建实时数据记录
-            timestamp = datetime.fromisoformat(data['timestamp']) if isinstance(data.get('timestamp'), str) else data.get('timestamp', datetime.now())
+            timestamp = to_local_naive(datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))) if isinstance(data.get('timestamp'), str) else data.get('timestamp', datetime.now())
             
             realtime_data = RealtimeData(
-            NoiseValue=float(data['noise_value']),
+                NoiseValue=float(data['noise_value']),
                 Timestamp=timestamp,
                 FrequencySpectrum=json.dumps(data.get('frequency_spectrum')) if data.get('frequency_spectrum') else None,
-            DataQuality=data.get('data_quality', '良好'),
+                DataQuality=data.get('data_quality', '良好'),
                 Temperature=data.get('temperature'),
                 Humidity=data.get('humidity'),
                 WindSpeed=data.get('wind_speed'),
                 WeatherCondition=data.get('weather_condition'),
                 SensorID=data['sensor_id'],
                 PointID=sensor.PointID
-        )
-        
+            )
+            
             session.add(realtime_data)
-            session.flush()  # 刷新以获取DataID和关联数据
-        
-        # 检查是否超标并生成告警
-            alert = check_and_generate_alert(realtime_data, session)
-            session.commit()
-        
-        response = {
-            'status': 'success',
-            'message': '实时数据上传成功',
-            'data_id': realtime_data.DataID,
-            'is_exceeded': realtime_data.is_exceeded,
-            'point_name': realtime_data.monitoring_point.PointName if realtime_data.monitoring_point else None
-        }
-        
-        if alert:
-            response['alert'] = {
-                'alert_id': alert.AlertID,
-                'alert_level': alert.AlertLevel,
-                'alert_type': alert.AlertType
+            session.flush()  # 刷新以获取DataID
+            
+            # 检查是否超标并生成告警（使用缓存中的监测点阈值）
+            alert = build_alert(realtime_data, sensor.point)
+            if alert:
+                session.add(alert)
+                session.flush()
+            
+            response = {
+                'status': 'success',
+                'message': '实时数据上传成功',
+                'data_id': realtime_data.DataID,
+                'is_exceeded': is_noise_exceeded(realtime_data.NoiseValue, timestamp, sensor.point),
+                'point_name': sensor.point.PointName if sensor.point else None
             }
+            
+            if alert:
+                response['alert'] = {
+                    'alert_id': alert.AlertID,
+                    'alert_level': alert.AlertLevel,
+                    'alert_type': alert.AlertType
+                }
         
         return jsonify(response), 201
     except Exception as e:
@@ -847,18 +2547,136 @@ def upload_realtime_data():
         return jsonify({'status': 'error', 'message': f'上传失败: {str(e)}'}), 500
 
 
+@app.route('/api/realtime-data/batch', methods=['POST'])
+@log_request_time
+def upload_realtime_data_batch():
+    """批量上传实时噪音数据（网关批量转发）"""
+    data = request.get_json(silent=True)
+    readings = data.get('readings') if isinstance(data, dict) else data
+    
+    if not isinstance(readings, list) or not readings:
+        return jsonify({'status': 'error', 'message': '缺少读数数组（readings）'}), 400
+    if len(readings) > Config.INGEST_BATCH_MAX_SIZE:
+        return jsonify({
+            'status': 'error',
+            'message': f'单批最多 {Config.INGEST_BATCH_MAX_SIZE} 条数据'
+        }), 400
+    
+    try:
+        results = [None] * len(readings)
+        accepted = []
+        for index, item in enumerate(readings):
+            fields, error = parse_reading(item)
+            if error:
+                results[index] = {'index': index, 'status': 'error', 'message': error}
+                continue
+            
+            # 传感器和监测点信息统一从元数据缓存读取
+            sensor = sensor_registry.get(fields['SensorID'], online=True)
+            if not sensor:
+                results[index] = {'index': index, 'status': 'error', 'message': '传感器不存在'}
+                continue
+            if sensor.Status != '在线':
+                results[index] = {'index': index, 'status': 'error', 'message': f'传感器状态异常: {sensor.Status}'}
+                continue
+            fields['PointID'] = sensor.PointID
+            accepted.append((index, fields, sensor.point))
+        
+        if Config.INGEST_MODE == 'buffered':
+            # write-behind 模式：整批放入写入队列后立即返回
+            queued = ingest_buffer.submit_many([fields for _, fields, _ in accepted])
+            for position, (index, _, _) in enumerate(accepted):
+                if position < queued:
+                    results[index] = {'index': index, 'status': 'queued'}
+                else:
+                    results[index] = {'index': index, 'status': 'error', 'message': '写入队列已满，请稍后重试'}
+            
+            return jsonify({
+                'status': 'success' if queued else 'error',
+                'message': f'已接收 {queued} 条数据，失败 {len(readings) - queued} 条',
+                'accepted_count': queued,
+                'rejected_count': len(readings) - queued,
+                'results': results
+            }), 202 if queued else 503
+        
+        with get_db_session() as session:
+            # 批量写入读数（单次 flush 内合并为批量 INSERT）
+            records = [RealtimeData(**fields) for _, fields, _ in accepted]
+            session.add_all(records)
+            session.flush()
+            
+            # 对整批数据统一做超标检查，告警同样批量写入
+            alerts = {}
+            for (index, _, point), record in zip(accepted, records):
+                alert = build_alert(record, point)
+                if alert:
+                    alerts[index] = alert
+            session.add_all(alerts.values())
+            session.flush()
+            
+            for (index, _, _), record in zip(accepted, records):
+                item_result = {
+                    'index': index,
+                    'status': 'success',
+                    'data_id': record.DataID,
+                    'is_exceeded': index in alerts
+                }
+                if index in alerts:
+                    item_result['alert'] = {
+                        'alert_id': alerts[index].AlertID,
+                        'alert_level': alerts[index].AlertLevel,
+                        'alert_type': alerts[index].AlertType
+                    }
+                results[index] = item_result
+            
+            session.commit()
+        
+        accepted_count = len(accepted)
+        return jsonify({
+            'status': 'success' if accepted_count else 'error',
+            'message': f'成功写入 {accepted_count} 条数据，失败 {len(readings) - accepted_count} 条',
+            'accepted_count': accepted_count,
+            'rejected_count': len(readings) - accepted_count,
+            'alert_count': len(alerts),
+            'results': results
+        }), 201 if accepted_count else 400
+    except Exception as e:
+        app.logger.error(f'批量上传实时数据失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'批量上传失败: {str(e)}'}), 500
+
+
+@app.route('/api/ingest/status', methods=['GET'])
+def get_ingest_status():
+    """获取数据接入模式及写入队列指标（队列深度、提交耗时）"""
+    return jsonify({
+        'status': 'success',
+        'data': {
+            'mode': Config.INGEST_MODE,
+            'buffer': ingest_buffer.stats()
+        }
+    }), 200
+
+
 @app.route('/api/realtime-data', methods=['GET'])
 @log_request_time
 def get_realtime_data():
-    """查询实时噪音数据（支持分页和过滤）"""
+    """查询实时噪音数据（支持分页和过滤）
+    
+    传入 cursor 参数（首页为空字符串）时使用游标分页，响应中的 next_cursor 用于请求下一页，
+    默认不统计总数（include_total=true 时统计）；否则按 page/per_page 分页。
+    """
     try:
         # 获取查询参数
         point_id = request.args.get('point_id', type=int)
         sensor_id = request.args.get('sensor_id')
         start_time = request.args.get('start_time')
         end_time = request.args.get('end_time')
+        cursor = request.args.get('cursor')
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        include_total = exact or request.args.get('include_total', 'false').lower() == 'true'
         page, per_page = get_pagination_params()
         offset = (page - 1) * per_page
+        start_dt = end_dt = None
         
         with get_db_session() as session:
             query = session.query(RealtimeData)
@@ -869,17 +2687,44 @@ def get_realtime_data():
             if sensor_id:
                 query = query.filter(RealtimeData.SensorID == sensor_id)
             if start_time:
-                start_dt = datetime.fromisoformat(start_time) if isinstance(start_time, str) else start_time
+                start_dt = to_local_naive(datetime.fromisoformat(start_time) if isinstance(start_time, str) else start_time)
                 query = query.filter(RealtimeData.Timestamp >= start_dt)
             if end_time:
-                end_dt = datetime.fromisoformat(end_time) if isinstance(end_time, str) else end_time
+                end_dt = to_local_naive(datetime.fromisoformat(end_time) if isinstance(end_time, str) else end_time)
                 query = query.filter(RealtimeData.Timestamp <= end_dt)
             
-            # 总数查询
-            total = query.count()
+            def estimate():
+                return rollup_count(session, start_dt, end_dt, point_id=point_id, sensor_id=sensor_id)
+            
+            if cursor is not None:
+                # 游标分页
+                try:
+                    realtime_data, next_cursor = keyset_page(
+                        query.options(*REALTIME_DATA_LOADS), RealtimeData.Timestamp, RealtimeData.DataID, cursor, per_page
+                    )
+                except ValueError as e:
+                    return jsonify({'status': 'error', 'message': str(e)}), 400
+                pagination = {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+                if include_total:
+                    pagination['total'], pagination['total_approximate'] = list_total(query, exact, estimate)
+                
+                return jsonify({
+                    'status': 'success',
+                    'data': [data.to_dict() for data in realtime_data],
+                    'pagination': pagination
+                }), 200
+            
+            # 总数查询（默认为汇总表估算或缓存值）
+            total, approximate = list_total(query, exact, estimate)
             
             # 数据查询（分页）
-            realtime_data = query.order_by(RealtimeData.Timestamp.desc()).offset(offset).limit(per_page).all()
+            realtime_data = query.options(*REALTIME_DATA_LOADS).order_by(
+                RealtimeData.Timestamp.desc(), RealtimeData.DataID.desc()
+            ).offset(offset).limit(per_page).all()
             
             result = [data.to_dict() for data in realtime_data]
             
@@ -890,6 +2735,7 @@ def get_realtime_data():
                 'page': page,
                 'per_page': per_page,
                 'total': total,
+                'total_approximate': approximate,
                 'pages': (total + per_page - 1) // per_page
             }
         }), 200
@@ -911,6 +2757,8 @@ def get_noise_data():
         end_time = request.args.get('end_time')
         hours = request.args.get('hours', type=int)  # 支持按小时数查询最近的数据
         limit = request.args.get('limit', type=int, default=1000)  # 默认限制增加到1000，用于图表显示
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        start_dt = end_dt = None
         
         with get_db_session() as session:
             query = session.query(RealtimeData)
@@ -930,21 +2778,24 @@ def get_noise_data():
                 query = query.filter(RealtimeData.SensorID == device_id)
             if start_time:
                 if isinstance(start_time, str):
-                    start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+                    start_dt = to_local_naive(datetime.fromisoformat(start_time.replace('Z', '+00:00')))
                 else:
                     start_dt = start_time
                 query = query.filter(RealtimeData.Timestamp >= start_dt)
             if end_time:
                 if isinstance(end_time, str):
-                    end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+                    end_dt = to_local_naive(datetime.fromisoformat(end_time.replace('Z', '+00:00')))
                 else:
                     end_dt = end_time
                 query = query.filter(RealtimeData.Timestamp <= end_dt)
             
-            # 总数查询
-            total = query.count()
+            # 总数查询（默认为汇总表估算或缓存值）
+            total, approximate = list_total(query, exact, lambda: rollup_count(
+                session, start_dt, end_dt, point_id=region_id, sensor_id=device_id, district=district
+            ))
             
             # 数据查询（限制数量，如果指定了hours，按时间正序排列以便图表显示）
+            query = query.options(*REALTIME_DATA_LOADS)
             if hours:
                 realtime_data = query.order_by(RealtimeData.Timestamp.asc()).limit(limit).all()
             else:
@@ -955,7 +2806,8 @@ def get_noise_data():
         return jsonify({
             'status': 'success',
             'data': result,
-            'count': total
+            'count': total,
+            'count_approximate': approximate
         }), 200
     except Exception as e:
         app.logger.error(f'查询噪音数据失败: {str(e)}')
@@ -969,29 +2821,33 @@ def upload_noise_data():
     data = request.get_json()
     
     try:
-        with get_db_session() as session:
-            # 验证设备是否存在（通过 sensor_id 或 device_id）
-            sensor_id = data.get('sensor_id') or data.get('device_id')
-            if not sensor_id:
-                return jsonify({'status': 'error', 'message': '缺少设备ID（sensor_id或device_id）'}), 400
-            
-            sensor = session.query(Sensor).filter_by(SensorID=sensor_id).first()
-            if not sensor:
-                return jsonify({'status': 'error', 'message': '设备不存在'}), 404
-            
-            if sensor.Status != '在线':
-                return jsonify({'status': 'error', 'message': f'设备状态异常: {sensor.Status}'}), 400
-            
-            # 处理 region_id（实际上是 point_id）
-            point_id = data.get('region_id') or sensor.PointID
-            if data.get('region_id') and data.get('region_id') != sensor.PointID:
-                # 验证 region_id 是否有效
-                point = session.query(MonitoringPoint).filter_by(PointID=point_id).first()
-                if not point:
-                    return jsonify({'status': 'error', 'message': '区域不存在'}), 404
-            
+        # 验证设备是否存在（通过 sensor_id 或 device_id）
+        sensor_id = data.get('sensor_id') or data.get('device_id')
+        if not sensor_id:
+            return jsonify({'status': 'error', 'message': '缺少设备ID（sensor_id或device_id）'}), 400
+        
+        sensor = sensor_registry.get(sensor_id, online=True)
+        if not sensor:
+            return jsonify({'status': 'error', 'message': '设备不存在'}), 404
+        
+        if sensor.Status != '在线':
+            return jsonify({'status': 'error', 'message': f'设备状态异常: {sensor.Status}'}), 400
+        
+        # 处理 region_id（实际上是 point_id）
+        point_id = data.get('region_id') or sensor.PointID
+        point = sensor.point
+        if data.get('region_id') and data.get('region_id') != sensor.PointID:
+            # 验证 region_id 是否有效
+            point = sensor_registry.get_point(point_id)
+            if not point:
+                return jsonify({'status': 'error', 'message': '区域不存在'}), 404
+        
+        if Config.INGEST_MODE == 'buffered':
+            return enqueue_reading(data, point_id)
+        
+        with get_db_session() as session:
             # 创建实时数据记录
-            timestamp = datetime.fromisoformat(data['timestamp']) if isinstance(data.get('timestamp'), str) else data.get('timestamp', datetime.now())
+            timestamp = to_local_naive(datetime.fromisoformat(data['timestamp'].replace('Z', '+00:00'))) if isinstance(data.get('timestamp'), str) else data.get('timestamp', datetime.now())
             
             realtime_data = RealtimeData(
                 NoiseValue=float(data['noise_value']),
@@ -1007,19 +2863,21 @@ def upload_noise_data():
             )
             
             session.add(realtime_data)
-            session.flush()  # 刷新以获取DataID和关联数据
+            session.flush()  # 刷新以获取DataID
             
-            # 检查是否超标并生成告警
-            alert = check_and_generate_alert(realtime_data, session)
-            session.commit()
+            # 检查是否超标并生成告警（使用缓存中的监测点阈值）
+            alert = build_alert(realtime_data, point)
+            if alert:
+                session.add(alert)
+                session.flush()
             
             response = {
                 'status': 'success',
                 'message': '噪音数据上传成功',
                 'noise_id': realtime_data.DataID,
                 'data_id': realtime_data.DataID,
-                'is_exceeded': realtime_data.is_exceeded,
-                'point_name': realtime_data.monitoring_point.PointName if realtime_data.monitoring_point else None
+                'is_exceeded': is_noise_exceeded(realtime_data.NoiseValue, timestamp, point),
+                'point_name': point.PointName if point else None
             }
             
             if alert:
@@ -1110,14 +2968,7 @@ def get_noise_statistics():
             # 使用 SQL CASE 语句在数据库层面计算，提高性能
             # 昼间（6:00-22:00）：使用 NoiseThresholdDay
             # 夜间（22:00-6:00）：使用 NoiseThresholdNight
-            hour_expr = func.extract('hour', RealtimeData.Timestamp)
-            exceed_condition = case(
-                (
-                    (hour_expr >= 6) & (hour_expr < 22),
-                    RealtimeData.NoiseValue > MonitoringPoint.NoiseThresholdDay
-                ),
-                else_=RealtimeData.NoiseValue > MonitoringPoint.NoiseThresholdNight
-            )
+            exceed_condition = noise_exceeded_condition()
             
             total_count = query_with_point.count()
             # 计算超标数量 - 使用 func.sum 和 case 来计算
@@ -1164,13 +3015,19 @@ def get_noise_statistics():
 @app.route('/api/alerts', methods=['GET'])
 @log_request_time
 def get_alerts():
-    """获取告警信息（支持分页）"""
+    """获取告警信息（支持分页）
+    
+    传入 cursor 参数（首页为空字符串）时按 (触发时间, 告警ID) 游标分页，用法同 /api/realtime-data。
+    """
     try:
         status = request.args.get('status')
         level = request.args.get('level')
         point_id = request.args.get('point_id', type=int)
         region_id = request.args.get('region_id')  # 支持region_id参数（可以是数字或字符串）
         district = request.args.get('district')  # 支持按区域（District）筛选
+        cursor = request.args.get('cursor')
+        exact = request.args.get('exact', 'false').lower() == 'true'
+        include_total = exact or request.args.get('include_total', 'false').lower() == 'true'
         page, per_page = get_pagination_params()
         offset = (page - 1) * per_page
         
@@ -1195,11 +3052,42 @@ def get_alerts():
             elif point_id:
                 query = query.filter(RealtimeData.PointID == point_id)
             
-            # 总数查询
-            total = query.count()
+            # 查询已 join 实时数据表，直接用于填充 realtime_data 关系
+            alert_loads = (
+                contains_eager(AlertInfo.realtime_data).joinedload(RealtimeData.sensor),
+                contains_eager(AlertInfo.realtime_data).joinedload(RealtimeData.monitoring_point),
+                joinedload(AlertInfo.handler)
+            )
+            
+            if cursor is not None:
+                # 游标分页
+                try:
+                    alerts, next_cursor = keyset_page(
+                        query.options(*alert_loads), AlertInfo.TriggerTime, AlertInfo.AlertID, cursor, per_page
+                    )
+                except ValueError as e:
+                    return jsonify({'status': 'error', 'message': str(e)}), 400
+                pagination = {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+                if include_total:
+                    pagination['total'], pagination['total_approximate'] = list_total(query, exact)
+                
+                return jsonify({
+                    'status': 'success',
+                    'alerts': [alert.to_dict() for alert in alerts],
+                    'pagination': pagination
+                }), 200
+            
+            # 总数查询（默认为缓存值）
+            total, approximate = list_total(query, exact)
             
             # 数据查询（分页）
-            alerts = query.order_by(AlertInfo.TriggerTime.desc()).offset(offset).limit(per_page).all()
+            alerts = query.options(*alert_loads).order_by(
+                AlertInfo.TriggerTime.desc(), AlertInfo.AlertID.desc()
+            ).offset(offset).limit(per_page).all()
             
             result = [alert.to_dict() for alert in alerts]
             
@@ -1210,6 +3098,7 @@ def get_alerts():
                     'page': page,
                     'per_page': per_page,
                     'total': total,
+                    'total_approximate': approximate,
                     'pages': (total + per_page - 1) // per_page
                 }
             }), 200
@@ -1251,7 +3140,10 @@ def update_alert(alert_id):
 @app.route('/api/regions', methods=['GET'])
 @log_request_time
 def get_regions():
-    """获取监测区域列表"""
+    """获取监测区域列表
+    
+    整个列表由固定的几条分组查询得到（监测点、各监测点传感器数、各监测点今日统计），与监测点数量无关。
+    """
     try:
         city_id = request.args.get('city_id', type=int)
         region_type = request.args.get('type')
@@ -1260,27 +3152,23 @@ def get_regions():
         
         with get_db_session() as session:
             if districts_only:
-                # 返回所有唯一的区域（District）列表
-                districts = session.query(MonitoringPoint.District).distinct().filter(
-                    MonitoringPoint.District.isnot(None)
-                ).all()
+                # 返回所有唯一的区域（District）列表，并统计各区域的监测点和传感器数量
+                districts = session.query(
+                    MonitoringPoint.District,
+                    func.count(MonitoringPoint.PointID.distinct()).label('point_count'),
+                    func.count(Sensor.SensorID).label('sensor_count')
+                ).outerjoin(Sensor, Sensor.PointID == MonitoringPoint.PointID).filter(
+                    MonitoringPoint.District.isnot(None),
+                    MonitoringPoint.District != ''
+                ).group_by(MonitoringPoint.District).all()
                 
-                result = []
-                for (district,) in districts:
-                    if district:
-                        # 统计该区域的监测点和传感器数量
-                        point_count = session.query(MonitoringPoint).filter_by(District=district).count()
-                        sensor_count = session.query(Sensor).join(MonitoringPoint).filter(
-                            MonitoringPoint.District == district
-                        ).count()
-                        
-                        result.append({
-                            'region_id': district,  # 使用区域名称作为ID
-                            'region_name': district,
-                            'district': district,
-                            'point_count': point_count,
-                            'sensor_count': sensor_count
-                        })
+                result = [{
+                    'region_id': row.District,  # 使用区域名称作为ID
+                    'region_name': row.District,
+                    'district': row.District,
+                    'point_count': row.point_count,
+                    'sensor_count': row.sensor_count
+                } for row in districts]
                 
                 return jsonify({
                     'status': 'success',
@@ -1289,7 +3177,7 @@ def get_regions():
                 }), 200
             
             # 原有的监测点列表逻辑
-            query = session.query(MonitoringPoint)
+            query = session.query(MonitoringPoint).options(joinedload(MonitoringPoint.city))
             
             if district:
                 query = query.filter(MonitoringPoint.District == district)
@@ -1299,29 +3187,40 @@ def get_regions():
                 query = query.filter(MonitoringPoint.PointType == region_type)
             
             points = query.all()
+            point_ids = [point.PointID for point in points]
+            
+            # 各监测点传感器数
+            sensor_counts = dict(session.query(
+                Sensor.PointID, func.count(Sensor.SensorID)
+            ).filter(Sensor.PointID.in_(point_ids)).group_by(Sensor.PointID).all()) if point_ids else {}
+            
+            # 各监测点今日统计：读取小时汇总表（写入时同步维护），超标次数按每条读数所在时段的昼/夜阈值计算
+            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            today_stats = {
+                row.PointID: row for row in session.query(
+                    HourlyRollup.PointID,
+                    func.sum(HourlyRollup.NoiseSum).label('noise_sum'),
+                    func.sum(HourlyRollup.SampleCount).label('data_count'),
+                    func.sum(HourlyRollup.ExceedCount).label('exceed_count')
+                ).filter(
+                    HourlyRollup.PointID.in_(point_ids),
+                    HourlyRollup.HourStart >= today_start
+                ).group_by(HourlyRollup.PointID).all()
+            } if point_ids else {}
             
             result = []
             for point in points:
-                # 获取最近24小时的统计数据
-                hour = datetime.now().hour
-                threshold = point.NoiseThresholdDay if 6 <= hour < 22 else point.NoiseThresholdNight
-                recent_stats = session.query(
-                    func.avg(RealtimeData.NoiseValue).label('avg_noise'),
-                    func.count(RealtimeData.DataID).label('data_count'),
-                    func.sum(case((RealtimeData.NoiseValue > threshold, 1), else_=0)).label('exceed_count')
-                ).filter(
-                    RealtimeData.PointID == point.PointID,
-                    RealtimeData.Timestamp >= datetime.now().replace(hour=0, minute=0, second=0)
-                ).first()
+                stats = today_stats.get(point.PointID)
+                data_count = int(stats.data_count or 0) if stats else 0
                 
                 point_dict = point.to_dict()
                 point_dict['district'] = point.District  # 添加district字段，方便前端使用
-                point_dict['sensor_count'] = session.query(Sensor).filter_by(PointID=point.PointID).count()
+                point_dict['sensor_count'] = sensor_counts.get(point.PointID, 0)
                 point_dict['recent_stats'] = {
-                    'avg_noise': float(recent_stats.avg_noise or 0),
-                    'data_count': recent_stats.data_count or 0,
-                    'exceed_count': recent_stats.exceed_count or 0
-                } if recent_stats else None
+                    'avg_noise': float(stats.noise_sum / data_count) if data_count else 0.0,
+                    'data_count': data_count,
+                    'exceed_count': int(stats.exceed_count or 0) if stats else 0
+                }
                 result.append(point_dict)
             
             return jsonify({
@@ -1340,14 +3239,13 @@ def get_region_devices(point_id):
     """获取区域内的监测设备"""
     try:
         with get_db_session() as session:
-            sensors = session.query(Sensor).filter_by(PointID=point_id).all()
+            # 设备最近状态读取最新读数表，与传感器一起查出
+            sensors = session.query(Sensor, SensorLatest).options(*SENSOR_LOADS).outerjoin(
+                SensorLatest, SensorLatest.SensorID == Sensor.SensorID
+            ).filter(Sensor.PointID == point_id).all()
             
             result = []
-            for sensor in sensors:
-                # 获取设备最近状态
-                recent_data = session.query(RealtimeData).filter_by(SensorID=sensor.SensorID)\
-                    .order_by(RealtimeData.Timestamp.desc()).first()
-                
+            for sensor, recent_data in sensors:
                 sensor_dict = sensor.to_dict()
                 sensor_dict['recent_noise'] = recent_data.NoiseValue if recent_data else None
                 sensor_dict['recent_update'] = recent_data.Timestamp.isoformat() if recent_data else None
@@ -1373,7 +3271,7 @@ def get_devices():
         district = request.args.get('district')  # 支持按区域（District）筛选
         
         with get_db_session() as session:
-            query = session.query(Sensor)
+            query = session.query(Sensor).options(*SENSOR_LOADS)
             
             if status:
                 query = query.filter(Sensor.Status == status)
@@ -1442,173 +3340,82 @@ def get_device_statuses():
 @validate_json('report_type', 'generated_by')
 @log_request_time
 def generate_report():
-    """生成报告"""
+    """提交报告生成任务，立即返回任务ID，由后台工作线程生成报告"""
     data = request.get_json()
     
+    try:
+        start_date, end_date = resolve_report_period(data)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': f'报告周期格式错误: {str(e)}'}), 400
+    
     try:
         with get_db_session() as session:
-            # 解析报告周期
-            start_date = None
-            end_date = None
-            if data.get('start_date') and data.get('end_date'):
-                start_date = datetime.strptime(data['start_date'], '%Y-%m-%d')
-                end_date = datetime.strptime(data['end_date'], '%Y-%m-%d')
-                # 结束日期设置为当天的23:59:59
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-            elif data.get('report_period'):
-                # 从字符串解析日期范围（支持"至"和"到"）
-                period = data['report_period']
-                if '至' in period or '到' in period:
-                    separator = '至' if '至' in period else '到'
-                    parts = period.split(separator)
-                    if len(parts) == 2:
-                        try:
-                            start_date = datetime.strptime(parts[0].strip(), '%Y-%m-%d')
-                            end_date = datetime.strptime(parts[1].strip(), '%Y-%m-%d')
-                            end_date = end_date.replace(hour=23, minute=59, second=59)
-                        except ValueError:
-                            # 如果解析失败，使用默认值
-                            pass
-            
-            # 如果没有提供日期，根据报告类型自动计算
-            if not start_date or not end_date:
-                today = datetime.now()
-                report_type = data['report_type']
-                if report_type == '日报':
-                    start_date = today.replace(hour=0, minute=0, second=0, microsecond=0)
-                    end_date = today.replace(hour=23, minute=59, second=59, microsecond=999999)
-                elif report_type == '周报':
-                    # 本周一
-                    day_of_week = today.weekday()  # 0=Monday, 6=Sunday
-                    start_date = today - timedelta(days=day_of_week)
-                    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                    end_date = start_date + timedelta(days=6)
-                    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                elif report_type == '月报':
-                    # 本月第一天
-                    start_date = today.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                    # 本月最后一天
-                    if today.month == 12:
-                        end_date = today.replace(year=today.year + 1, month=1, day=1)
-                    else:
-                        end_date = today.replace(month=today.month + 1, day=1)
-                    end_date = end_date - timedelta(days=1)
-                    end_date = end_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-                elif report_type == '年报':
-                    # 今年第一天
-                    start_date = today.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-                    # 今年最后一天
-                    end_date = today.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=999999)
-                else:  # 专项报告，默认最近30天
-                    end_date = today.replace(hour=23, minute=59, second=59, microsecond=999999)
-                    start_date = end_date - timedelta(days=30)
-                    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            
-            # 生成报告周期字符串
-            report_period = f"{start_date.strftime('%Y-%m-%d')} 至 {end_date.strftime('%Y-%m-%d')}"
-            
-            # 查询该周期内的数据统计
-            noise_query = session.query(RealtimeData).filter(
-                RealtimeData.Timestamp >= start_date,
-                RealtimeData.Timestamp <= end_date
-            )
-            
-            total_count = noise_query.count()
-            avg_noise = noise_query.with_entities(func.avg(RealtimeData.NoiseValue)).scalar() or 0
-            max_noise = noise_query.with_entities(func.max(RealtimeData.NoiseValue)).scalar() or 0
-            min_noise = noise_query.with_entities(func.min(RealtimeData.NoiseValue)).scalar() or 0
-            
-            # 超标统计
-            exceed_count = 0
-            for noise_data in noise_query.all():
-                if noise_data.is_exceeded:
-                    exceed_count += 1
-            
-            exceed_rate = (exceed_count / total_count * 100) if total_count > 0 else 0
-            
-            # 按区域统计
-            region_stats = session.query(
-                MonitoringPoint.PointID,
-                MonitoringPoint.PointName,
-                MonitoringPoint.PointType,
-                func.avg(RealtimeData.NoiseValue).label('avg_noise'),
-                func.count(RealtimeData.DataID).label('data_count')
-            ).join(RealtimeData).filter(
-                RealtimeData.Timestamp >= start_date,
-                RealtimeData.Timestamp <= end_date
-            ).group_by(
-                MonitoringPoint.PointID,
-                MonitoringPoint.PointName,
-                MonitoringPoint.PointType
-            ).all()
-            
-            region_statistics = []
-            for stat in region_stats:
-                region_statistics.append({
-                    'region_id': stat.PointID,
-                    'region_name': stat.PointName,
-                    'region_type': stat.PointType,
-                    'avg_noise': round(float(stat.avg_noise or 0), 2),
-                    'data_count': stat.data_count
-                })
-            
-            # 告警统计
-            alert_query = session.query(AlertInfo).join(RealtimeData).filter(
-                AlertInfo.TriggerTime >= start_date,
-                AlertInfo.TriggerTime <= end_date
-            )
-            alert_count = alert_query.count()
-            alert_by_level = {}
-            for level in ['低', '中', '高', '紧急']:
-                alert_by_level[level] = alert_query.filter(AlertInfo.AlertLevel == level).count()
-            
-            # 生成报告内容
-            report_content = {
-                'summary': f'{data["report_type"]}摘要',
-                'period': report_period,
-                'statistics': {
-                    'total_data_count': total_count,
-                    'avg_noise': round(avg_noise, 2),
-                    'max_noise': round(max_noise, 2),
-                    'min_noise': round(min_noise, 2),
-                    'exceed_count': exceed_count,
-                    'exceed_rate': round(exceed_rate, 2),
-                    'alert_count': alert_count,
-                    'alert_by_level': alert_by_level
-                },
-                'region_statistics': region_statistics,
-                'recommendations': []
-            }
-            
-            # 生成建议
-            if exceed_rate > 20:
-                report_content['recommendations'].append('超标率较高，建议加强监测和治理')
-            if alert_by_level.get('紧急', 0) > 0:
-                report_content['recommendations'].append('存在紧急告警，需要立即处理')
-            if avg_noise > 65:
-                report_content['recommendations'].append('平均噪音值偏高，建议采取降噪措施')
-            
-            # 创建报告记录
-            report = Report(
-                ReportType=data['report_type'],
-                ReportPeriod=report_period,
-                GeneratedBy=data['generated_by'],
-                Content=json.dumps(report_content, ensure_ascii=False),
-                IsPublic=data.get('is_public', 0)
+            job, created = submit_report_job(
+                session, data['report_type'], start_date, end_date,
+                data['generated_by'], data.get('is_public', 0)
             )
-            
-            session.add(report)
-            session.flush()  # 刷新以获取ReportID
+            if job is None:
+                return jsonify({'status': 'error', 'message': '报告任务过多，请稍后重试'}), 503
+            job_dict = job.to_dict()
+        
+        # 任务提交后再交给工作线程，保证工作线程能读到任务记录
+        if created:
+            dispatch_report_job(job_dict['job_id'])
+        
+        return jsonify({
+            'status': 'success',
+            'message': '报告任务已提交' if created else '相同报告正在生成，已合并到现有任务',
+            'job_id': job_dict['job_id'],
+            'job': job_dict
+        }), 202
+    except Exception as e:
+        app.logger.error(f'报告任务提交失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'报告任务提交失败: {str(e)}'}), 500
+
+
+@app.route('/api/reports/jobs/<int:job_id>', methods=['GET'])
+@log_request_time
+def get_report_job(job_id):
+    """查询报告任务状态"""
+    try:
+        with get_db_session() as session:
+            job = session.get(ReportJob, job_id)
+            if not job:
+                return jsonify({'status': 'error', 'message': '报告任务不存在'}), 404
             
             return jsonify({
                 'status': 'success',
-                'message': '报告生成成功',
-                'report_id': report.ReportID,
-                'report_period': report_period
-            }), 201
+                'job': job.to_dict()
+            }), 200
     except Exception as e:
-        app.logger.error(f'报告生成失败: {str(e)}')
-        return jsonify({'status': 'error', 'message': f'报告生成失败: {str(e)}'}), 500
+        app.logger.error(f'获取报告任务失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'获取报告任务失败: {str(e)}'}), 500
+
+
+@app.route('/api/reports/jobs/<int:job_id>/stream', methods=['GET'])
+def stream_report_job(job_id):
+    """以SSE推送报告任务进度，任务完成或失败后结束"""
+    def generate():
+        last_state = None
+        while True:
+            with get_db_session() as session:
+                job = session.get(ReportJob, job_id)
+                job_dict = job.to_dict() if job else None
+            
+            if job_dict is None:
+                yield f"data: {json.dumps({'status': 'error', 'message': '报告任务不存在'}, ensure_ascii=False)}\n\n"
+                return
+            
+            state = (job_dict['job_status'], job_dict['progress'])
+            if state != last_state:
+                yield f"data: {json.dumps({'status': 'success', 'job': job_dict}, ensure_ascii=False)}\n\n"
+                last_state = state
+            
+            if job_dict['job_status'] not in REPORT_JOB_ACTIVE_STATUSES:
+                return
+            sleep(1)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
 
 @app.route('/api/reports', methods=['GET'])
@@ -1617,6 +3424,7 @@ def get_reports():
     """获取报告列表（支持分页）"""
     try:
         report_type = request.args.get('type')
+        exact = request.args.get('exact', 'false').lower() == 'true'
         page, per_page = get_pagination_params()
         offset = (page - 1) * per_page
         
@@ -1626,11 +3434,11 @@ def get_reports():
             if report_type:
                 query = query.filter(Report.ReportType == report_type)
             
-            # 总数查询
-            total = query.count()
+            # 总数查询（默认为缓存值）
+            total, approximate = list_total(query, exact)
             
             # 数据查询（分页）
-            reports = query.order_by(Report.GeneratedAt.desc()).offset(offset).limit(per_page).all()
+            reports = query.options(joinedload(Report.generator)).order_by(Report.GeneratedAt.desc()).offset(offset).limit(per_page).all()
             
             result = [report.to_dict() for report in reports]
             
@@ -1641,6 +3449,7 @@ def get_reports():
                     'page': page,
                     'per_page': per_page,
                     'total': total,
+                    'total_approximate': approximate,
                     'pages': (total + per_page - 1) // per_page
                 }
             }), 200
@@ -1663,6 +3472,10 @@ def delete_report(report_id):
             # 如果报告有文件，可以选择删除文件（这里只删除数据库记录）
             # 如果需要删除文件，可以添加文件删除逻辑
             
+            # 解除报告任务对该报告的引用
+            session.query(ReportJob).filter(ReportJob.ReportID == report_id).update(
+                {'ReportID': None}, synchronize_session=False
+            )
             session.delete(report)
             session.commit()
             
@@ -1702,7 +3515,7 @@ def get_dashboard_stats():
             ).group_by(MonitoringPoint.PointType).all()
             
             # 最近告警
-            recent_alerts = session.query(AlertInfo).order_by(AlertInfo.TriggerTime.desc()).limit(5).all()
+            recent_alerts = session.query(AlertInfo).options(*ALERT_LOADS).order_by(AlertInfo.TriggerTime.desc()).limit(5).all()
             alerts_list = [alert.to_dict() for alert in recent_alerts]
             
             return jsonify({
@@ -1726,65 +3539,61 @@ def get_dashboard_stats():
 @cache.cached(timeout=120)  # 缓存2分钟
 @log_request_time
 def get_map_data():
-    """获取地图展示数据"""
+    """获取地图展示数据
+    
+    设备最新读数和监测点滚动平均读取写入时维护的 sensor_latest / point_latest，一次关联查询得到，
+    与传感器数量无关。
+    """
     try:
         with get_db_session() as session:
-            # 获取所有设备及其位置
-            sensors = session.query(Sensor).all()
-            
-            device_points = []
-            for sensor in sensors:
-                point = session.query(MonitoringPoint).filter_by(PointID=sensor.PointID).first()
-                if point and point.Longitude and point.Latitude:
-                    # 获取设备最新数据
-                    recent_data = session.query(RealtimeData).filter_by(SensorID=sensor.SensorID)\
-                        .order_by(RealtimeData.Timestamp.desc()).first()
-                    
-                    hour = datetime.now().hour
-                    threshold = point.NoiseThresholdDay if 6 <= hour < 22 else point.NoiseThresholdNight
-                    is_exceeded = recent_data.NoiseValue > threshold if recent_data else False
-                    
-                    device_points.append({
-                        'device_id': sensor.SensorID,
-                        'device_status': sensor.Status,
-                        'coordinates': [point.Longitude, point.Latitude],
-                        'point_id': point.PointID,
-                        'point_name': point.PointName,
-                        'recent_noise': recent_data.NoiseValue if recent_data else None,
-                        'is_exceeded': is_exceeded
-                    })
-            
-            # 获取区域边界数据（这里简化处理，实际项目需要区域边界坐标）
-            points = session.query(MonitoringPoint).all()
-            region_polygons = []
-            
-            for point in points:
-                # 这里应该从数据库或其他数据源获取区域边界坐标
-                # 简化示例：使用设备位置计算中心点
-                point_devices = [d for d in device_points if d.get('point_id') == point.PointID]
-                
-                if point_devices and point.Longitude and point.Latitude:
-                    # 计算区域噪音平均值
-                    point_noise_data = session.query(RealtimeData).filter_by(PointID=point.PointID)\
-                        .order_by(RealtimeData.Timestamp.desc()).limit(10).all()
-                    
-                    avg_noise = sum(d.NoiseValue for d in point_noise_data) / len(point_noise_data) if point_noise_data else 0
-                    
-                    region_polygons.append({
-                        'point_id': point.PointID,
-                        'point_name': point.PointName,
-                        'region_type': point.PointType,
-                        'center': [point.Longitude, point.Latitude],
-                        'avg_noise': round(avg_noise, 1),
-                        'noise_level': calculate_noise_level(avg_noise, point.PointType),
-                        'device_count': len(point_devices)
-                    })
-            
-            return jsonify({
-                'status': 'success',
-                'devices': device_points,
-                'regions': region_polygons
-            }), 200
+            rows = session.query(
+                Sensor.SensorID, Sensor.Status,
+                MonitoringPoint.PointID, MonitoringPoint.PointName, MonitoringPoint.PointType,
+                MonitoringPoint.Longitude, MonitoringPoint.Latitude,
+                SensorLatest.NoiseValue, SensorLatest.IsExceeded, PointLatest.AvgNoise
+            ).join(
+                MonitoringPoint, MonitoringPoint.PointID == Sensor.PointID
+            ).outerjoin(
+                SensorLatest, SensorLatest.SensorID == Sensor.SensorID
+            ).outerjoin(
+                PointLatest, PointLatest.PointID == MonitoringPoint.PointID
+            ).order_by(MonitoringPoint.PointID, Sensor.SensorID).all()
+            
+        device_points = []
+        region_polygons = {}
+        for row in rows:
+            if not (row.Longitude and row.Latitude):
+                continue
+            device_points.append({
+                'device_id': row.SensorID,
+                'device_status': row.Status,
+                'coordinates': [row.Longitude, row.Latitude],
+                'point_id': row.PointID,
+                'point_name': row.PointName,
+                'recent_noise': row.NoiseValue,
+                'is_exceeded': bool(row.IsExceeded)
+            })
+            
+            # 区域边界数据（这里简化处理，实际项目需要区域边界坐标），以监测点位置为中心
+            region = region_polygons.get(row.PointID)
+            if region is None:
+                avg_noise = row.AvgNoise or 0
+                region = region_polygons[row.PointID] = {
+                    'point_id': row.PointID,
+                    'point_name': row.PointName,
+                    'region_type': row.PointType,
+                    'center': [row.Longitude, row.Latitude],
+                    'avg_noise': round(avg_noise, 1),
+                    'noise_level': calculate_noise_level(avg_noise, row.PointType),
+                    'device_count': 0
+                }
+            region['device_count'] += 1
+        
+        return jsonify({
+            'status': 'success',
+            'devices': device_points,
+            'regions': list(region_polygons.values())
+        }), 200
     except Exception as e:
         app.logger.error(f'获取地图数据失败: {str(e)}')
         return jsonify({'status': 'error', 'message': f'获取地图数据失败: {str(e)}'}), 500
@@ -1846,135 +3655,58 @@ def import_data():
 
 # ==================== 实时监控和数据分析 ====================
 
-# 初始化智能模拟器
-simulator = SmartNoiseSimulator()
-
-# 实时数据生成标志
-realtime_generation_active = False
-realtime_thread = None
-
-# 存储每个传感器的上次噪音值和时间戳（用于平滑波动）
-sensor_last_values = {}  # {sensor_id: {'value': float, 'timestamp': datetime}}
+# 初始化智能模拟器（各传感器的上次值由模拟器自身维护，用于平滑波动）
+simulator = SmartNoiseSimulator(seed=Config.SIMULATOR_SEED)
 
 
 @app.route('/api/realtime/stream', methods=['GET'])
 def realtime_stream():
-    """实时数据流（Server-Sent Events）- 实时采集并推送传感器数据"""
+    """实时数据流（Server-Sent Events）- 推送新写入的传感器数据
+    
+    所有连接共用 stream_broadcaster：数据写入提交后序列化一次并分发到各连接的有界队列，
+    建立连接不访问数据库。重连时通过 Last-Event-ID 请求头（或 last_event_id 参数）从内存补发错过的帧。
+    
+    查询参数:
+        district / point_id / sensor_id: 只订阅指定区县、监测点或传感器（逗号分隔多个值）
+        format: full（默认，兼容原格式）或 compact（先发送 meta 快照，之后只发送 delta 读数数组）
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    # 订阅条件：district / point_id / sensor_id，均支持逗号分隔的多个值
+    filters = {}
+    for param in ('district', 'point_id', 'sensor_id'):
+        values = [value.strip() for value in request.args.get(param, '').split(',') if value.strip()]
+        if values:
+            filters[param] = set(values)
+    if 'point_id' in filters:
+        try:
+            filters['point_id'] = {int(value) for value in filters['point_id']}
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'point_id必须是整数'}), 400
+    
+    stream_format = request.args.get('format', 'full')
+    if stream_format not in ('full', 'compact'):
+        return jsonify({'status': 'error', 'message': 'format必须是full或compact'}), 400
+    compact = stream_format == 'compact'
+    snapshot = stream_snapshot(filters) if compact else None
+    if Config.STREAM_RELAY_INTERVAL_SECONDS > 0 and not stream_relay_task.running:
+        stream_relay_task.start()  # 转发其他进程写入的数据
+    
     def generate():
-        """生成实时数据流"""
-        with get_db_session() as session:
-            # 获取所有在线传感器
-            sensors = session.query(Sensor).filter_by(Status='在线').all()
-            
-            if not sensors:
-                yield f"data: {json.dumps({'status': 'error', 'message': '没有在线传感器'})}\n\n"
-                return
-            
-            # 获取传感器信息
-            sensors_info = []
-            for sensor in sensors:
-                point = sensor.monitoring_point
-                if point:
-                    sensors_info.append({
-                        'sensor_id': sensor.SensorID,
-                        'sensor_name': sensor.SensorName,
-                        'point_id': point.PointID,
-                        'point_name': point.PointName,
-                        'point_code': point.PointCode,
-                        'point_type': point.PointType,
-                        'location': {'lng': point.Longitude, 'lat': point.Latitude}
-                    })
-        
-        # 持续生成实时数据
-        stream_last_values = {}  # 用于流式传输的上次值
-        while True:
-            try:
-                realtime_data = []
-                current_time = datetime.now()
-                
-                for sensor_info in sensors_info:
-                    # 获取该传感器的上次值
-                    last_data = stream_last_values.get(sensor_info['sensor_id'])
-                    previous_value = None
-                    time_since_last = None
-                    
-                    if last_data:
-                        previous_value = last_data['value']
-                        time_since_last = (current_time - last_data['timestamp']).total_seconds()
-                    
-                    # 生成实时数据（支持平滑波动）
-                    noise_data = simulator.generate_realistic_noise_data(
-                        region_type=sensor_info['point_type'],
-                        time=current_time,
-                        location=sensor_info.get('location'),
-                        device_status='在线',
-                        previous_value=previous_value,
-                        time_since_last=time_since_last
-                    )
-                    
-                    # 更新上次值
-                    stream_last_values[sensor_info['sensor_id']] = {
-                        'value': noise_data['noise_value'],
-                        'timestamp': current_time
-                    }
-                    
-                    # 保存到数据库
-                    with get_db_session() as session:
-                        # 获取传感器和监测点
-                        sensor = session.query(Sensor).filter_by(SensorID=sensor_info['sensor_id']).first()
-                        point = session.query(MonitoringPoint).filter_by(PointID=sensor_info['point_id']).first()
-                        
-                        if sensor and point:
-                            # 创建实时数据记录
-                            realtime_record = RealtimeData(
-                                NoiseValue=noise_data['noise_value'],
-                                Timestamp=noise_data['timestamp'],
-                                FrequencySpectrum=json.dumps(noise_data['frequency_analysis']),
-                                DataQuality=noise_data['data_quality'],
-                                Temperature=noise_data.get('temperature'),
-                                Humidity=noise_data.get('humidity'),
-                                WindSpeed=noise_data.get('wind_speed'),
-                                WeatherCondition=noise_data.get('weather', 'normal'),
-                                SensorID=sensor.SensorID,
-                                PointID=point.PointID
-                            )
-                            session.add(realtime_record)
-                            session.flush()
-                            
-                            # 检查告警
-                            alert = check_and_generate_alert(realtime_record, session)
-                            
-                            # 获取告警信息（如果有）
-                            alert_dict = None
-                            if alert:
-                                alert_dict = alert.to_dict()
-                            
-                            realtime_data.append({
-                                'sensor_id': sensor_info['sensor_id'],
-                                'device_id': sensor_info['sensor_id'],  # 添加device_id字段，兼容前端
-                                'sensor_name': sensor_info['sensor_name'],
-                                'point_id': sensor_info['point_id'],
-                                'point_name': sensor_info['point_name'],
-                                'point_code': sensor_info['point_code'],
-                                'noise_value': noise_data['noise_value'],
-                                'timestamp': noise_data['timestamp'].isoformat(),
-                                'data_quality': noise_data['data_quality'],
-                                'is_exceeded': realtime_record.is_exceeded,
-                                'alert': alert_dict
-                            })
-                
-                # 发送数据
-                yield f"data: {json.dumps({'status': 'success', 'data': realtime_data, 'timestamp': current_time.isoformat()})}\n\n"
-                
-                # 等待5秒后生成下一批数据
-                sleep(5)
-                
-            except Exception as e:
-                app.logger.error(f'实时数据生成错误: {str(e)}')
-                yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
-                sleep(5)
+        subscriber = stream_broadcaster.subscribe(last_event_id, filters, compact, snapshot)
+        try:
+            while True:
+                frame = subscriber.get(timeout=Config.STREAM_KEEPALIVE_SECONDS)
+                # 长时间没有数据时发送注释行，保持连接并及时发现已断开的客户端
+                yield frame if frame is not None else ': keepalive\n\n'
+        finally:
+            stream_broadcaster.unsubscribe(subscriber)
     
-    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 @app.route('/api/analysis/trend', methods=['GET'])
@@ -1996,43 +3728,36 @@ def analyze_trend_simple():
             if sensor_id:
                 query = query.filter(RealtimeData.SensorID == sensor_id)
             
-            data = query.order_by(RealtimeData.Timestamp).all()
+            hourly_buckets = aggregate_by_clock_hour(query)
             
-            if not data:
+            if not hourly_buckets:
                 return jsonify({
                     'status': 'success',
                     'trend': [],
                     'summary': {}
                 }), 200
             
-            # 按小时聚合
-            hourly_data = {}
-            for record in data:
-                hour_key = record.Timestamp.replace(minute=0, second=0, microsecond=0)
-                if hour_key not in hourly_data:
-                    hourly_data[hour_key] = []
-                hourly_data[hour_key].append(record.NoiseValue)
-            
-            # 计算每小时平均值
+            # 每小时统计
             trend_data = []
-            for hour, values in sorted(hourly_data.items()):
+            for hour, noise_sum, count, min_noise, max_noise, _ in hourly_buckets:
                 trend_data.append({
                     'timestamp': hour.isoformat(),
-                    'avg_noise': round(sum(values) / len(values), 1),
-                    'max_noise': round(max(values), 1),
-                    'min_noise': round(min(values), 1),
-                    'count': len(values)
+                    'avg_noise': round(noise_sum / count, 1),
+                    'max_noise': round(max_noise, 1),
+                    'min_noise': round(min_noise, 1),
+                    'count': count
                 })
             
             # 计算统计摘要
-            all_values = [d.NoiseValue for d in data]
+            total_count = sum(bucket[2] for bucket in hourly_buckets)
+            exceeded_count = sum(bucket[5] for bucket in hourly_buckets)
             summary = {
-                'avg_noise': round(sum(all_values) / len(all_values), 1),
-                'max_noise': round(max(all_values), 1),
-                'min_noise': round(min(all_values), 1),
-                'total_count': len(data),
-                'exceeded_count': sum(1 for d in data if d.is_exceeded),
-                'exceeded_rate': round(sum(1 for d in data if d.is_exceeded) / len(data) * 100, 2) if data else 0
+                'avg_noise': round(sum(bucket[1] for bucket in hourly_buckets) / total_count, 1),
+                'max_noise': round(max(bucket[4] for bucket in hourly_buckets), 1),
+                'min_noise': round(min(bucket[3] for bucket in hourly_buckets), 1),
+                'total_count': total_count,
+                'exceeded_count': exceeded_count,
+                'exceeded_rate': round(exceeded_count / total_count * 100, 2)
             }
             
             return jsonify({
@@ -2058,42 +3783,54 @@ def analyze_compare():
         start_time = datetime.now() - timedelta(days=days)
         
         with get_db_session() as session:
-            if not region_ids:
-                # 获取所有区域
-                regions = session.query(MonitoringPoint).all()
-                region_ids = [r.PointID for r in regions]
+            # 一次分组查询得到所有区域的统计（超标判断在数据库中按昼夜阈值计算）
+            stats_query = session.query(
+                MonitoringPoint.PointID,
+                MonitoringPoint.PointName,
+                MonitoringPoint.PointType,
+                MonitoringPoint.NoiseThresholdDay,
+                MonitoringPoint.NoiseThresholdNight,
+                func.avg(RealtimeData.NoiseValue).label('avg_noise'),
+                func.max(RealtimeData.NoiseValue).label('max_noise'),
+                func.min(RealtimeData.NoiseValue).label('min_noise'),
+                func.count(RealtimeData.DataID).label('data_count'),
+                func.sum(case((noise_exceeded_condition(), 1), else_=0)).label('exceeded_count')
+            ).join(
+                RealtimeData, RealtimeData.PointID == MonitoringPoint.PointID
+            ).filter(RealtimeData.Timestamp >= start_time)
+            
+            if region_ids:
+                stats_query = stats_query.filter(MonitoringPoint.PointID.in_(set(region_ids)))
+            
+            stats_by_region = {
+                stat.PointID: stat for stat in stats_query.group_by(
+                    MonitoringPoint.PointID,
+                    MonitoringPoint.PointName,
+                    MonitoringPoint.PointType,
+                    MonitoringPoint.NoiseThresholdDay,
+                    MonitoringPoint.NoiseThresholdNight
+                ).order_by(MonitoringPoint.PointID)
+            }
             
             comparison_data = []
-            
-            for region_id in region_ids:
-                region = session.query(MonitoringPoint).filter_by(PointID=region_id).first()
-                if not region:
-                    continue
-                
-                # 查询该区域的数据
-                data = session.query(RealtimeData).filter(
-                    RealtimeData.PointID == region_id,
-                    RealtimeData.Timestamp >= start_time
-                ).all()
-                
-                if not data:
+            for region_id in (region_ids or stats_by_region):
+                stat = stats_by_region.get(region_id)
+                if not stat:
                     continue
                 
-                values = [d.NoiseValue for d in data]
-                exceeded_count = sum(1 for d in data if d.is_exceeded)
-                
+                exceeded_count = int(stat.exceeded_count or 0)
                 comparison_data.append({
                     'region_id': region_id,
-                    'region_name': region.PointName,
-                    'region_type': region.PointType,
-                    'avg_noise': round(sum(values) / len(values), 1),
-                    'max_noise': round(max(values), 1),
-                    'min_noise': round(min(values), 1),
+                    'region_name': stat.PointName,
+                    'region_type': stat.PointType,
+                    'avg_noise': round(float(stat.avg_noise), 1),
+                    'max_noise': round(stat.max_noise, 1),
+                    'min_noise': round(stat.min_noise, 1),
                     'exceeded_count': exceeded_count,
-                    'exceeded_rate': round(exceeded_count / len(values) * 100, 2),
-                    'data_count': len(values),
-                    'threshold_day': region.NoiseThresholdDay,
-                    'threshold_night': region.NoiseThresholdNight
+                    'exceeded_rate': round(exceeded_count / stat.data_count * 100, 2),
+                    'data_count': stat.data_count,
+                    'threshold_day': stat.NoiseThresholdDay,
+                    'threshold_night': stat.NoiseThresholdNight
                 })
             
             # 排序（按平均噪音值）
@@ -2126,40 +3863,25 @@ def analyze_hourly_pattern():
         start_time = datetime.now() - timedelta(days=days)
         
         with get_db_session() as session:
-            query = session.query(RealtimeData).filter(RealtimeData.Timestamp >= start_time)
-            
-            if region_id:
-                query = query.filter(RealtimeData.PointID == region_id)
-            if device_id:
-                query = query.filter(RealtimeData.SensorID == device_id)
-            
-            data = query.all()
+            hourly_stats = aggregate_by_hour_of_day(session, start_time, point_id=region_id, sensor_id=device_id)
             
-            if not data:
+            if not hourly_stats:
                 return jsonify({
                     'status': 'success',
                     'pattern': []
                 }), 200
             
-            # 按小时分组
-            hourly_stats = {}
-            for record in data:
-                hour = record.Timestamp.hour
-                if hour not in hourly_stats:
-                    hourly_stats[hour] = []
-                hourly_stats[hour].append(record.NoiseValue)
-            
             # 计算每小时统计
             pattern_data = []
             for hour in range(24):
                 if hour in hourly_stats:
-                    values = hourly_stats[hour]
+                    noise_sum, count, min_noise, max_noise = hourly_stats[hour]
                     pattern_data.append({
                         'hour': hour,
-                        'avg_noise': round(sum(values) / len(values), 1),
-                        'max_noise': round(max(values), 1),
-                        'min_noise': round(min(values), 1),
-                        'count': len(values)
+                        'avg_noise': round(noise_sum / count, 1),
+                        'max_noise': round(max_noise, 1),
+                        'min_noise': round(min_noise, 1),
+                        'count': count
                     })
                 else:
                     pattern_data.append({
@@ -2190,74 +3912,73 @@ def analyze_correlation():
         start_time = datetime.now() - timedelta(days=days)
         
         with get_db_session() as session:
-            # 获取数据
-            data = session.query(RealtimeData, MonitoringPoint).join(
+            # 一次分组查询：按区域类型、日期、昼夜聚合，三种维度的统计都由这些分组合并得到
+            hour_expr = func.extract('hour', RealtimeData.Timestamp)
+            is_daytime = case(((hour_expr >= 6) & (hour_expr < 22), 1), else_=0)
+            day_expr = func.date(RealtimeData.Timestamp)
+            groups = session.query(
+                MonitoringPoint.PointType.label('region_type'),
+                day_expr.label('day'),
+                is_daytime.label('is_daytime'),
+                func.sum(RealtimeData.NoiseValue).label('noise_sum'),
+                func.count(RealtimeData.DataID).label('count'),
+                func.min(RealtimeData.NoiseValue).label('min_noise'),
+                func.max(RealtimeData.NoiseValue).label('max_noise')
+            ).join(
                 MonitoringPoint, RealtimeData.PointID == MonitoringPoint.PointID
-            ).filter(RealtimeData.Timestamp >= start_time).all()
+            ).filter(
+                RealtimeData.Timestamp >= start_time
+            ).group_by(MonitoringPoint.PointType, day_expr, is_daytime).all()
             
-            if not data:
+            if not groups:
                 return jsonify({
                     'status': 'success',
                     'correlations': {}
                 }), 200
             
-            # 按区域类型分析
             region_type_stats = {}
-            for noise_data, region in data:
-                region_type = region.PointType
-                if region_type not in region_type_stats:
-                    region_type_stats[region_type] = []
-                region_type_stats[region_type].append(noise_data.NoiseValue)
+            period_stats = {key: [0.0, 0] for key in ('weekday', 'weekend', 'day', 'night')}
+            for group in groups:
+                # 按区域类型累计
+                stats = region_type_stats.setdefault(group.region_type, [0.0, 0, group.min_noise, group.max_noise])
+                stats[0] += group.noise_sum
+                stats[1] += group.count
+                stats[2] = min(stats[2], group.min_noise)
+                stats[3] = max(stats[3], group.max_noise)
+                
+                # 按工作日/周末、白天/夜间累计
+                weekday = datetime.strptime(str(group.day)[:10], '%Y-%m-%d').weekday()
+                for key in ('weekday' if weekday < 5 else 'weekend', 'day' if group.is_daytime else 'night'):
+                    period_stats[key][0] += group.noise_sum
+                    period_stats[key][1] += group.count
             
             # 计算各区域类型的统计
             region_type_analysis = {}
-            for region_type, values in region_type_stats.items():
+            for region_type, (noise_sum, count, min_noise, max_noise) in region_type_stats.items():
                 region_type_analysis[region_type] = {
-                    'avg_noise': round(sum(values) / len(values), 1),
-                    'max_noise': round(max(values), 1),
-                    'min_noise': round(min(values), 1),
-                    'count': len(values)
+                    'avg_noise': round(noise_sum / count, 1),
+                    'max_noise': round(max_noise, 1),
+                    'min_noise': round(min_noise, 1),
+                    'count': count
                 }
             
-            # 按工作日/周末分析
-            weekday_values = []
-            weekend_values = []
-            for noise_data, region in data:
-                if noise_data.Timestamp.weekday() < 5:
-                    weekday_values.append(noise_data.NoiseValue)
-                else:
-                    weekend_values.append(noise_data.NoiseValue)
+            def period_summary(key):
+                noise_sum, count = period_stats[key]
+                return {
+                    'avg_noise': round(noise_sum / count, 1) if count else 0,
+                    'count': count
+                }
             
+            # 按工作日/周末分析
             weekday_weekend_analysis = {
-                'weekday': {
-                    'avg_noise': round(sum(weekday_values) / len(weekday_values), 1) if weekday_values else 0,
-                    'count': len(weekday_values)
-                },
-                'weekend': {
-                    'avg_noise': round(sum(weekend_values) / len(weekend_values), 1) if weekend_values else 0,
-                    'count': len(weekend_values)
-                }
+                'weekday': period_summary('weekday'),
+                'weekend': period_summary('weekend')
             }
             
             # 按时间段分析（白天/夜间）
-            day_values = []
-            night_values = []
-            for noise_data, region in data:
-                hour = noise_data.Timestamp.hour
-                if 6 <= hour < 22:
-                    day_values.append(noise_data.NoiseValue)
-                else:
-                    night_values.append(noise_data.NoiseValue)
-            
             day_night_analysis = {
-                'day': {
-                    'avg_noise': round(sum(day_values) / len(day_values), 1) if day_values else 0,
-                    'count': len(day_values)
-                },
-                'night': {
-                    'avg_noise': round(sum(night_values) / len(night_values), 1) if night_values else 0,
-                    'count': len(night_values)
-                }
+                'day': period_summary('day'),
+                'night': period_summary('night')
             }
             
             return jsonify({
@@ -2274,151 +3995,316 @@ def analyze_correlation():
         return jsonify({'status': 'error', 'message': f'分析失败: {str(e)}'}), 500
 
 
+def log_hourly_summary(hour_start):
+    """记录指定小时各传感器的汇总数据（读取 hourly_rollup）"""
+    try:
+        with get_db_session() as session:
+            rollups = session.query(HourlyRollup).filter(HourlyRollup.HourStart == hour_start).all()
+            for rollup in rollups:
+                app.logger.info(
+                    f'每小时汇总 - 传感器 {rollup.SensorID} ({hour_start:%Y-%m-%d %H}:00): '
+                    f'平均={rollup.NoiseSum / rollup.SampleCount:.2f}dB, '
+                    f'最大={rollup.NoiseMax:.2f}dB, '
+                    f'最小={rollup.NoiseMin:.2f}dB, '
+                    f'数据点={rollup.SampleCount}, '
+                    f'超标={rollup.ExceedCount}'
+                )
+    except Exception as e:
+        app.logger.error(f'每小时汇总记录失败: {str(e)}')
+
+
+def prefetch_last_values(session, sensor_ids):
+    """用窗口查询取出各传感器最近一条读数，恢复模拟器的平滑状态（如服务重启后）"""
+    # 按块查询，避免 IN 列表超出数据库绑定参数数量限制
+    for i in range(0, len(sensor_ids), 500):
+        ranked = select(
+            RealtimeData.SensorID, RealtimeData.NoiseValue, RealtimeData.Timestamp,
+            func.row_number().over(
+                partition_by=RealtimeData.SensorID,
+                order_by=(RealtimeData.Timestamp.desc(), RealtimeData.DataID.desc())
+            ).label('row_number')
+        ).where(RealtimeData.SensorID.in_(sensor_ids[i:i + 500])).subquery()
+        
+        for sensor_id, noise_value, timestamp in session.execute(
+            select(ranked.c.SensorID, ranked.c.NoiseValue, ranked.c.Timestamp).where(ranked.c.row_number == 1)
+        ):
+            simulator.remember(sensor_id, noise_value, timestamp)
+
+
+def bulk_insert_ids(session, table, rows, key, lookup):
+    """批量插入 rows（不经过 ORM 单元提交），返回 {key 列的值: 自增主键}，key 在本批中须唯一
+    
+    支持 executemany + RETURNING 的数据库（SQLite、PostgreSQL）合并为多行 INSERT 并直接返回主键；
+    其他数据库（MySQL）executemany 插入后按 lookup 条件一次查回主键，只查插入前最大主键之后的行，
+    避免匹配到更早写入的同条件数据。lookup 中的值须与数据库实际存储的值一致（如 DATETIME 精度）。
+    """
+    if not rows:
+        return {}
+    connection = session.connection()
+    primary_key = list(table.primary_key.columns)[0]
+    if connection.dialect.insert_executemany_returning:
+        result = connection.execute(insert(table).returning(primary_key, table.c[key]), rows)
+    else:
+        floor = connection.execute(select(func.max(primary_key))).scalar() or 0
+        connection.execute(insert(table), rows)
+        result = connection.execute(select(primary_key, table.c[key]).where(lookup & (primary_key > floor)))
+    return {key_value: row_id for row_id, key_value in result}
+
+
+def generate_realtime_tick(session, current_time):
+    """为所有在线传感器生成一轮实时数据（不提交），返回生成条数
+    
+    传感器和监测点读取 sensor_registry；模拟器中缺少上次值的传感器用一次窗口查询预取；
+    全部读数向量化生成后一条批量 INSERT 写入，告警同样批量写入，小时汇总和实时推送
+    直接由本批数据更新，由调用方统一提交。语句数不随传感器数量增长。
+    """
+    sensors = [sensor for sensor in sensor_registry.sensors(session) if sensor.Status == '在线']
+    orphans = [sensor.SensorID for sensor in sensors if not sensor.point]
+    if orphans:
+        app.logger.warning(f'传感器 {", ".join(orphans)} 没有关联的监测点，跳过')
+        sensors = [sensor for sensor in sensors if sensor.point]
+    if not sensors:
+        return 0
+    
+    current_time = current_time.replace(microsecond=0)  # MySQL DATETIME 只保存到秒，按存储值回查主键
+    sensor_ids = [sensor.SensorID for sensor in sensors]
+    missing = [sensor_id for sensor_id in sensor_ids if simulator.last_value(sensor_id) is None]
+    if missing:
+        prefetch_last_values(session, missing)
+    
+    # 生成实时数据（基于各传感器上次值平滑波动，并记录本次值）
+    result = simulator.generate_batch_for_sensors(sensor_ids, [sensor.point.PointType for sensor in sensors], current_time)
+    rows = [
+        {
+            'NoiseValue': noise_value,
+            'Timestamp': current_time,
+            'FrequencySpectrum': json.dumps({'low': low, 'mid': mid, 'high': high}),
+            'DataQuality': data_quality,
+            'Temperature': temperature,
+            'Humidity': humidity,
+            'WindSpeed': wind_speed,
+            'WeatherCondition': weather,
+            'SensorID': sensor.SensorID,
+            'PointID': sensor.PointID
+        }
+        for sensor, noise_value, (low, mid, high), data_quality, temperature, humidity, wind_speed, weather in zip(
+            sensors, result['noise_value'].tolist(), result['frequency_analysis'].tolist(),
+            result['data_quality'].tolist(), result['temperature'].tolist(), result['humidity'].tolist(),
+            result['wind_speed'].tolist(), result['weather'].tolist()
+        )
+    ]
+    
+    # 每个传感器每轮一条读数，按传感器ID对应回自增主键
+    data_ids = bulk_insert_ids(
+        session, RealtimeData.__table__, rows, 'SensorID',
+        (RealtimeData.Timestamp == current_time) & RealtimeData.SensorID.in_(sensor_ids)
+    )
+    readings = [
+        StreamReading(data_ids[row['SensorID']], row['SensorID'], row['PointID'], row['NoiseValue'], current_time, row['DataQuality'])
+        for row in rows
+    ]
+    accumulate_hourly_rollups(session, [
+        (reading.SensorID, reading.PointID, reading.Timestamp, reading.NoiseValue) for reading in readings
+    ])
+    update_latest_readings(session.connection(), [
+        (reading.SensorID, reading.PointID, reading.Timestamp, reading.NoiseValue,
+         is_noise_exceeded(reading.NoiseValue, reading.Timestamp, sensor.point))
+        for reading, sensor in zip(readings, sensors)
+    ])
+    
+    # 检查告警（每条读数最多一条告警，按 DataID 对应回告警ID）
+    alert_rows = []
+    for reading, sensor in zip(readings, sensors):
+        level = get_alert_level(reading.NoiseValue, reading.Timestamp, sensor.point)
+        if level:
+            alert_rows.append({
+                'AlertLevel': level,
+                'TriggerTime': reading.Timestamp,
+                'AlertStatus': '未处理',
+                'AlertType': '噪音超标',
+                'DataID': reading.DataID
+            })
+    alert_ids = bulk_insert_ids(
+        session, AlertInfo.__table__, alert_rows, 'DataID',
+        AlertInfo.DataID.in_([row['DataID'] for row in alert_rows])
+    )
+    
+    # 不经过 ORM flush，直接登记本事务的推送数据，提交后统一推送
+    if stream_broadcaster.has_audience:
+        mark_local_stream_readings(reading.DataID for reading in readings)
+        session.info.setdefault('stream_readings', []).extend(readings)
+        session.info.setdefault('stream_alerts', {}).update({
+            row['DataID']: StreamAlert(alert_ids[row['DataID']], row['AlertLevel'], row['AlertType'], row['AlertStatus'], row['TriggerTime'])
+            for row in alert_rows
+        })
+    return len(readings)
+
+
+def run_acquisition_tick():
+    """采集任务：为所有在线传感器生成并提交一轮实时数据"""
+    current_time = datetime.now()
+    with get_db_session() as session:
+        generated_count = generate_realtime_tick(session, current_time)
+    
+    if generated_count:
+        app.logger.info(f'实时数据生成完成，共生成 {generated_count} 条数据')
+    else:
+        app.logger.warning('没有在线的传感器，跳过本次数据生成')
+
+
+def run_hourly_summary():
+    """小时汇总任务：整点后记录上一小时的汇总（数据写入时已累加到 hourly_rollup）"""
+    log_hourly_summary(datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=1))
+
+
+# 后台采集和小时汇总按单调时钟固定频率调度，执行耗时不会累积成周期漂移
+acquisition_task = PeriodicTask(
+    'acquisition', run_acquisition_tick, Config.REALTIME_INTERVAL_SECONDS, logger=app.logger
+)
+hourly_summary_task = PeriodicTask(
+    'hourly_summary', run_hourly_summary, 3600, align=True, logger=app.logger
+)
+
+
+# ==================== 后台任务选主 ====================
+
+# 多进程部署（如 gunicorn 多 worker）时，通过 worker_lease 表的租约保证只有一个进程执行采集和汇总任务
+GENERATION_LEASE = 'realtime_generation'
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+leader_state = {'last_renewed': None}  # 本进程最近一次成功续租的单调时钟时间
+
+
+def set_generation_enabled(session, enabled):
+    """设置后台任务的期望状态（所有进程共享），租约行不存在时创建"""
+    updated = session.query(WorkerLease).filter(
+        WorkerLease.LeaseName == GENERATION_LEASE
+    ).update({'Enabled': 1 if enabled else 0}, synchronize_session=False)
+    if updated:
+        return
+    try:
+        with session.begin_nested():
+            session.add(WorkerLease(LeaseName=GENERATION_LEASE, Enabled=1 if enabled else 0))
+    except IntegrityError:
+        # 其他进程同时创建了租约行
+        session.query(WorkerLease).filter(
+            WorkerLease.LeaseName == GENERATION_LEASE
+        ).update({'Enabled': 1 if enabled else 0}, synchronize_session=False)
+
+
+def claim_lease(session, holder_id, ttl, status=None):
+    """获取或续租：租约开启且无人持有、已过期或由本进程持有时成功（条件更新，多个进程同时争抢只有一个成功）"""
+    now = datetime.now()
+    values = {
+        'HolderID': holder_id,
+        'AcquiredAt': case((WorkerLease.HolderID == holder_id, WorkerLease.AcquiredAt), else_=now),
+        'RenewedAt': now,
+        'ExpiresAt': now + timedelta(seconds=ttl)
+    }
+    if status is not None:
+        values['Status'] = status
+    claimed = session.query(WorkerLease).filter(
+        WorkerLease.LeaseName == GENERATION_LEASE,
+        WorkerLease.Enabled == 1,
+        (WorkerLease.HolderID == holder_id) | WorkerLease.HolderID.is_(None) | (WorkerLease.ExpiresAt < now)
+    ).update(values, synchronize_session=False)
+    return claimed == 1
+
+
+def release_lease(session, holder_id):
+    """释放本进程持有的租约"""
+    session.query(WorkerLease).filter(
+        WorkerLease.LeaseName == GENERATION_LEASE,
+        WorkerLease.HolderID == holder_id
+    ).update({'HolderID': None, 'ExpiresAt': None, 'Status': None}, synchronize_session=False)
+
+
+def generation_task_stats():
+    return {
+        'acquisition': acquisition_task.stats(),
+        'hourly_summary': hourly_summary_task.stats()
+    }
+
+
+def stop_generation_tasks():
+    acquisition_task.stop()
+    hourly_summary_task.stop()
+
+
+def run_leader_election():
+    """选主任务：开启时争取或续租租约，持有租约的进程运行采集和汇总任务，失去租约或关闭时停止"""
+    try:
+        with get_db_session() as session:
+            lease = session.get(WorkerLease, GENERATION_LEASE)
+            if not lease or not lease.Enabled:
+                is_leader = False
+                release_lease(session, WORKER_ID)
+            else:
+                is_leader = claim_lease(
+                    session, WORKER_ID, Config.LEADER_LEASE_TTL,
+                    json.dumps(generation_task_stats(), ensure_ascii=False)
+                )
+    except Exception:
+        # 无法续租超过租约有效期时，其他进程可能已接管，停止本进程的任务
+        last_renewed = leader_state['last_renewed']
+        if last_renewed is not None and monotonic() - last_renewed > Config.LEADER_LEASE_TTL:
+            stop_generation_tasks()
+            leader_state['last_renewed'] = None
+        raise
+    
+    if is_leader:
+        leader_state['last_renewed'] = monotonic()
+        if acquisition_task.start():
+            app.logger.info(f'进程 {WORKER_ID} 获得后台任务租约，开始实时数据采集')
+        hourly_summary_task.start()
+    else:
+        leader_state['last_renewed'] = None
+        if acquisition_task.running:
+            app.logger.info(f'进程 {WORKER_ID} 不再持有后台任务租约，停止实时数据采集')
+        stop_generation_tasks()
+    return is_leader
+
+
+leader_election_task = PeriodicTask(
+    'leader_election', run_leader_election, Config.LEADER_LEASE_RENEW_SECONDS, logger=app.logger
+)
+
+
+@app.before_request
+def join_leader_election():
+    """每个进程处理第一个请求时加入选主，持有者退出后由其他进程接管"""
+    if Config.LEADER_ELECTION_AUTOSTART and not leader_election_task.running:
+        leader_election_task.start()
+
+
 @app.route('/api/realtime/generate', methods=['POST'])
 @log_request_time
 def start_realtime_generation():
-    """启动实时数据生成（后台任务）- 自动采集传感器数据"""
-    global realtime_generation_active, realtime_thread
-    
-    if realtime_generation_active:
-        return jsonify({
-            'status': 'info',
-            'message': '实时数据生成已在运行中'
-        }), 200
+    """启动实时数据生成（后台任务）- 自动采集传感器数据
     
-    def generate_realtime_data():
-        """后台生成实时数据 - 每30秒采集一次（支持平滑波动）"""
-        global realtime_generation_active, sensor_last_values
-        realtime_generation_active = True
+    开启状态写入租约表，由持有租约的进程执行采集，多进程部署时不会重复写入。
+    """
+    try:
+        with get_db_session() as session:
+            lease = session.get(WorkerLease, GENERATION_LEASE)
+            if lease and lease.Enabled and lease.ExpiresAt and lease.ExpiresAt > datetime.now():
+                return jsonify({
+                    'status': 'info',
+                    'message': '实时数据生成已在运行中',
+                    'leader_id': lease.HolderID
+                }), 200
+            set_generation_enabled(session, True)
         
-        while realtime_generation_active:
-            try:
-                current_time = datetime.now()
-                
-                with get_db_session() as session:
-                    # 获取所有在线传感器
-                    sensors = session.query(Sensor).filter_by(Status='在线').all()
-                    
-                    if not sensors:
-                        app.logger.warning('没有在线的传感器，跳过本次数据生成')
-                        sleep(60)
-                        continue
-                    
-                    app.logger.info(f'开始生成实时数据，传感器数量: {len(sensors)}')
-                    generated_count = 0
-                    
-                    for sensor in sensors:
-                        point = sensor.monitoring_point
-                        if not point:
-                            app.logger.warning(f'传感器 {sensor.SensorID} 没有关联的监测点，跳过')
-                            continue
-                        
-                        # 获取该传感器的上次值
-                        last_data = sensor_last_values.get(sensor.SensorID)
-                        previous_value = None
-                        time_since_last = None
-                        
-                        if last_data:
-                            previous_value = last_data['value']
-                            time_since_last = (current_time - last_data['timestamp']).total_seconds()
-                        else:
-                            # 如果没有历史数据，尝试从数据库获取最近一条记录
-                            last_record = session.query(RealtimeData).filter_by(
-                                SensorID=sensor.SensorID
-                            ).order_by(RealtimeData.Timestamp.desc()).first()
-                            
-                            if last_record:
-                                previous_value = last_record.NoiseValue
-                                time_since_last = (current_time - last_record.Timestamp).total_seconds()
-                        
-                        # 生成实时数据（支持基于历史数据的平滑波动）
-                        noise_data = simulator.generate_realistic_noise_data(
-                            region_type=point.PointType,
-                            time=current_time,
-                            location={'lng': point.Longitude, 'lat': point.Latitude},
-                            device_status=sensor.Status,
-                            previous_value=previous_value,
-                            time_since_last=time_since_last
-                        )
-                        
-                        # 保存到数据库
-                        realtime_record = RealtimeData(
-                            NoiseValue=noise_data['noise_value'],
-                            Timestamp=noise_data['timestamp'],
-                            FrequencySpectrum=json.dumps(noise_data['frequency_analysis']),
-                            DataQuality=noise_data['data_quality'],
-                            Temperature=noise_data.get('temperature'),
-                            Humidity=noise_data.get('humidity'),
-                            WindSpeed=noise_data.get('wind_speed'),
-                            WeatherCondition=noise_data.get('weather', 'normal'),
-                            SensorID=sensor.SensorID,
-                            PointID=point.PointID
-                        )
-                        session.add(realtime_record)
-                        session.flush()
-                        
-                        # 更新传感器的上次值
-                        sensor_last_values[sensor.SensorID] = {
-                            'value': noise_data['noise_value'],
-                            'timestamp': current_time
-                        }
-                        
-                        # 检查告警
-                        check_and_generate_alert(realtime_record, session)
-                        generated_count += 1
-                    
-                    # 提交所有数据
-                    session.commit()
-                    app.logger.info(f'实时数据生成完成，共生成 {generated_count} 条数据')
-                
-                # 每小时记录一次汇总数据（用于历史分析）
-                current_minute = current_time.minute
-                current_second = current_time.second
-                if current_minute == 0 and current_second < 30:
-                    # 每小时整点记录一次汇总数据
-                    try:
-                        with get_db_session() as session:
-                            # 获取所有传感器的最近一小时的平均值
-                            one_hour_ago = current_time - timedelta(hours=1)
-                            sensors_for_hourly = session.query(Sensor).filter_by(Status='在线').all()
-                            for sensor in sensors_for_hourly:
-                                # 计算该传感器最近一小时的平均值
-                                hourly_data = session.query(
-                                    func.avg(RealtimeData.NoiseValue).label('avg_noise'),
-                                    func.max(RealtimeData.NoiseValue).label('max_noise'),
-                                    func.min(RealtimeData.NoiseValue).label('min_noise'),
-                                    func.count(RealtimeData.DataID).label('data_count')
-                                ).filter(
-                                    RealtimeData.SensorID == sensor.SensorID,
-                                    RealtimeData.Timestamp >= one_hour_ago,
-                                    RealtimeData.Timestamp <= current_time
-                                ).first()
-                                
-                                if hourly_data and hourly_data.data_count > 0:
-                                    # 记录每小时汇总数据（可以保存到日志或单独的表）
-                                    app.logger.info(
-                                        f'每小时汇总 - 传感器 {sensor.SensorID}: '
-                                        f'平均={hourly_data.avg_noise:.2f}dB, '
-                                        f'最大={hourly_data.max_noise:.2f}dB, '
-                                        f'最小={hourly_data.min_noise:.2f}dB, '
-                                        f'数据点={hourly_data.data_count}'
-                                    )
-                    except Exception as e:
-                        app.logger.error(f'每小时汇总记录失败: {str(e)}')
-                
-                # 每30秒生成一次（实时采集）
-                sleep(30)
-                
-            except Exception as e:
-                app.logger.error(f'后台实时数据生成错误: {str(e)}', exc_info=True)
-                sleep(60)
-    
-    realtime_thread = threading.Thread(target=generate_realtime_data, daemon=True)
-    realtime_thread.start()
+        # 立即参与一次选主，之后由选主任务定期续租
+        run_leader_election()
+        leader_election_task.start()
+    except Exception as e:
+        app.logger.error(f'启动实时数据生成失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'启动失败: {str(e)}'}), 500
     
     return jsonify({
         'status': 'success',
-        'message': '实时数据采集已启动，每30秒采集一次'
+        'message': f'实时数据采集已启动，每{Config.REALTIME_INTERVAL_SECONDS}秒采集一次',
+        'leader_id': WORKER_ID if acquisition_task.running else None
     }), 200
 
 
@@ -2432,9 +4318,15 @@ def start_realtime_generation_endpoint():
 @app.route('/api/realtime/stop', methods=['POST'])
 @log_request_time
 def stop_realtime_generation():
-    """停止实时数据生成"""
-    global realtime_generation_active
-    realtime_generation_active = False
+    """停止实时数据生成（其他进程持有租约时，由其选主任务在下次续租时停止）"""
+    try:
+        with get_db_session() as session:
+            set_generation_enabled(session, False)
+            release_lease(session, WORKER_ID)
+        stop_generation_tasks()
+    except Exception as e:
+        app.logger.error(f'停止实时数据生成失败: {str(e)}')
+        return jsonify({'status': 'error', 'message': f'停止失败: {str(e)}'}), 500
     
     return jsonify({
         'status': 'success',
@@ -2445,16 +4337,27 @@ def stop_realtime_generation():
 @app.route('/api/realtime/status', methods=['GET'])
 @log_request_time
 def get_realtime_generation_status():
-    """获取实时数据生成状态"""
-    global realtime_generation_active, realtime_thread
+    """获取实时数据生成状态（含采集任务的耗时、延迟和跳过周期）
     
-    # 检查线程是否还在运行
-    thread_alive = realtime_thread is not None and realtime_thread.is_alive()
+    多进程部署时任意进程都返回租约持有者（leader）的状态，调度指标由持有者续租时写入租约表。
+    """
+    is_running = acquisition_task.running
+    scheduler_stats = generation_task_stats()
+    leader = None
     
     # 检查最近是否有数据生成
     recent_data_count = 0
     try:
         with get_db_session() as session:
+            lease = session.get(WorkerLease, GENERATION_LEASE)
+            if lease and lease.HolderID and lease.ExpiresAt and lease.ExpiresAt > datetime.now():
+                leader = lease.to_dict()
+                leader['is_self'] = lease.HolderID == WORKER_ID
+                if not leader['is_self']:
+                    is_running = bool(lease.Enabled)
+                    if lease.Status:
+                        scheduler_stats = json.loads(lease.Status)
+            
             # 检查最近1分钟内的数据
             one_minute_ago = datetime.now() - timedelta(minutes=1)
             recent_data_count = session.query(RealtimeData).filter(
@@ -2470,11 +4373,15 @@ def get_realtime_generation_status():
     return jsonify({
         'status': 'success',
         'data': {
-            'is_running': realtime_generation_active and thread_alive,
-            'thread_alive': thread_alive,
+            'is_running': is_running,
+            'thread_alive': acquisition_task.running,
             'recent_data_count': recent_data_count,
             'online_sensors': online_sensors,
-            'generation_interval': 30  # 秒
+            'generation_interval': Config.REALTIME_INTERVAL_SECONDS,  # 秒
+            'worker_id': WORKER_ID,
+            'leader': leader,
+            'scheduler': scheduler_stats,
+            'stream': stream_broadcaster.stats()
         }
     }), 200
 
@@ -2507,30 +4414,34 @@ def analyze_trend():
             if sensor_id:
                 query = query.filter(RealtimeData.SensorID == sensor_id)
             
-            data_list = query.order_by(RealtimeData.Timestamp).all()
+            hourly_buckets = aggregate_by_clock_hour(query)
             
-            if not data_list:
+            if not hourly_buckets:
                 return jsonify({
                     'status': 'error',
                     'message': '指定时间段内无数据'
                 }), 404
             
             # 计算统计指标
-            noise_values = [d.NoiseValue for d in data_list]
-            avg_noise = sum(noise_values) / len(noise_values)
-            max_noise = max(noise_values)
-            min_noise = min(noise_values)
+            total_count = sum(bucket[2] for bucket in hourly_buckets)
+            noise_sum = sum(bucket[1] for bucket in hourly_buckets)
+            avg_noise = noise_sum / total_count
+            max_noise = max(bucket[4] for bucket in hourly_buckets)
+            min_noise = min(bucket[3] for bucket in hourly_buckets)
             
             # 计算超标次数和超标率
-            exceed_count = sum(1 for d in data_list if d.is_exceeded)
-            exceed_rate = (exceed_count / len(data_list)) * 100 if data_list else 0
-            
-            # 计算趋势方向
-            if len(noise_values) >= 2:
-                first_half = noise_values[:len(noise_values)//2]
-                second_half = noise_values[len(noise_values)//2:]
-                first_avg = sum(first_half) / len(first_half)
-                second_avg = sum(second_half) / len(second_half)
+            exceed_count = sum(bucket[5] for bucket in hourly_buckets)
+            exceed_rate = (exceed_count / total_count) * 100
+            
+            # 计算趋势方向：按时间顺序前一半与后一半数据的平均值之差
+            if total_count >= 2:
+                half = total_count // 2
+                first_half = query.with_entities(
+                    RealtimeData.NoiseValue
+                ).order_by(RealtimeData.Timestamp).limit(half).subquery()
+                first_sum = session.query(func.sum(first_half.c.NoiseValue)).scalar()
+                first_avg = first_sum / half
+                second_avg = (noise_sum - first_sum) / (total_count - half)
                 
                 diff = second_avg - first_avg
                 if abs(diff) < 1:
@@ -2549,14 +4460,13 @@ def analyze_trend():
             
             # 分析高峰时段
             hour_noise = {}
-            for d in data_list:
-                hour = d.Timestamp.hour
-                if hour not in hour_noise:
-                    hour_noise[hour] = []
-                hour_noise[hour].append(d.NoiseValue)
+            for hour_start, bucket_sum, count, _, _, _ in hourly_buckets:
+                stats = hour_noise.setdefault(hour_start.hour, [0.0, 0])
+                stats[0] += bucket_sum
+                stats[1] += count
             
             peak_hours = sorted(
-                [(h, sum(vals)/len(vals)) for h, vals in hour_noise.items()],
+                [(h, total / count) for h, (total, count) in hour_noise.items()],
                 key=lambda x: x[1],
                 reverse=True
             )[:3]  # 取前3个高峰时段
@@ -2578,8 +4488,8 @@ def analyze_trend():
                 TrendRate=round(trend_rate, 4),
                 PeakHours=json.dumps(peak_hours),
                 AnalysisResult=json.dumps({
-                    'total_data_points': len(data_list),
-                    'hourly_distribution': {h: len(vals) for h, vals in hour_noise.items()}
+                    'total_data_points': total_count,
+                    'hourly_distribution': {h: count for h, (_, count) in hour_noise.items()}
                 })
             )
             session.add(analysis_result)
@@ -2597,7 +4507,7 @@ def analyze_trend():
                     'trend_direction': trend_direction,
                     'trend_rate': round(trend_rate, 4),
                     'peak_hours': peak_hours,
-                    'total_data_points': len(data_list)
+                    'total_data_points': total_count
                 }
             }), 200
             
@@ -2775,12 +4685,22 @@ if __name__ == '__main__':
     # 配置日志
     setup_logging(app)
     
-    # 创建数据库表（如果不存在）
+    # 创建数据库表和索引，升级后首次启动时根据历史数据重建小时汇总和最新读数
+    with migration_lock:
+        try:
+            migrate_database()
+            app.logger.info("数据库表已创建/验证")
+        except Exception as e:
+            app.logger.error(f"数据库迁移失败: {e}")
+        migration_state['done'] = True
+    
+    # 恢复上次退出时未完成的报告任务
     try:
-        Base.metadata.create_all(engine)
-        app.logger.info("数据库表已创建/验证")
+        recovered_count = recover_report_jobs()
+        if recovered_count:
+            app.logger.info(f"已恢复 {recovered_count} 个报告任务")
     except Exception as e:
-        app.logger.error(f"数据库表创建失败: {e}")
+        app.logger.error(f"恢复报告任务失败: {e}")
     
     # 初始化数据库（如果为空）
     try:
@@ -2806,9 +4726,10 @@ if __name__ == '__main__':
             else:
                 app.logger.info(f"检测到 {online_sensor_count} 个在线传感器，准备启动实时数据生成")
         
-        # 启动实时数据生成
-        start_realtime_generation()
-        app.logger.info("实时数据生成已自动启动，每30秒采集一次")
+        # 启动实时数据生成（开启状态写入租约表，由选主决定哪个进程执行采集）
+        with app.app_context():
+            start_realtime_generation()
+        app.logger.info(f"实时数据生成已自动启动，每{Config.REALTIME_INTERVAL_SECONDS}秒采集一次")
     except Exception as e:
         app.logger.warning(f"自动启动实时数据生成失败: {e}，可以稍后手动调用 /api/realtime/start")
     
@@ -0,0 +1,333 @@
+"""
+历史数据回填脚本 - 城市噪音污染监测管理平台
+按指定的城市、监测点、传感器规模批量生成数月到数年的历史数据，用于在本地构造接近生产规模的数据表，
+对分析接口做性能测试。
+
+数据由 SmartNoiseSimulator.generate_batch 按时间步逐步生成（同一时刻的全部传感器一次向量化计算），
+读数、告警和小时汇总均分块用 Core 批量写入，不经过 ORM 会话；结束时用最后几个时间步的读数更新最新读数表。
+回填时显式分配 DataID，请勿与实时数据采集同时运行。
+
+用法:
+    python backfill_data.py --cities 4 --points-per-city 25 --sensors-per-point 2 --days 90
+    DATABASE_URL=mysql+pymysql://... python backfill_data.py --start 2024-01-01 --end 2025-01-01 --seed 42
+"""
+import argparse
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from time import monotonic
+
+import numpy as np
+from sqlalchemy import func, insert, select
+
+from app import app, engine, get_alert_level, get_db_session, get_noise_threshold, migrate_database, upsert_hourly_rollups, update_latest_readings
+from app import City, MonitoringPoint, Sensor, RealtimeData, AlertInfo, SchemaMigration
+from config import Config
+from smart_noise_simulator import SmartNoiseSimulator
+
+# 监测点类型轮换使用（与 monitoring_point 表的检查约束一致）
+POINT_TYPES = ['住宅区', '商业区', '工业区', '文教区', '混合区', '交通干线']
+
+# 监测点阈值（get_noise_threshold / get_alert_level 只读取这两个字段），字段也可以是按传感器排列的数组
+PointThreshold = namedtuple('PointThreshold', ['NoiseThresholdDay', 'NoiseThresholdNight'])
+
+
+def create_benchmark_sensors(session, cities, points_per_city, sensors_per_point, prefix='BM', rng=None, created_at=None):
+    """创建（或复用）基准测试用的城市、监测点和传感器
+
+    编码规则：城市“基准城市{prefix}001”，监测点 {prefix}001P0001，传感器 {prefix}001P0001S01。
+    已存在的记录直接复用，重复运行不会新建重复数据。
+    created_at 用作新建记录的创建/安装时间（默认当前时间），固定后相同种子生成的元数据也完全一致。
+    rng 只用于生成坐标，不要传入模拟器的随机数生成器：坐标只在新建时抽取，共用时读数会随库中已有数据变化。
+
+    返回:
+        list: [(SensorID, PointID, PointType, NoiseThresholdDay, NoiseThresholdNight)]
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    created_at = created_at or datetime.now()
+    existing_points = {
+        point.PointCode: point
+        for point in session.query(MonitoringPoint).filter(MonitoringPoint.PointCode.like(f'{prefix}%'))
+    }
+    existing_sensors = {
+        sensor_id for (sensor_id,) in session.query(Sensor.SensorID).filter(Sensor.SensorID.like(f'{prefix}%'))
+    }
+
+    sensors = []
+    for c in range(1, cities + 1):
+        city_name = f'基准城市{prefix}{c:03d}'
+        city = session.query(City).filter_by(CityName=city_name).first()
+        if city is None:
+            city = City(CityName=city_name, Province='基准测试', CreatedAt=created_at)
+            session.add(city)
+            session.flush()
+        center_lng, center_lat = rng.uniform(100, 120), rng.uniform(22, 40)
+
+        for p in range(1, points_per_city + 1):
+            point_code = f'{prefix}{c:03d}P{p:04d}'
+            point = existing_points.get(point_code)
+            if point is None:
+                point_type = POINT_TYPES[(p - 1) % len(POINT_TYPES)]
+                point = MonitoringPoint(
+                    PointName=f'{city_name}监测点{p}',
+                    PointCode=point_code,
+                    PointType=point_type,
+                    Longitude=round(center_lng + rng.uniform(-0.3, 0.3), 6),
+                    Latitude=round(center_lat + rng.uniform(-0.3, 0.3), 6),
+                    District=f'区县{(p - 1) % 10 + 1}',
+                    CityID=city.CityID,
+                    NoiseThresholdDay=60.0 if point_type != '文教区' else 55.0,
+                    NoiseThresholdNight=50.0 if point_type != '文教区' else 45.0,
+                    CreatedAt=created_at,
+                    UpdatedAt=created_at
+                )
+                session.add(point)
+                session.flush()
+
+            for s in range(1, sensors_per_point + 1):
+                sensor_id = f'{point_code}S{s:02d}'
+                if sensor_id not in existing_sensors:
+                    session.add(Sensor(
+                        SensorID=sensor_id,
+                        SensorName=f'{point.PointName}传感器{s}',
+                        SensorModel='NS-2000',
+                        Status='在线',
+                        BatteryLevel=85,
+                        SignalStrength=90,
+                        SamplingRate=1,
+                        PointID=point.PointID,
+                        InstallDate=created_at,
+                        CreatedAt=created_at,
+                        UpdatedAt=created_at
+                    ))
+                sensors.append((
+                    sensor_id, point.PointID, point.PointType,
+                    point.NoiseThresholdDay, point.NoiseThresholdNight
+                ))
+    session.flush()
+    return sensors
+
+
+class HourlyAccumulator:
+    """按传感器累加当前小时的统计量，小时切换或写入分块时输出 hourly_rollup 增量"""
+
+    def __init__(self, sensor_ids, point_ids):
+        self.sensor_ids = sensor_ids
+        self.point_ids = point_ids
+        self.hour_start = None
+        self._reset()
+
+    def _reset(self):
+        n = len(self.sensor_ids)
+        self.noise_sum = np.zeros(n)
+        self.energy_sum = np.zeros(n)
+        self.noise_min = np.full(n, np.inf)
+        self.noise_max = np.full(n, -np.inf)
+        self.sample_count = 0
+        self.exceed_count = np.zeros(n, dtype=np.int64)
+
+    def add(self, hour_start, values, exceeded):
+        """累加一个时间步的读数，进入新的小时时返回上一小时的汇总行"""
+        rows = []
+        if hour_start != self.hour_start:
+            rows = self.drain()
+            self.hour_start = hour_start
+        self.noise_sum += values
+        self.energy_sum += 10 ** (values / 10)
+        np.minimum(self.noise_min, values, out=self.noise_min)
+        np.maximum(self.noise_max, values, out=self.noise_max)
+        self.exceed_count += exceeded
+        self.sample_count += 1
+        return rows
+
+    def drain(self):
+        """输出当前已累加的汇总行并清零（同一小时之后的增量由 upsert 合并）"""
+        if not self.sample_count:
+            return []
+        rows = [
+            {
+                'SensorID': sensor_id, 'PointID': point_id, 'HourStart': self.hour_start,
+                'NoiseSum': noise_sum, 'SampleCount': self.sample_count,
+                'NoiseMin': noise_min, 'NoiseMax': noise_max,
+                'EnergySum': energy_sum, 'ExceedCount': exceed_count
+            }
+            for sensor_id, point_id, noise_sum, noise_min, noise_max, energy_sum, exceed_count in zip(
+                self.sensor_ids, self.point_ids, self.noise_sum.tolist(), self.noise_min.tolist(),
+                self.noise_max.tolist(), self.energy_sum.tolist(), self.exceed_count.tolist()
+            )
+        ]
+        self._reset()
+        return rows
+
+
+def write_chunk(connection, readings, alerts, rollups):
+    """在一个事务内批量写入一块读数、告警和小时汇总"""
+    if readings:
+        connection.execute(insert(RealtimeData.__table__), readings)
+    if alerts:
+        connection.execute(insert(AlertInfo.__table__), alerts)
+    if rollups:
+        upsert_hourly_rollups(connection, rollups)
+
+
+def backfill_history(db_engine, sensors, start_time, end_time, interval=300, simulator=None,
+                     chunk_rows=50000, with_rollups=True, on_progress=None):
+    """生成 [start_time, end_time) 内每 interval 秒一次的历史读数并批量写入
+
+    参数:
+        db_engine: 目标数据库引擎
+        sensors: create_benchmark_sensors 返回的传感器列表
+        start_time, end_time: 回填时间范围
+        interval: 采集间隔（秒）
+        simulator: SmartNoiseSimulator 实例（可选），使用固定种子的模拟器可生成完全相同的数据
+        chunk_rows: 每个事务写入的读数条数
+        with_rollups: 是否同时维护 hourly_rollup
+        on_progress: 进度回调，参数为 (已写入读数, 已写入告警, 当前时间)
+
+    返回:
+        tuple: (读数条数, 告警条数)
+    """
+    simulator = simulator or SmartNoiseSimulator()
+    if not sensors:
+        return 0, 0
+
+    sensor_ids = [sensor[0] for sensor in sensors]
+    point_ids = [sensor[1] for sensor in sensors]
+    region_types = [sensor[2] for sensor in sensors]
+    points = [PointThreshold(sensor[3], sensor[4]) for sensor in sensors]
+    thresholds = PointThreshold(
+        np.array([sensor[3] for sensor in sensors], dtype=float),
+        np.array([sensor[4] for sensor in sensors], dtype=float)
+    )
+    n = len(sensors)
+
+    with db_engine.connect() as connection:
+        next_id = (connection.execute(select(func.max(RealtimeData.DataID))).scalar() or 0) + 1
+
+    accumulator = HourlyAccumulator(sensor_ids, point_ids)
+    tail = deque(maxlen=Config.POINT_RECENT_WINDOW)  # 最后几个时间步，足以覆盖每个监测点最近 N 条读数
+    readings, alerts, rollups = [], [], []
+    reading_total = alert_total = 0
+    step = timedelta(seconds=interval)
+    current = start_time
+
+    while current < end_time:
+        # 平滑过渡所需的各传感器上次值由模拟器维护
+        result = simulator.generate_batch_for_sensors(sensor_ids, region_types, current)
+        values = result['noise_value']
+
+        # 超标判断和告警级别（与 build_alert 使用同一套规则）
+        exceeded = values > get_noise_threshold(thresholds, current)
+        data_ids = range(next_id, next_id + n)
+        next_id += n
+
+        frequency = result['frequency_analysis'].tolist()
+        readings.extend(
+            {
+                'DataID': data_id, 'NoiseValue': value, 'Timestamp': current,
+                'FrequencySpectrum': f'{{"low": {low}, "mid": {mid}, "high": {high}}}',
+                'DataQuality': quality, 'Temperature': temperature, 'Humidity': humidity,
+                'WindSpeed': wind_speed, 'WeatherCondition': weather,
+                'SensorID': sensor_id, 'PointID': point_id
+            }
+            for data_id, value, (low, mid, high), quality, temperature, humidity, wind_speed, weather, sensor_id, point_id
+            in zip(
+                data_ids, values.tolist(), frequency, result['data_quality'].tolist(),
+                result['temperature'].tolist(), result['humidity'].tolist(), result['wind_speed'].tolist(),
+                result['weather'].tolist(), sensor_ids, point_ids
+            )
+        )
+
+        alerts.extend(
+            {
+                'AlertLevel': get_alert_level(values[i], current, points[i]), 'TriggerTime': current,
+                'AlertStatus': '未处理', 'AlertType': '噪音超标', 'DataID': data_ids[i]
+            }
+            for i in np.flatnonzero(exceeded).tolist()
+        )
+
+        if with_rollups:
+            rollups.extend(accumulator.add(current.replace(minute=0, second=0, microsecond=0), values, exceeded))
+        tail.append((current, values, exceeded))
+
+        current += step
+        if len(readings) >= chunk_rows or current >= end_time:
+            if with_rollups:
+                rollups.extend(accumulator.drain())
+            with db_engine.begin() as connection:
+                write_chunk(connection, readings, alerts, rollups)
+            reading_total += len(readings)
+            alert_total += len(alerts)
+            readings, alerts, rollups = [], [], []
+            if on_progress:
+                on_progress(reading_total, alert_total, current)
+
+    with db_engine.begin() as connection:
+        update_latest_readings(connection, [
+            (sensor_id, point_id, timestamp, value, is_exceeded)
+            for timestamp, values, exceeded in tail
+            for sensor_id, point_id, value, is_exceeded in zip(sensor_ids, point_ids, values.tolist(), exceeded.tolist())
+        ])
+    return reading_total, alert_total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='批量生成历史噪音数据（性能测试用）')
+    parser.add_argument('--cities', type=int, default=4, help='城市数量（默认：4）')
+    parser.add_argument('--points-per-city', type=int, default=10, help='每个城市的监测点数量（默认：10）')
+    parser.add_argument('--sensors-per-point', type=int, default=1, help='每个监测点的传感器数量（默认：1）')
+    parser.add_argument('--days', type=int, default=30, help='回填最近多少天（未指定 --start 时使用，默认：30）')
+    parser.add_argument('--start', help='开始日期，格式 YYYY-MM-DD')
+    parser.add_argument('--end', help='结束日期（不含），格式 YYYY-MM-DD，默认今天')
+    parser.add_argument('--interval', type=int, default=300, help='采集间隔（秒，默认：300）')
+    parser.add_argument('--seed', type=int, help='随机数种子，相同种子生成相同数据')
+    parser.add_argument('--chunk-size', type=int, default=50000, help='每个事务写入的读数条数（默认：50000）')
+    parser.add_argument('--prefix', default='BM', help='基准测试监测点和传感器的编码前缀（默认：BM）')
+    parser.add_argument('--no-rollups', action='store_true', help='不维护小时汇总表（下次启动服务或执行 flask --app app migrate-db 时重建）')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.interval <= 0 or args.chunk_size <= 0:
+        raise SystemExit('--interval 和 --chunk-size 必须为正数')
+
+    end_time = datetime.strptime(args.end, '%Y-%m-%d') if args.end else datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_time = datetime.strptime(args.start, '%Y-%m-%d') if args.start else end_time - timedelta(days=args.days)
+    if start_time >= end_time:
+        raise SystemExit('开始日期必须早于结束日期')
+
+    simulator = SmartNoiseSimulator(seed=args.seed)
+    migrate_database()
+    with get_db_session() as session:
+        # 坐标使用单独的随机数生成器，库中已有监测点时读数仍与全新数据库一致
+        sensors = create_benchmark_sensors(
+            session, args.cities, args.points_per_city, args.sensors_per_point, args.prefix,
+            rng=np.random.default_rng(args.seed), created_at=start_time
+        )
+
+    steps = -(-int((end_time - start_time).total_seconds()) // args.interval)
+    print(f'传感器数量: {len(sensors)}，时间范围: {start_time} 至 {end_time}，预计读数: {steps * len(sensors)}')
+
+    started = monotonic()
+
+    def report(reading_count, alert_count, current):
+        elapsed = monotonic() - started
+        print(f'已写入 {reading_count} 条读数、{alert_count} 条告警（进度 {current:%Y-%m-%d %H:%M}，'
+              f'{reading_count / elapsed * 60:.0f} 条/分钟）')
+
+    reading_count, alert_count = backfill_history(
+        engine, sensors, start_time, end_time,
+        interval=args.interval, simulator=simulator, chunk_rows=args.chunk_size,
+        with_rollups=not args.no_rollups, on_progress=report
+    )
+    print(f'回填完成：读数 {reading_count} 条，告警 {alert_count} 条，耗时 {monotonic() - started:.1f} 秒')
+    if args.no_rollups:
+        # 小时汇总缺少回填的数据，清除迁移记录，下次迁移时重建
+        with get_db_session() as session:
+            session.query(SchemaMigration).filter_by(Name='hourly_rollup').delete()
+        print('小时汇总未包含回填数据，将在下次数据库迁移时重建')
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        main()
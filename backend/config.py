@@ -23,6 +23,7 @@ class Config:
         SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///noise_monitoring.db')
     
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', 'True').lower() == 'true'  # 进程收到第一个请求时自动执行数据库迁移
     
     # 日志配置
     LOG_DIR = os.getenv('LOG_DIR', 'logs')
@@ -30,7 +31,42 @@ class Config:
     LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10240))
     LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 10))
     
+    # 数据接入配置
+    INGEST_BATCH_MAX_SIZE = int(os.getenv('INGEST_BATCH_MAX_SIZE', 5000))  # 批量上传单批最大条数
+    INGEST_MODE = os.getenv('INGEST_MODE', 'sync')  # sync: 请求内同步写入; buffered: 写入队列后台分组提交
+    INGEST_QUEUE_MAX_SIZE = int(os.getenv('INGEST_QUEUE_MAX_SIZE', 100000))  # 写入队列最大长度
+    INGEST_FLUSH_ROWS = int(os.getenv('INGEST_FLUSH_ROWS', 500))  # 累计多少条提交一次
+    INGEST_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_FLUSH_INTERVAL_MS', 200))  # 最长多少毫秒提交一次
+    INGEST_MAX_RETRIES = int(os.getenv('INGEST_MAX_RETRIES', 3))  # 整批提交失败后的最多重试次数，仍失败时逐条写入
+    INGEST_RETRY_BACKOFF_MS = int(os.getenv('INGEST_RETRY_BACKOFF_MS', 100))  # 第一次重试前等待的毫秒数，之后每次翻倍
+    SENSOR_REGISTRY_TTL = int(os.getenv('SENSOR_REGISTRY_TTL', 300))  # 传感器元数据缓存最长有效期（秒）
+    SENSOR_REGISTRY_MISS_RELOAD_SECONDS = float(os.getenv('SENSOR_REGISTRY_MISS_RELOAD_SECONDS', 1))  # 缓存未命中时重新加载的最小间隔（秒）
+    POINT_RECENT_WINDOW = int(os.getenv('POINT_RECENT_WINDOW', 10))  # 监测点滚动平均使用的最近读数条数（地图展示）
+    
+    # 实时数据流配置
+    STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 100))  # 每个SSE连接最多缓存的帧数，超出后丢弃最旧的帧
+    STREAM_KEEPALIVE_SECONDS = int(os.getenv('STREAM_KEEPALIVE_SECONDS', 15))  # 无数据时发送保活注释的间隔
+    STREAM_REPLAY_SECONDS = int(os.getenv('STREAM_REPLAY_SECONDS', 300))  # 断线重连可补发最近多少秒的帧
+    STREAM_REPLAY_MAX_FRAMES = int(os.getenv('STREAM_REPLAY_MAX_FRAMES', 1000))  # 补发缓冲最多保留的帧数
+    STREAM_RELAY_INTERVAL_SECONDS = float(os.getenv('STREAM_RELAY_INTERVAL_SECONDS', 1))  # 多进程部署时转发其他进程写入数据的间隔（秒），0 表示不转发
+    STREAM_RELAY_BATCH_SIZE = int(os.getenv('STREAM_RELAY_BATCH_SIZE', 1000))  # 每次最多转发的条数
+    STREAM_RELAY_GAP_SECONDS = int(os.getenv('STREAM_RELAY_GAP_SECONDS', 10))  # DataID 缺口（未提交的事务）最长等待秒数
+    
+    # 报告任务配置
+    REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))  # 报告生成工作线程数
+    REPORT_JOB_MAX_PENDING = int(os.getenv('REPORT_JOB_MAX_PENDING', 100))  # 未完成任务数上限
+    REPORT_JOB_TIMEOUT = int(os.getenv('REPORT_JOB_TIMEOUT', 3600))  # 进行中任务超过该秒数没有汇报进度视为中断，恢复时重新排队
+    REPORT_JOB_RECOVERY_SECONDS = int(os.getenv('REPORT_JOB_RECOVERY_SECONDS', 60))  # 定期恢复中断/遗留任务的间隔（秒），0 表示只在启动时恢复
+    
+    # 模拟数据配置
+    REALTIME_INTERVAL_SECONDS = int(os.getenv('REALTIME_INTERVAL_SECONDS', 30))  # 后台实时数据采集间隔（秒）
+    SIMULATOR_SEED = int(os.getenv('SIMULATOR_SEED')) if os.getenv('SIMULATOR_SEED') else None  # 模拟器随机数种子，未设置时每次运行不同
+    LEADER_LEASE_TTL = int(os.getenv('LEADER_LEASE_TTL', 30))  # 后台任务租约有效期（秒），持有者超时未续租时其他进程接管
+    LEADER_LEASE_RENEW_SECONDS = int(os.getenv('LEADER_LEASE_RENEW_SECONDS', 10))  # 续租/争抢租约的间隔（秒），应明显小于有效期
+    LEADER_ELECTION_AUTOSTART = os.getenv('LEADER_ELECTION_AUTOSTART', 'True').lower() == 'true'  # 进程收到第一个请求时自动加入选主
+    
     # 缓存配置
     CACHE_TYPE = os.getenv('CACHE_TYPE', 'simple')
     CACHE_DEFAULT_TIMEOUT = int(os.getenv('CACHE_DEFAULT_TIMEOUT', 300))
+    COUNT_CACHE_TTL = int(os.getenv('COUNT_CACHE_TTL', 30))  # 列表接口总数的缓存时间（秒），exact=true 时不使用缓存
 
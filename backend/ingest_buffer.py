@@ -0,0 +1,193 @@
+"""
+写入缓冲（write-behind）
+接口线程只负责把读数放入有界队列，后台写入线程按“满 N 条或每 T 毫秒”批量提交；
+提交失败时按退避间隔重试，仍失败时逐条写入，只丢弃逐条写入也失败的数据
+"""
+
+import queue
+import threading
+from time import monotonic, sleep
+
+
+_WAKEUP = object()  # 停止时用于唤醒正在等待的写入线程
+
+
+class IngestBuffer:
+    """有界写入队列 + 单写入线程的分组提交"""
+
+    def __init__(self, write_batch, max_size=100000, flush_rows=500, flush_interval_ms=200,
+                 max_retries=3, retry_backoff_ms=100, logger=None):
+        """
+        参数:
+            write_batch: 批量写入函数，接收一批队列元素，在一个事务内写入并提交
+            max_size: 队列最大长度，队列满时拒绝写入
+            flush_rows: 累计多少条触发一次提交
+            flush_interval_ms: 最长等待多少毫秒触发一次提交
+            max_retries: 整批写入失败后的最多重试次数（如数据库锁冲突、死锁等暂时性错误）
+            retry_backoff_ms: 第一次重试前的等待毫秒数，之后每次翻倍
+            logger: 日志记录器（可选）
+        """
+        self.write_batch = write_batch
+        self.max_size = max_size
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff_ms / 1000.0
+        self.logger = logger
+
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 运行指标
+        self._enqueued = 0
+        self._rejected = 0
+        self._written = 0
+        self._failed = 0
+        self._retries = 0
+        self._row_fallbacks = 0
+        self._flush_count = 0
+        self._flush_total_ms = 0.0
+        self._last_flush_ms = None
+        self._max_flush_ms = 0.0
+        self._last_flush_rows = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动写入线程（重复调用无副作用）"""
+        with self._lock:
+            if self.running:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, item):
+        """放入一条数据，队列已满时返回False"""
+        return self.submit_many([item]) == 1
+
+    def submit_many(self, items):
+        """按顺序放入多条数据，返回成功放入的条数（队列满后剩余数据被拒绝）"""
+        self.start()
+        accepted = 0
+        for item in items:
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                break
+            accepted += 1
+        with self._lock:
+            self._enqueued += accepted
+            self._rejected += len(items) - accepted
+        return accepted
+
+    def stop(self, timeout=30):
+        """停止写入线程，退出前写完队列中剩余的数据"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop_event.set()
+        try:
+            self._queue.put_nowait(_WAKEUP)
+        except queue.Full:
+            pass  # 队列非空，写入线程不会阻塞等待
+        thread.join(timeout)
+        if thread.is_alive() and self.logger:
+            self.logger.warning(f'写入线程未能在 {timeout} 秒内完成排空，剩余 {self._queue.qsize()} 条')
+
+    def _collect(self):
+        """收集一批数据：满 flush_rows 条或等待超过 flush_interval 即返回"""
+        batch = []
+        deadline = monotonic() + self.flush_interval
+        while len(batch) < self.flush_rows:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _WAKEUP:
+                break
+            batch.append(item)
+        return batch
+
+    def _write_with_retry(self, batch):
+        """整批写入，失败时按指数退避重试，返回是否写入成功"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.write_batch(batch)
+                return True
+            except Exception as e:
+                if attempt == self.max_retries:
+                    if self.logger:
+                        self.logger.error(f'批量写入 {len(batch)} 条数据失败（已重试 {attempt} 次）: {str(e)}', exc_info=True)
+                    return False
+                if self.logger:
+                    self.logger.warning(f'批量写入 {len(batch)} 条数据失败，第 {attempt + 1} 次重试: {str(e)}')
+                with self._lock:
+                    self._retries += 1
+                sleep(self.retry_backoff * 2 ** attempt)
+
+    def _write_rows(self, batch):
+        """整批重试仍失败时逐条写入，单条错误数据不影响同批其他数据，返回写入成功的条数"""
+        written = 0
+        for item in batch:
+            try:
+                self.write_batch([item])
+                written += 1
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'逐条写入失败，丢弃 1 条数据: {str(e)}')
+        return written
+
+    def _flush(self, batch):
+        started = monotonic()
+        if self._write_with_retry(batch):
+            written = len(batch)
+        else:
+            with self._lock:
+                self._row_fallbacks += 1
+            written = self._write_rows(batch)
+        elapsed_ms = (monotonic() - started) * 1000
+
+        with self._lock:
+            self._written += written
+            self._failed += len(batch) - written
+            self._flush_count += 1
+            self._flush_total_ms += elapsed_ms
+            self._last_flush_ms = elapsed_ms
+            self._last_flush_rows = len(batch)
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self._queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+
+    def stats(self):
+        """获取队列深度和提交耗时等指标"""
+        with self._lock:
+            return {
+                'running': self.running,
+                'queue_depth': self._queue.qsize(),
+                'queue_capacity': self.max_size,
+                'flush_rows': self.flush_rows,
+                'flush_interval_ms': round(self.flush_interval * 1000),
+                'enqueued': self._enqueued,
+                'rejected': self._rejected,
+                'written': self._written,
+                'failed': self._failed,
+                'retries': self._retries,
+                'row_fallbacks': self._row_fallbacks,
+                'flush_count': self._flush_count,
+                'last_flush_rows': self._last_flush_rows,
+                'last_flush_ms': round(self._last_flush_ms, 2) if self._last_flush_ms is not None else None,
+                'avg_flush_ms': round(self._flush_total_ms / self._flush_count, 2) if self._flush_count else None,
+                'max_flush_ms': round(self._max_flush_ms, 2)
+            }
@@ -0,0 +1,179 @@
+"""
+周期任务调度（单调时钟、固定频率）
+按计划时间而不是“上次完成时间 + 间隔”安排下一次执行，任务耗时不会累积成周期漂移；
+执行超时错过的周期直接跳过并计数，不会补跑。对齐任务按系统时间确定周期起点，每个周期最多执行一次。
+"""
+
+import threading
+from datetime import datetime, timedelta
+from time import monotonic
+
+
+class PeriodicTask:
+    """在独立线程中按固定频率执行的任务"""
+
+    def __init__(self, name, func, interval, align=False, logger=None):
+        """
+        参数:
+            name: 任务名称（用于线程名和日志）
+            func: 每次执行调用的函数（无参数）
+            interval: 执行间隔（秒）
+            align: 是否对齐到整点周期（如 interval=3600 时每个整点执行），按系统时间计算
+            logger: 日志记录器（可选）
+        """
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.align = align
+        self.logger = logger
+
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._next_run = None
+        self._boundary = None  # 对齐任务：下一次执行对应的周期起点（系统时间）
+        self._last_boundary = None  # 对齐任务：最近一次已执行的周期起点
+
+        # 运行指标
+        self._runs = 0
+        self._failures = 0
+        self._skipped = 0
+        self._overruns = 0
+        self._total_ms = 0.0
+        self._last_ms = None
+        self._max_ms = 0.0
+        self._last_lag_ms = None
+        self._max_lag_ms = 0.0
+        self._last_started_at = None
+        self._last_error = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动任务线程，已在运行时返回False
+        
+        已调用 stop() 但线程还没退出（正在执行本次任务）时撤销停止，由原线程继续按计划执行，
+        线程是否退出在锁内决定，不会出现新旧两个线程同时执行或任务停止后无法再启动。
+        """
+        with self._lock:
+            if self.running:
+                if not self._stop_event.is_set():
+                    return False
+                self._stop_event.clear()
+                return True
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=f'task-{self.name}', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self, timeout=None):
+        """停止任务（正在执行的一次会执行完）"""
+        thread = self._thread
+        self._stop_event.set()
+        if thread is not None and timeout is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _first_run(self):
+        if not self.align:
+            return monotonic()
+        self._boundary = self._next_boundary()
+        return monotonic() + self._seconds_to_boundary()
+
+    def _next_boundary(self):
+        """下一个对齐周期起点（按系统时间），不早于已执行周期的下一个周期"""
+        now = datetime.now()
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (now - midnight).total_seconds()
+        boundary = midnight + timedelta(seconds=(elapsed // self.interval + 1) * self.interval)
+        if self._last_boundary is not None:
+            boundary = max(boundary, self._last_boundary + timedelta(seconds=self.interval))
+        return boundary
+
+    def _seconds_to_boundary(self):
+        """距离下一个对齐周期起点（按系统时间）的秒数"""
+        boundary = self._boundary or self._next_boundary()
+        return max(0.0, (boundary - datetime.now()).total_seconds())
+
+    def _schedule_next(self, scheduled):
+        """计算下一次计划执行时间，已错过的周期跳过"""
+        if self.align:
+            # 对齐任务每次按系统时间重新计算周期起点，避免单调时钟与系统时间的偏差累积
+            self._last_boundary = self._boundary
+            self._boundary = self._next_boundary()
+            return monotonic() + self._seconds_to_boundary()
+        next_run = scheduled + self.interval
+        now = monotonic()
+        if next_run <= now:
+            missed = int((now - next_run) // self.interval) + 1
+            with self._lock:
+                self._skipped += missed
+            next_run += missed * self.interval
+        return next_run
+
+    def _run(self):
+        scheduled = self._first_run()
+        while True:
+            with self._lock:
+                # 在锁内决定是否退出，与 start() 撤销停止互斥
+                if self._stop_event.is_set():
+                    self._thread = None
+                    self._next_run = None
+                    return
+                self._next_run = scheduled
+            if self._stop_event.wait(max(0.0, scheduled - monotonic())):
+                continue
+            if self.align and self._seconds_to_boundary() > 0:
+                # 单调时钟比系统时间走得快时会在周期起点前醒来，等到系统时间到达周期起点再执行
+                scheduled = monotonic() + self._seconds_to_boundary()
+                continue
+            self._execute(scheduled)
+            scheduled = self._schedule_next(scheduled)
+
+    def _execute(self, scheduled):
+        started = monotonic()
+        lag_ms = (started - scheduled) * 1000
+        error = None
+        try:
+            self.func()
+        except Exception as e:
+            error = str(e)
+            if self.logger:
+                self.logger.error(f'周期任务 {self.name} 执行失败: {error}', exc_info=True)
+        elapsed_ms = (monotonic() - started) * 1000
+
+        with self._lock:
+            self._runs += 1
+            self._total_ms += elapsed_ms
+            self._last_ms = elapsed_ms
+            self._max_ms = max(self._max_ms, elapsed_ms)
+            self._last_lag_ms = lag_ms
+            self._max_lag_ms = max(self._max_lag_ms, lag_ms)
+            self._last_started_at = datetime.now() - timedelta(milliseconds=elapsed_ms)
+            if elapsed_ms > self.interval * 1000:
+                self._overruns += 1
+            if error:
+                self._failures += 1
+                self._last_error = error
+
+    def stats(self):
+        """获取执行耗时、延迟和跳过周期等指标"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'running': self.running,
+                'interval_seconds': self.interval,
+                'runs': self._runs,
+                'failures': self._failures,
+                'skipped_ticks': self._skipped,
+                'overruns': self._overruns,
+                'last_duration_ms': round(self._last_ms, 2) if self._last_ms is not None else None,
+                'avg_duration_ms': round(self._total_ms / self._runs, 2) if self._runs else None,
+                'max_duration_ms': round(self._max_ms, 2),
+                'last_lag_ms': round(self._last_lag_ms, 2) if self._last_lag_ms is not None else None,
+                'max_lag_ms': round(self._max_lag_ms, 2),
+                'last_started_at': self._last_started_at.isoformat() if self._last_started_at else None,
+                'next_run_in_seconds': round(max(0.0, self._next_run - monotonic()), 3) if self._next_run is not None else None,
+                'last_error': self._last_error
+            }
@@ -7,12 +7,27 @@ import random
 import math
 from datetime import datetime, timedelta
 
+import numpy as np
+
 
 class SmartNoiseSimulator:
     """智能噪音数据模拟器"""
     
-    def __init__(self):
-        """初始化模拟器"""
+    def __init__(self, seed=None, rng=None):
+        """
+        初始化模拟器
+        
+        参数:
+            seed: 随机数种子（可选），相同种子和相同调用顺序生成完全相同的数据
+            rng: numpy.random.Generator（可选），批量生成使用，未指定时由 seed 创建
+        """
+        # 单条生成使用 random.Random，批量生成使用 numpy Generator，均不依赖全局随机状态
+        self._random = random.Random(seed)
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+        
+        # 各传感器的上次噪音值和时间（用于平滑过渡）{sensor_id: (value, timestamp)}
+        self._last_values = {}
+        
         # 不同区域类型的基础噪音值（分贝）
         self.base_noise_levels = {
             '居住区': 45.0,
@@ -33,6 +48,15 @@ class SmartNoiseSimulator:
             '混合区': (40.0, 65.0)
         }
         
+        # 天气状况及对应的温度、湿度范围（批量生成使用，与 _generate_weather_data 一致）
+        self.weather_conditions = ['normal', 'sunny', 'cloudy', 'rainy', 'windy']
+        self.weather_ranges = {
+            'sunny': ((20, 30), (40, 60)),
+            'rainy': ((15, 25), (70, 90)),
+            'windy': ((18, 28), (50, 70))
+        }
+        self.default_weather_range = ((18, 26), (50, 70))
+        
         # 时段系数（0-1之间，影响噪音水平）
         self.time_coefficients = {
             'morning': (6, 8, 1.2),      # 早高峰 (6-8点)
@@ -64,7 +88,7 @@ class SmartNoiseSimulator:
         adjusted_base = base * coefficient
         
         # 添加随机波动（±5分贝）
-        noise = adjusted_base + random.uniform(-5, 5)
+        noise = adjusted_base + self._random.uniform(-5, 5)
         
         # 确保在合理范围内
         min_noise, max_noise = self.noise_ranges.get(region_type, (40.0, 70.0))
@@ -86,7 +110,7 @@ class SmartNoiseSimulator:
             if abs(diff) > max_change:
                 if diff > 0:
                     return previous_value + max_change
-        else:
+                else:
                     return previous_value - max_change
         
         # 如果距离上次时间较长，允许较大变化，但仍有平滑
@@ -106,9 +130,9 @@ class SmartNoiseSimulator:
         """生成频率分析数据"""
         # 模拟不同频率段的能量分布
         frequencies = {
-            'low': random.uniform(0.2, 0.4),      # 低频 (20-200Hz)
-            'mid': random.uniform(0.3, 0.5),      # 中频 (200-2000Hz)
-            'high': random.uniform(0.2, 0.4)      # 高频 (2000-20000Hz)
+            'low': self._random.uniform(0.2, 0.4),      # 低频 (20-200Hz)
+            'mid': self._random.uniform(0.3, 0.5),      # 中频 (200-2000Hz)
+            'high': self._random.uniform(0.2, 0.4)      # 高频 (2000-20000Hz)
         }
         
         # 归一化
@@ -130,7 +154,7 @@ class SmartNoiseSimulator:
             return '较差'
         
         # 添加一些随机性，模拟真实情况
-        quality_rand = random.random()
+        quality_rand = self._random.random()
         if quality_rand < 0.7:
             return '优秀'
         elif quality_rand < 0.9:
@@ -141,29 +165,29 @@ class SmartNoiseSimulator:
     def _generate_weather_data(self):
         """生成天气相关数据"""
         weather_conditions = ['normal', 'sunny', 'cloudy', 'rainy', 'windy']
-        weather = random.choice(weather_conditions)
+        weather = self._random.choice(weather_conditions)
         
         # 根据天气生成温度和湿度
         if weather == 'sunny':
-            temperature = random.uniform(20, 30)
-            humidity = random.uniform(40, 60)
+            temperature = self._random.uniform(20, 30)
+            humidity = self._random.uniform(40, 60)
         elif weather == 'rainy':
-            temperature = random.uniform(15, 25)
-            humidity = random.uniform(70, 90)
+            temperature = self._random.uniform(15, 25)
+            humidity = self._random.uniform(70, 90)
         elif weather == 'windy':
-            temperature = random.uniform(18, 28)
-            humidity = random.uniform(50, 70)
-            wind_speed = random.uniform(5, 15)
+            temperature = self._random.uniform(18, 28)
+            humidity = self._random.uniform(50, 70)
+            wind_speed = self._random.uniform(5, 15)
         else:
-            temperature = random.uniform(18, 26)
-            humidity = random.uniform(50, 70)
-            wind_speed = random.uniform(0, 5)
+            temperature = self._random.uniform(18, 26)
+            humidity = self._random.uniform(50, 70)
+            wind_speed = self._random.uniform(0, 5)
         
         return {
             'weather': weather,
             'temperature': round(temperature, 1),
             'humidity': round(humidity, 1),
-            'wind_speed': round(wind_speed, 1) if weather == 'windy' else round(random.uniform(0, 5), 1)
+            'wind_speed': round(wind_speed, 1) if weather == 'windy' else round(self._random.uniform(0, 5), 1)
         }
     
     def generate_realistic_noise_data(self, region_type, time, location=None, 
@@ -193,7 +217,7 @@ class SmartNoiseSimulator:
             noise_value = base_noise
         
         # 添加一些随机波动（±2分贝）
-        noise_value += random.uniform(-2, 2)
+        noise_value += self._random.uniform(-2, 2)
         
         # 确保在合理范围内
         min_noise, max_noise = self.noise_ranges.get(region_type, (40.0, 70.0))
@@ -201,7 +225,7 @@ class SmartNoiseSimulator:
         
         # 如果设备不在线，数据质量降低
         if device_status != '在线':
-            noise_value = random.uniform(0, 30)  # 异常低值
+            noise_value = self._random.uniform(0, 30)  # 异常低值
         
         # 生成频率分析
         frequency_analysis = self._generate_frequency_analysis(noise_value)
@@ -225,4 +249,148 @@ class SmartNoiseSimulator:
         }
         
         return result
-
+    
+    def _time_coefficients_for_hours(self, hours):
+        """按小时数组计算时段系数"""
+        return np.select(
+            [(hours >= 6) & (hours < 8), (hours >= 8) & (hours < 18), (hours >= 18) & (hours < 22)],
+            [self.time_coefficients['morning'][2], self.time_coefficients['day'][2], self.time_coefficients['evening'][2]],
+            default=self.time_coefficients['night'][2]
+        )
+    
+    def generate_batch(self, region_types, times, previous_values=None, time_since_last=None,
+                       rng=None, device_statuses=None):
+        """
+        批量生成噪音数据（NumPy 向量化，规则与 generate_realistic_noise_data 一致）
+        
+        参数:
+            region_types: 各传感器的区域类型序列（长度 N）
+            times: 采集时间，单个 datetime（所有传感器相同）或长度为 N 的 datetime 序列
+            previous_values: 各传感器上次的噪音值（长度 N，无上次值用 None 或 NaN，可选）
+            time_since_last: 各传感器距离上次的时间（秒，长度 N，未知用 None 或 NaN，可选）
+            rng: numpy.random.Generator（可选，默认使用模拟器自身的 rng）
+            device_statuses: 各传感器的设备状态（长度 N，可选，默认全部在线）
+        
+        返回:
+            dict: 各字段均为长度 N 的 NumPy 数组；frequency_analysis 为 N×3 数组，列依次为 low、mid、high
+        """
+        rng = rng if rng is not None else self.rng
+        region_types = np.asarray(region_types, dtype=object)
+        n = len(region_types)
+        
+        # 区域参数：按不同区域类型查表后展开到每个传感器
+        regions, region_codes = np.unique(region_types, return_inverse=True)
+        base = np.array([self.base_noise_levels.get(r, 50.0) for r in regions])[region_codes]
+        ranges = np.array([self.noise_ranges.get(r, (40.0, 70.0)) for r in regions]).reshape(-1, 2)[region_codes]
+        min_noise, max_noise = ranges[:, 0], ranges[:, 1]
+        
+        # 时段系数
+        if isinstance(times, datetime):
+            hours = np.full(n, times.hour)
+        else:
+            hours = np.fromiter((t.hour for t in times), dtype=np.int64, count=n)
+        
+        # 基础噪音值：基础值 * 时段系数 ± 5分贝，限制在区域范围内
+        noise = base * self._time_coefficients_for_hours(hours) + rng.uniform(-5, 5, n)
+        noise = np.clip(noise, min_noise, max_noise)
+        
+        # 平滑过渡：1分钟内最大变化 5分贝/分钟，5分钟内最大变化 10分贝
+        if previous_values is not None:
+            previous = np.array([np.nan if v is None else v for v in previous_values], dtype=float)
+            if time_since_last is None:
+                elapsed = np.full(n, np.nan)
+            else:
+                elapsed = np.array([np.nan if v is None else v for v in time_since_last], dtype=float)
+            with np.errstate(invalid='ignore'):
+                max_change = np.where(
+                    (elapsed > 0) & (elapsed < 60), elapsed / 60.0 * 5.0,
+                    np.where((elapsed > 0) & (elapsed < 300), 10.0, np.inf)
+                )
+            has_previous = ~np.isnan(previous)
+            smoothed = previous + np.clip(noise - previous, -max_change, max_change)
+            noise = np.where(has_previous, smoothed, noise)
+        
+        # 随机波动（±2分贝），限制在合理范围内
+        noise = np.clip(noise + rng.uniform(-2, 2, n), min_noise - 5, max_noise + 5)
+        
+        # 设备不在线时为异常低值
+        if device_statuses is None:
+            online = np.ones(n, dtype=bool)
+        else:
+            online = np.asarray(device_statuses, dtype=object) == '在线'
+            noise = np.where(online, noise, rng.uniform(0, 30, n))
+        
+        # 频率分析：低、中、高频能量占比归一化
+        frequency = np.column_stack([
+            rng.uniform(0.2, 0.4, n),
+            rng.uniform(0.3, 0.5, n),
+            rng.uniform(0.2, 0.4, n)
+        ])
+        frequency /= frequency.sum(axis=1, keepdims=True)
+        
+        # 数据质量
+        quality_rand = rng.random(n)
+        data_quality = np.select(
+            [~online, (noise < min_noise - 10) | (noise > max_noise + 10), quality_rand < 0.7, quality_rand < 0.9],
+            ['无效', '较差', '优秀', '良好'],
+            default='一般'
+        ).astype(object)
+        
+        # 天气：按天气状况查温度、湿度范围
+        weather_codes = rng.integers(0, len(self.weather_conditions), n)
+        weather_bounds = np.array([
+            self.weather_ranges.get(w, self.default_weather_range) for w in self.weather_conditions
+        ], dtype=float)[weather_codes]  # N×2×2：(温度, 湿度) × (下限, 上限)
+        temperature = weather_bounds[:, 0, 0] + rng.random(n) * (weather_bounds[:, 0, 1] - weather_bounds[:, 0, 0])
+        humidity = weather_bounds[:, 1, 0] + rng.random(n) * (weather_bounds[:, 1, 1] - weather_bounds[:, 1, 0])
+        windy = weather_codes == self.weather_conditions.index('windy')
+        wind_speed = np.where(windy, rng.uniform(5, 15, n), rng.uniform(0, 5, n))
+        
+        return {
+            'noise_value': np.round(noise, 2),
+            'timestamp': np.full(n, times, dtype=object) if isinstance(times, datetime) else np.asarray(times, dtype=object),
+            'frequency_analysis': frequency,
+            'data_quality': data_quality,
+            'temperature': np.round(temperature, 1),
+            'humidity': np.round(humidity, 1),
+            'wind_speed': np.round(wind_speed, 1),
+            'weather': np.array(self.weather_conditions, dtype=object)[weather_codes]
+        }
+    
+    def remember(self, sensor_id, value, timestamp):
+        """记录传感器的上次噪音值（例如服务重启后从数据库恢复）"""
+        self._last_values[sensor_id] = (value, timestamp)
+    
+    def last_value(self, sensor_id):
+        """获取传感器的上次噪音值和时间 (value, timestamp)，没有时返回None"""
+        return self._last_values.get(sensor_id)
+    
+    def reset_state(self):
+        """清空全部传感器的平滑状态"""
+        self._last_values.clear()
+    
+    def generate_for_sensor(self, sensor_id, region_type, time, location=None, device_status='在线'):
+        """按传感器的上次值平滑生成一条数据，并记录本次值"""
+        last = self._last_values.get(sensor_id)
+        previous_value, time_since_last = (last[0], (time - last[1]).total_seconds()) if last else (None, None)
+        noise_data = self.generate_realistic_noise_data(
+            region_type, time,
+            location=location,
+            device_status=device_status,
+            previous_value=previous_value,
+            time_since_last=time_since_last
+        )
+        self._last_values[sensor_id] = (noise_data['noise_value'], time)
+        return noise_data
+    
+    def generate_batch_for_sensors(self, sensor_ids, region_types, time, device_statuses=None):
+        """按各传感器的上次值批量生成同一时刻的数据（见 generate_batch），并记录本次值"""
+        lasts = [self._last_values.get(sensor_id) for sensor_id in sensor_ids]
+        previous_values = [last[0] if last else None for last in lasts]
+        time_since_last = [(time - last[1]).total_seconds() if last else None for last in lasts]
+        result = self.generate_batch(
+            region_types, time, previous_values, time_since_last, device_statuses=device_statuses
+        )
+        for sensor_id, value in zip(sensor_ids, result['noise_value'].tolist()):
+            self._last_values[sensor_id] = (value, time)
+        return result
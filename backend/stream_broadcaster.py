@@ -0,0 +1,326 @@
+"""
+实时数据广播（Server-Sent Events）
+发布方每批数据只序列化一次，再分发到各订阅方的有界队列；慢速客户端只会丢弃自己最旧的帧，不会阻塞发布方。
+最近发布的帧保存在内存环形缓冲中，断线重连的客户端按 Last-Event-ID 补发错过的帧。
+
+订阅方可以按区县、监测点、传感器过滤，并可选择紧凑格式：
+连接时先收到一个 meta 快照（传感器短整数索引及静态信息），之后的 delta 帧只包含各传感器相对该订阅方
+上次发送的值发生变化的字段，字段顺序见 COMPACT_FIELDS / META_FIELDS。新传感器的 meta 帧不进入有界队列，
+不会因慢速客户端丢帧而丢失；紧凑格式的队列溢出时清空队列并推送 gap 事件，之后每个传感器重新发送全部字段。
+"""
+
+import json
+import queue
+import threading
+from collections import deque, namedtuple
+from time import monotonic, time
+
+
+# 紧凑格式的字段顺序
+COMPACT_FIELDS = ['index', 'noise_value', 'timestamp', 'is_exceeded', 'data_quality', 'alert_level']
+META_FIELDS = ['index', 'sensor_id', 'sensor_name', 'point_id', 'point_name', 'point_code', 'district']
+
+# 一条推送数据：过滤字段 + 预先序列化好的 JSON 片段（完整格式、紧凑格式、传感器元数据）
+# compact 为 COMPACT_FIELDS 中除 index 外各字段的 JSON 片段元组
+StreamItem = namedtuple('StreamItem', ['sensor_id', 'point_id', 'district', 'index', 'full', 'compact', 'meta'])
+
+# 一次发布：所有订阅方共用同一批 JSON 片段，frame 为未过滤的完整格式帧
+StreamBatch = namedtuple('StreamBatch', ['seq', 'published_at', 'timestamp', 'items', 'frame'])
+
+
+def sse_frame(data, event_id=None, event=None):
+    """组装一个SSE帧"""
+    lines = []
+    if event:
+        lines.append(f'event: {event}')
+    if event_id:
+        lines.append(f'id: {event_id}')
+    lines.append(f'data: {data}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def full_payload(fragments, timestamp):
+    """用预先序列化的片段拼接完整格式的数据"""
+    return f'{{"status": "success", "data": [{",".join(fragments)}], "timestamp": {json.dumps(timestamp)}}}'
+
+
+def matches_filters(filters, sensor_id, point_id, district):
+    """判断数据是否满足订阅条件（各条件同时满足，未指定的条件不限制）"""
+    if not filters:
+        return True
+    return (
+        ('sensor_id' not in filters or sensor_id in filters['sensor_id']) and
+        ('point_id' not in filters or point_id in filters['point_id']) and
+        ('district' not in filters or district in filters['district'])
+    )
+
+
+class Subscriber:
+    """单个SSE连接的有界帧队列"""
+
+    def __init__(self, queue_size, filters=None, compact=False):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._backlog = deque()  # 连接时的快照和重连补发的帧，先于队列中的帧发送
+        self._meta = deque()  # 紧凑格式下新传感器的元数据帧，不随队列丢帧，先于队列中的帧发送
+        self.filters = filters or None
+        self.compact = compact
+        self.known_indexes = set()  # 紧凑格式下已发送过元数据的传感器索引
+        self.sent_values = {}  # 紧凑格式下已发送给客户端的各传感器字段 {索引: JSON片段元组}
+        self.dropped = 0
+        self.gaps = 0
+
+    def render(self, batch, event_id):
+        """按订阅条件和格式生成该批数据的帧，返回 (新传感器元数据帧, 数据帧)，没有匹配的数据时返回None
+
+        元数据帧只在紧凑格式下出现新传感器时非空。
+        """
+        items = batch.items
+        if self.filters:
+            items = [item for item in items if matches_filters(self.filters, item.sensor_id, item.point_id, item.district)]
+            if not items:
+                return None
+        elif not self.compact:
+            return '', batch.frame
+
+        if not self.compact:
+            return '', sse_frame(full_payload([item.full for item in items], batch.timestamp), event_id)
+
+        # 紧凑格式的 delta 帧依赖客户端已收到之前的帧，队列已满时不能只丢最旧的一帧
+        if self._queue.full():
+            self._resync()
+
+        # 紧凑格式：先补发新出现的传感器元数据，再发送只含变化字段的 delta 帧
+        meta_frame = ''
+        new_meta = []
+        for item in items:
+            if item.index not in self.known_indexes:
+                self.known_indexes.add(item.index)
+                new_meta.append(item.meta)
+        if new_meta:
+            meta_frame = sse_frame(f'{{"snapshot": false, "sensors": [{",".join(new_meta)}]}}', event='meta')
+        entries = [entry for entry in (self._delta_entry(item) for item in items) if entry]
+        if not entries:
+            return None
+        data = f'{{"t": {json.dumps(batch.timestamp)}, "d": [{",".join(entries)}]}}'
+        return meta_frame, sse_frame(data, event_id, 'delta')
+
+    def _delta_entry(self, item):
+        """生成一个传感器的 delta 数组 [索引, 字段掩码, 变化的字段...]，没有字段变化时返回None
+
+        字段掩码第 i 位表示 COMPACT_FIELDS[i + 1] 是否包含在数组中；客户端未收到过的传感器发送全部字段。
+        """
+        previous = self.sent_values.get(item.index)
+        mask = 0
+        changed = []
+        for position, fragment in enumerate(item.compact):
+            if previous is None or previous[position] != fragment:
+                mask |= 1 << position
+                changed.append(fragment)
+        self.sent_values[item.index] = item.compact
+        if not mask:
+            return None
+        return f'[{item.index},{mask},{",".join(changed)}]'
+
+    def _resync(self):
+        """紧凑格式的队列溢出：清空队列中的 delta 帧，推送不会被丢弃的 gap 事件，之后每个传感器重新发送全部字段"""
+        dropped = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+                dropped += 1
+            except queue.Empty:
+                break
+        self.dropped += dropped
+        self.gaps += 1
+        self.sent_values.clear()
+        gap = json.dumps({'status': 'gap', 'dropped': dropped, 'message': '客户端接收过慢，部分实时数据已丢弃'}, ensure_ascii=False)
+        self._meta.append(sse_frame(gap, event='gap'))
+
+    def offer(self, meta_frame, frame):
+        """放入一帧，队列已满时丢弃最旧的一帧（紧凑格式在 render 时已清空队列）；元数据帧单独保存，不会被丢弃"""
+        if meta_frame:
+            self._meta.append(meta_frame)
+        while True:
+            try:
+                self._queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def _take_meta(self):
+        frames = []
+        while self._meta:
+            frames.append(self._meta.popleft())
+        return ''.join(frames)
+
+    def get(self, timeout=None):
+        """取出一帧，超时返回None"""
+        if self._backlog:
+            return self._backlog.popleft()
+        meta = self._take_meta()
+        try:
+            frame = self._queue.get_nowait() if meta else self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return meta or None
+        # 发布方先保存元数据帧再入队，取到的帧引用的传感器元数据此时一定已在 _meta 中
+        return meta + self._take_meta() + frame
+
+
+class StreamBroadcaster:
+    """单发布方、多订阅方的SSE广播"""
+
+    def __init__(self, queue_size=100, replay_seconds=300, replay_max_frames=1000):
+        """
+        参数:
+            queue_size: 每个订阅方最多缓存的帧数
+            replay_seconds: 环形缓冲保留最近多少秒的帧
+            replay_max_frames: 环形缓冲最多保留的帧数
+        """
+        self.queue_size = queue_size
+        self.replay_seconds = replay_seconds
+        self.replay_max_frames = replay_max_frames
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+        # 事件ID为“进程标识-序号”，进程重启后旧ID不会被误认为连续
+        self._epoch = format(int(time() * 1000), 'x')
+        self._seq = 0
+        self._history = deque()  # [StreamBatch]
+        self._idle_since = None  # 最后一个订阅方断开的时间
+
+        # 运行指标
+        self._published = 0
+        self._total_subscribed = 0
+        self._replayed = 0
+        self._resets = 0
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    @property
+    def has_audience(self):
+        """是否需要发布：有订阅方，或最后一个订阅方断开未超过补发窗口（可能正在重连）"""
+        if self._subscribers:
+            return True
+        return self._idle_since is not None and monotonic() - self._idle_since <= self.replay_seconds
+
+    @property
+    def last_event_id(self):
+        return self._event_id(self._seq) if self._seq else None
+
+    def _event_id(self, seq):
+        return f'{self._epoch}-{seq}'
+
+    def subscribe(self, last_event_id=None, filters=None, compact=False, snapshot=None):
+        """新增订阅方（不做任何数据库操作）
+
+        参数:
+            last_event_id: 重连时最后收到的事件ID，先补发环形缓冲中该ID之后的帧；缓冲已不包含
+                断线期间的全部帧时，先发送一个 reset 事件，提示客户端重新加载完整数据
+            filters: 订阅条件 {'district': set, 'point_id': set, 'sensor_id': set}
+            compact: 是否使用紧凑格式
+            snapshot: 紧凑格式连接时发送的传感器元数据 [(索引, 元数据JSON片段)]
+        """
+        with self._lock:
+            subscriber = Subscriber(self.queue_size, filters, compact)
+            if compact:
+                snapshot = snapshot or []
+                subscriber.known_indexes.update(index for index, _ in snapshot)
+                subscriber._backlog.append(sse_frame(
+                    f'{{"snapshot": true, "fields": {json.dumps(COMPACT_FIELDS)}, '
+                    f'"sensor_fields": {json.dumps(META_FIELDS)}, '
+                    f'"sensors": [{",".join(meta for _, meta in snapshot)}]}}',
+                    event='meta'
+                ))
+            if last_event_id:
+                subscriber._backlog.extend(self._replay(subscriber, last_event_id))
+            self._subscribers.add(subscriber)
+            self._total_subscribed += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._idle_since = monotonic()
+
+    def publish(self, items, timestamp):
+        """发布一批数据（StreamItem 列表）并分发给所有订阅方，返回收到数据的订阅方数量
+
+        未过滤的完整格式订阅方共用同一个帧；其余订阅方只拼接预先序列化好的片段，不会重复序列化。
+        """
+        with self._lock:
+            self._seq += 1
+            event_id = self._event_id(self._seq)
+            now = monotonic()
+            batch = StreamBatch(self._seq, now, timestamp, items, sse_frame(full_payload([item.full for item in items], timestamp), event_id))
+            self._history.append(batch)
+            self._trim(now)
+            self._published += 1
+
+            # 在锁内分发（入队不阻塞），保证每个订阅方收到的帧按序号递增
+            delivered = 0
+            for subscriber in self._subscribers:
+                rendered = subscriber.render(batch, event_id)
+                if rendered is not None:
+                    subscriber.offer(*rendered)
+                    delivered += 1
+            return delivered
+
+    def _trim(self, now):
+        while self._history and (
+            len(self._history) > self.replay_max_frames or
+            now - self._history[0].published_at > self.replay_seconds
+        ):
+            self._history.popleft()
+
+    def _replay(self, subscriber, last_event_id):
+        """返回 last_event_id 之后需要补发给该订阅方的帧（调用方持有锁）"""
+        self._trim(monotonic())
+        epoch, _, seq = str(last_event_id).rpartition('-')
+        try:
+            seq = int(seq)
+        except ValueError:
+            seq = None
+
+        oldest_seq = self._history[0].seq if self._history else self._seq + 1
+        frames = []
+        if epoch != self._epoch or seq is None or seq < oldest_seq - 1:
+            # 断线太久或服务已重启：补发缓冲中的全部帧，并提示客户端重新加载
+            self._resets += 1
+            reset = json.dumps({'status': 'reset', 'message': '部分实时数据已过期，请重新加载'}, ensure_ascii=False)
+            frames.append(sse_frame(reset, event='reset'))
+            seq = 0
+
+        for batch in self._history:
+            if batch.seq > seq:
+                rendered = subscriber.render(batch, self._event_id(batch.seq))
+                if rendered is not None:
+                    frames.append(''.join(rendered))
+                    self._replayed += 1
+        return frames
+
+    def stats(self):
+        """获取订阅数、丢帧数和补发缓冲等指标"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            return {
+                'subscribers': len(subscribers),
+                'filtered_subscribers': sum(1 for subscriber in subscribers if subscriber.filters),
+                'compact_subscribers': sum(1 for subscriber in subscribers if subscriber.compact),
+                'total_subscribed': self._total_subscribed,
+                'published': self._published,
+                'queue_size': self.queue_size,
+                'dropped_frames': sum(subscriber.dropped for subscriber in subscribers),
+                'gap_resyncs': sum(subscriber.gaps for subscriber in subscribers),
+                'last_event_id': self.last_event_id,
+                'replay_buffer_frames': len(self._history),
+                'replay_seconds': self.replay_seconds,
+                'replayed_frames': self._replayed,
+                'replay_resets': self._resets
+            }
@@ -12,10 +12,16 @@ from sqlalchemy.orm import sessionmaker
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import app, Base, get_db_session, City, MonitoringPoint, Sensor, SystemUser, RealtimeData, AlertInfo
+# 测试中不自动迁移数据库、不自动加入后台任务选主、不定期恢复报告任务、不转发其他进程的推送数据，由用例显式控制
+os.environ.setdefault('AUTO_MIGRATE', 'False')
+os.environ.setdefault('LEADER_ELECTION_AUTOSTART', 'False')
+os.environ.setdefault('REPORT_JOB_RECOVERY_SECONDS', '0')
+os.environ.setdefault('STREAM_RELAY_INTERVAL_SECONDS', '0')
 
+from app import app, cache, Base, get_db_session, engine as app_engine, Session as AppSession, sensor_registry, City, MonitoringPoint, Sensor, SystemUser, RealtimeData, AlertInfo
 
-@pytest.fixture(scope='session')
+
+@pytest.fixture
 def test_db():
     """创建测试数据库"""
     # 使用临时数据库文件
@@ -28,6 +34,7 @@ def test_db():
     yield engine, db_path
     
     # 清理
+    engine.dispose()
     os.close(db_fd)
     if os.path.exists(db_path):
         os.unlink(db_path)
@@ -55,9 +62,12 @@ def client(test_db):
     """创建测试客户端"""
     engine, _ = test_db
     
-    # 临时修改应用的数据库URI
+    # 临时修改应用的数据库URI，并让应用会话绑定到测试数据库
     original_uri = app.config['SQLALCHEMY_DATABASE_URI']
     app.config['SQLALCHEMY_DATABASE_URI'] = str(engine.url)
+    AppSession.configure(bind=engine)
+    sensor_registry.invalidate()
+    cache.clear()  # 接口缓存和列表总数缓存不能跨测试数据库复用
     
     # 重新创建数据库表
     Base.metadata.create_all(engine)
@@ -67,6 +77,7 @@ def client(test_db):
         yield client
     
     # 恢复原始配置
+    AppSession.configure(bind=app_engine)
     app.config['SQLALCHEMY_DATABASE_URI'] = original_uri
 
 
@@ -48,6 +48,33 @@ class TestAlertsAPI:
         data = response.get_json()
         assert data['status'] == 'success'
     
+    def test_get_alerts_cursor_pagination(self, client, db_session, sample_realtime_data):
+        """测试游标分页按触发时间倒序遍历全部告警，触发时间相同时按告警ID排序"""
+        trigger_time = datetime(2025, 6, 1, 12, 0, 0)
+        for minutes in [0, 0, 0, 5, 10]:
+            db_session.add(AlertInfo(
+                AlertLevel='高',
+                TriggerTime=trigger_time.replace(minute=minutes),
+                DataID=sample_realtime_data.DataID
+            ))
+        db_session.commit()
+        expected = [alert.AlertID for alert in db_session.query(AlertInfo).order_by(
+            AlertInfo.TriggerTime.desc(), AlertInfo.AlertID.desc()
+        )]
+        
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = client.get('/api/alerts', query_string={'cursor': cursor, 'per_page': 2}).get_json()
+            assert data['status'] == 'success'
+            assert 'total' not in data['pagination']
+            seen.extend(alert['alert_id'] for alert in data['alerts'])
+            cursor = data['pagination']['next_cursor']
+        assert seen == expected
+        
+        data = client.get('/api/alerts', query_string={'cursor': '', 'per_page': 2, 'include_total': 'true'}).get_json()
+        assert data['pagination']['total'] == 5
+        assert data['pagination']['has_more'] is True
+    
     def test_update_alert(self, client, db_session, sample_realtime_data, sample_user):
         """测试更新告警"""
         alert = AlertInfo(
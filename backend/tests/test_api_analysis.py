@@ -31,6 +31,63 @@ class TestAnalysisAPI:
         data = response.get_json()
         assert data['status'] == 'success'
     
+    def test_trend_summary(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试趋势分析按小时聚合并按昼夜阈值统计超标"""
+        yesterday = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        readings = [
+            (55.0, yesterday.replace(hour=12)),
+            (65.0, yesterday.replace(hour=12, minute=30)),  # 昼间超标
+            (55.0, yesterday.replace(hour=2))               # 夜间超标
+        ]
+        for value, timestamp in readings:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        response = client.get('/api/analysis/trend', query_string={
+            'point_id': sample_monitoring_point.PointID,
+            'days': 7
+        })
+        
+        data = response.get_json()
+        assert [point['count'] for point in data['trend']] == [1, 2]
+        assert data['trend'][1]['timestamp'] == yesterday.replace(hour=12).isoformat()
+        assert data['trend'][1]['avg_noise'] == 60.0
+        assert data['summary']['total_count'] == 3
+        assert data['summary']['exceeded_count'] == 2
+        assert data['summary']['max_noise'] == 65.0
+    
+    def test_trend_analysis_direction(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试趋势分析按时间顺序比较前后两半数据"""
+        start = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0) - timedelta(days=2)
+        for i, value in enumerate([50.0, 52.0, 70.0, 72.0]):
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=start + timedelta(hours=i),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        response = client.post('/api/analysis/trend', json={
+            'analysis_type': '日趋势',
+            'start_date': start.isoformat(),
+            'end_date': (start + timedelta(days=1)).isoformat(),
+            'point_id': sample_monitoring_point.PointID
+        })
+        
+        assert response.status_code == 200
+        result = response.get_json()['data']
+        assert result['trend_direction'] == '上升'
+        assert result['trend_rate'] == 20.0
+        assert result['exceed_count'] == 2
+        assert result['total_data_points'] == 4
+        assert result['peak_hours'][0][0] == 11
+    
     def test_get_compare_analysis(self, client, db_session, sample_monitoring_point):
         """测试获取对比分析"""
         response = client.get('/api/analysis/compare', query_string={
@@ -43,6 +100,39 @@ class TestAnalysisAPI:
         data = response.get_json()
         assert data['status'] == 'success'
     
+    def test_compare_exceeded_counts(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试对比分析按昼夜阈值统计各区域超标次数"""
+        today = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        readings = [
+            (55.0, today.replace(hour=12)),  # 昼间未超标（阈值60）
+            (65.0, today.replace(hour=12)),  # 昼间超标
+            (55.0, today.replace(hour=2)),   # 夜间超标（阈值50）
+            (45.0, today.replace(hour=23))   # 夜间未超标
+        ]
+        for value, timestamp in readings:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        response = client.get('/api/analysis/compare', query_string={
+            'region_ids': f'{sample_monitoring_point.PointID},99999',
+            'days': 3
+        })
+        
+        assert response.status_code == 200
+        comparison = response.get_json()['comparison']
+        assert len(comparison) == 1
+        assert comparison[0]['region_id'] == sample_monitoring_point.PointID
+        assert comparison[0]['data_count'] == 4
+        assert comparison[0]['exceeded_count'] == 2
+        assert comparison[0]['exceeded_rate'] == 50.0
+        assert comparison[0]['avg_noise'] == 55.0
+        assert comparison[0]['max_noise'] == 65.0
+    
     def test_get_hourly_pattern(self, client, db_session, sample_monitoring_point, sample_sensor):
         """测试获取小时模式分析"""
         # 创建不同小时的数据
@@ -64,6 +154,41 @@ class TestAnalysisAPI:
         data = response.get_json()
         assert data['status'] == 'success'
     
+    def test_hourly_pattern_matches_raw_data(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试小时模式分析结果与逐条统计原始数据一致"""
+        now = datetime.now()
+        timestamps = [now - timedelta(days=2, minutes=5)]  # 统计窗口之外
+        timestamps += [now - timedelta(days=2) + timedelta(minutes=m) for m in (2, 70, 200)]
+        timestamps += [now - timedelta(hours=h, minutes=7) for h in range(0, 30, 3)]
+        for i, timestamp in enumerate(timestamps):
+            db_session.add(RealtimeData(
+                NoiseValue=50.0 + (i * 3.7) % 20,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        response = client.get('/api/analysis/hourly-pattern', query_string={
+            'region_id': sample_monitoring_point.PointID,
+            'days': 2
+        })
+        
+        assert response.status_code == 200
+        pattern = {p['hour']: p for p in response.get_json()['pattern']}
+        
+        start_time = now - timedelta(days=2)
+        expected = {}
+        for record in db_session.query(RealtimeData).filter(RealtimeData.Timestamp >= start_time):
+            expected.setdefault(record.Timestamp.hour, []).append(record.NoiseValue)
+        
+        assert sum(p['count'] for p in pattern.values()) == len(timestamps) - 1
+        for hour, values in expected.items():
+            assert pattern[hour]['count'] == len(values)
+            assert pattern[hour]['avg_noise'] == round(sum(values) / len(values), 1)
+            assert pattern[hour]['max_noise'] == round(max(values), 1)
+            assert pattern[hour]['min_noise'] == round(min(values), 1)
+    
     def test_get_correlation_analysis(self, client, db_session, sample_monitoring_point):
         """测试获取相关性分析"""
         response = client.get('/api/analysis/correlation', query_string={
@@ -74,3 +199,35 @@ class TestAnalysisAPI:
         data = response.get_json()
         assert data['status'] == 'success'
 
+    
+    def test_correlation_breakdowns(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试相关性分析的区域类型、工作日/周末、昼夜统计"""
+        base = datetime.now().replace(minute=0, second=0, microsecond=0) - timedelta(days=7)
+        readings = []
+        for day in range(7):
+            for hour, value in ((3, 45.0), (12, 60.0 + day)):
+                readings.append((base + timedelta(days=day), hour, value))
+        for date, hour, value in readings:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=date.replace(hour=hour),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        response = client.get('/api/analysis/correlation', query_string={'days': 8})
+        
+        assert response.status_code == 200
+        correlations = response.get_json()['correlations']
+        by_type = correlations['by_region_type'][sample_monitoring_point.PointType]
+        assert by_type['count'] == 14
+        assert by_type['min_noise'] == 45.0
+        assert by_type['max_noise'] == 66.0
+        
+        weekday_values = [v for d, h, v in readings if d.replace(hour=h).weekday() < 5]
+        weekend_values = [v for d, h, v in readings if d.replace(hour=h).weekday() >= 5]
+        assert correlations['weekday_vs_weekend']['weekday']['count'] == len(weekday_values)
+        assert correlations['weekday_vs_weekend']['weekend']['avg_noise'] == round(sum(weekend_values) / len(weekend_values), 1)
+        assert correlations['day_vs_night']['day'] == {'avg_noise': 63.0, 'count': 7}
+        assert correlations['day_vs_night']['night'] == {'avg_noise': 45.0, 'count': 7}
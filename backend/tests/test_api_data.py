@@ -1,9 +1,14 @@
 """
 数据相关 API 测试
 """
+import json
 import pytest
-from datetime import datetime, timedelta
-from app import RealtimeData, Sensor, MonitoringPoint
+from datetime import datetime, timedelta, timezone
+from time import monotonic, sleep
+from sqlalchemy import event, insert
+from app import cache, RealtimeData, Sensor, MonitoringPoint, AlertInfo, ingest_buffer, stream_broadcaster, relay_stream_readings, WorkerLease
+from config import Config
+from scheduler import PeriodicTask
 
 
 class TestRealtimeDataAPI:
@@ -28,6 +33,139 @@ class TestRealtimeDataAPI:
         assert data['status'] == 'success'
         assert 'data_id' in data or 'message' in data
     
+    def test_post_realtime_data_is_broadcast(self, client, db_session, sample_sensor):
+        """测试写入提交后推送给实时数据流的订阅方"""
+        subscriber = stream_broadcaster.subscribe()
+        try:
+            response = client.post('/api/realtime-data', json={
+                'sensor_id': sample_sensor.SensorID,
+                'noise_value': 75.0,
+                'timestamp': datetime.now().replace(hour=12).isoformat()
+            })
+            assert response.status_code == 201
+            
+            frame = subscriber.get(timeout=1)
+        finally:
+            stream_broadcaster.unsubscribe(subscriber)
+        
+        payload = json.loads(frame.split('data: ', 1)[1])
+        assert payload['status'] == 'success'
+        item = payload['data'][0]
+        assert item['device_id'] == sample_sensor.SensorID
+        assert item['sensor_name'] == sample_sensor.SensorName
+        assert item['noise_value'] == 75.0
+        assert item['is_exceeded'] is True
+        assert item['alert']['alert_level'] == '高'
+    
+    def test_stream_relays_readings_from_other_processes(self, client, db_session, sample_sensor, monkeypatch):
+        """测试其他进程写入的数据（含晚提交的 DataID 缺口）由转发任务推送，本进程直接推送的不重复推送"""
+        monkeypatch.setattr('app.stream_relay_state', {'last_id': None, 'gaps': {}, 'local_ids': set()})
+        timestamp = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        
+        def other_process_insert(data_id, value):
+            # 不经过本进程的 ORM 会话，模拟其他 worker 写入
+            db_session.execute(insert(RealtimeData).values(
+                DataID=data_id, NoiseValue=value, Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID, PointID=sample_sensor.PointID
+            ))
+            db_session.commit()
+        
+        def pushed_values():
+            values = []
+            while (frame := subscriber.get(timeout=0.01)) is not None:
+                values.extend(item['noise_value'] for item in json.loads(frame.split('data: ', 1)[1])['data'])
+            return values
+        
+        subscriber = stream_broadcaster.subscribe()
+        try:
+            assert relay_stream_readings(db_session) == 0  # 从当前最大 DataID 之后开始
+            
+            response = client.post('/api/realtime-data', json={'sensor_id': sample_sensor.SensorID, 'noise_value': 50.0})
+            local_id = response.get_json()['data_id']
+            other_process_insert(local_id + 3, 65.0)
+            assert relay_stream_readings(db_session) == 1
+            assert pushed_values() == [50.0, 65.0]
+            
+            other_process_insert(local_id + 1, 55.0)  # 晚提交的事务
+            assert relay_stream_readings(db_session) == 1
+            assert relay_stream_readings(db_session) == 0
+            assert pushed_values() == [55.0]
+        finally:
+            stream_broadcaster.unsubscribe(subscriber)
+    
+    def test_realtime_stream_compact_snapshot(self, client, db_session, sample_sensor, sample_monitoring_point):
+        """测试紧凑格式的实时数据流先发送订阅范围内的传感器元数据"""
+        response = client.get('/api/realtime/stream', query_string={
+            'format': 'compact',
+            'district': sample_monitoring_point.District
+        }, buffered=False)
+        try:
+            first_frame = next(response.response)
+        finally:
+            response.close()
+        
+        first_frame = first_frame.decode('utf-8') if isinstance(first_frame, bytes) else first_frame
+        assert first_frame.startswith('event: meta\n')
+        meta = json.loads(first_frame.split('data: ', 1)[1])
+        assert meta['snapshot'] is True
+        assert [sensor[1] for sensor in meta['sensors']] == [sample_sensor.SensorID]
+    
+    def test_realtime_stream_invalid_format(self, client):
+        """测试实时数据流参数校验"""
+        assert client.get('/api/realtime/stream', query_string={'format': 'xml'}).status_code == 400
+        assert client.get('/api/realtime/stream', query_string={'point_id': 'abc'}).status_code == 400
+    
+    def test_realtime_generation_status(self, client, db_session, sample_sensor, monkeypatch):
+        """测试启动后台采集后状态接口返回调度指标"""
+        import app as app_module
+        acquisition = PeriodicTask('acquisition', app_module.run_acquisition_tick, 0.05)
+        monkeypatch.setattr('app.acquisition_task', acquisition)
+        monkeypatch.setattr('app.hourly_summary_task', PeriodicTask('hourly_summary', lambda: None, 3600, align=True))
+        elector = PeriodicTask('leader_election', app_module.run_leader_election, 3600)
+        monkeypatch.setattr('app.leader_election_task', elector)
+        
+        try:
+            assert client.post('/api/realtime/generate').get_json()['status'] == 'success'
+            assert client.post('/api/realtime/generate').get_json()['status'] == 'info'
+            deadline = monotonic() + 5
+            while acquisition.stats()['runs'] < 2 and monotonic() < deadline:
+                sleep(0.02)
+            data = client.get('/api/realtime/status').get_json()['data']
+        finally:
+            client.post('/api/realtime/stop')
+            elector.stop()
+            acquisition.stop(timeout=5)
+        
+        assert data['is_running'] is True
+        assert data['leader']['holder_id'] == data['worker_id']
+        assert data['leader']['is_self'] is True
+        scheduler = data['scheduler']
+        assert scheduler['acquisition']['runs'] >= 2
+        assert scheduler['acquisition']['failures'] == 0
+        assert scheduler['acquisition']['last_lag_ms'] is not None
+        assert scheduler['hourly_summary']['runs'] == 0
+        assert db_session.query(RealtimeData).filter_by(SensorID=sample_sensor.SensorID).count() >= 2
+    
+    def test_realtime_status_reports_leader(self, client, db_session):
+        """测试非租约持有进程返回持有者的运行状态和调度指标"""
+        now = datetime.now()
+        db_session.add(WorkerLease(
+            LeaseName='realtime_generation', Enabled=1, HolderID='other-host:1:abc',
+            AcquiredAt=now, RenewedAt=now, ExpiresAt=now + timedelta(seconds=30),
+            Status=json.dumps({'acquisition': {'name': 'acquisition', 'runs': 7}})
+        ))
+        db_session.commit()
+        
+        data = client.get('/api/realtime/status').get_json()['data']
+        assert data['is_running'] is True
+        assert data['thread_alive'] is False
+        assert data['leader']['holder_id'] == 'other-host:1:abc'
+        assert data['leader']['is_self'] is False
+        assert data['scheduler']['acquisition']['runs'] == 7
+        
+        # 其他进程持有有效租约时不会重复启动
+        assert client.post('/api/realtime/generate').get_json()['status'] == 'info'
+    
     def test_get_realtime_data(self, client, db_session, sample_realtime_data):
         """测试获取实时数据"""
         response = client.get('/api/realtime-data')
@@ -38,6 +176,45 @@ class TestRealtimeDataAPI:
         assert 'data' in data
         assert len(data['data']) > 0
     
+    def test_get_realtime_data_cursor_pagination(self, client, db_session, sample_sensor, sample_monitoring_point):
+        """测试游标分页逐页遍历不重复不遗漏，分页期间插入的新数据不影响后续页"""
+        timestamp = datetime(2025, 6, 1, 12, 0, 0)
+        for seconds in [0, 0, 30, 30, 30, 60, 90]:
+            db_session.add(RealtimeData(
+                NoiseValue=55.0,
+                Timestamp=timestamp + timedelta(seconds=seconds),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        expected = [data.DataID for data in db_session.query(RealtimeData).order_by(
+            RealtimeData.Timestamp.desc(), RealtimeData.DataID.desc()
+        )]
+        
+        seen, cursor = [], ''
+        while cursor is not None:
+            response = client.get('/api/realtime-data', query_string={
+                'point_id': sample_monitoring_point.PointID, 'cursor': cursor, 'per_page': 3
+            })
+            data = response.get_json()
+            assert response.status_code == 200
+            seen.extend(item['data_id'] for item in data['data'])
+            cursor = data['pagination']['next_cursor']
+            if len(seen) == 3:
+                db_session.add(RealtimeData(
+                    NoiseValue=60.0, Timestamp=timestamp + timedelta(hours=1),
+                    SensorID=sample_sensor.SensorID, PointID=sample_monitoring_point.PointID
+                ))
+                db_session.commit()
+        assert seen == expected
+    
+    def test_get_realtime_data_invalid_cursor(self, client):
+        """测试无效游标返回400"""
+        response = client.get('/api/realtime-data', query_string={'cursor': 'not-a-cursor'})
+        
+        assert response.status_code == 400
+        assert response.get_json()['status'] == 'error'
+    
     def test_get_realtime_data_with_filters(self, client, db_session, sample_realtime_data, sample_sensor):
         """测试带过滤条件的实时数据查询"""
         response = client.get('/api/realtime-data', query_string={
@@ -60,6 +237,171 @@ class TestRealtimeDataAPI:
         data = response.get_json()
         assert data['status'] == 'success'
         assert 'pagination' in data or 'total' in data
+    
+    def test_realtime_data_total_from_rollups(self, client, db_session, sample_sensor, sample_monitoring_point):
+        """测试总数默认由小时汇总估算并缓存，exact=true 时精确统计"""
+        hour = datetime(2025, 6, 1, 12, 0, 0)
+        for minutes in range(0, 120, 2):  # 两个小时，每小时30条
+            db_session.add(RealtimeData(
+                NoiseValue=55.0,
+                Timestamp=hour + timedelta(minutes=minutes),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        params = {
+            'point_id': sample_monitoring_point.PointID,
+            'start_time': (hour + timedelta(minutes=30)).isoformat(),
+            'end_time': (hour + timedelta(hours=2)).isoformat()
+        }
+        
+        pagination = client.get('/api/realtime-data', query_string=params).get_json()['pagination']
+        assert pagination['total'] == 45  # 首个小时按覆盖的一半折算
+        assert pagination['total_approximate'] is True
+        
+        pagination = client.get('/api/realtime-data', query_string=dict(params, exact='true')).get_json()['pagination']
+        assert pagination['total'] == 45
+        assert pagination['total_approximate'] is False
+        
+        db_session.add(RealtimeData(
+            NoiseValue=55.0, Timestamp=hour + timedelta(hours=1, minutes=1),
+            SensorID=sample_sensor.SensorID, PointID=sample_monitoring_point.PointID
+        ))
+        db_session.commit()
+        assert client.get('/api/realtime-data', query_string=dict(params, page=2)).get_json()['pagination']['total'] == 45  # 缓存
+        assert client.get('/api/realtime-data', query_string=dict(params, exact='true')).get_json()['pagination']['total'] == 46
+        
+        data = client.get('/api/noise-data', query_string={'device_id': sample_sensor.SensorID}).get_json()
+        assert (data['count'], data['count_approximate']) == (61, True)
+    
+    def test_rollup_total_with_aware_time_range(self, client, db_session, sample_sensor, sample_monitoring_point):
+        """测试带时区的时间范围先转换为本地时间再按小时汇总估算"""
+        hour = datetime(2025, 6, 1, 12, 0, 0)
+        for minutes in range(0, 60, 2):
+            db_session.add(RealtimeData(
+                NoiseValue=55.0,
+                Timestamp=hour + timedelta(minutes=minutes),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        start = (hour + timedelta(minutes=30)).astimezone()
+        
+        response = client.get('/api/noise-data', query_string={
+            'device_id': sample_sensor.SensorID,
+            'start_time': start.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+        })
+        assert response.status_code == 200
+        assert response.get_json()['count'] == 15
+        
+        response = client.get('/api/realtime-data', query_string={
+            'point_id': sample_monitoring_point.PointID,
+            'start_time': start.astimezone(timezone(timedelta(hours=8))).isoformat()
+        })
+        assert response.status_code == 200
+        assert response.get_json()['pagination']['total'] == 15
+    
+    def test_rollup_total_current_hour(self, client, db_session, sample_sensor, sample_monitoring_point, monkeypatch):
+        """测试当前小时只按已经过去的时长折算，不按整小时折算"""
+        import app as app_module
+        
+        hour = datetime(2025, 6, 1, 12, 0, 0)
+        
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return hour + timedelta(minutes=20)
+        
+        for seconds in range(0, 1200, 40):  # 当前小时已过去20分钟，共30条
+            db_session.add(RealtimeData(
+                NoiseValue=55.0,
+                Timestamp=hour + timedelta(seconds=seconds),
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        monkeypatch.setattr(app_module, 'datetime', FrozenDatetime)
+        
+        pagination = client.get('/api/realtime-data', query_string={
+            'point_id': sample_monitoring_point.PointID,
+            'start_time': (hour + timedelta(minutes=10)).isoformat()
+        }).get_json()['pagination']
+        assert pagination['total'] == 15
+        assert pagination['total_approximate'] is True
+
+
+class TestRealtimeDataBatchAPI:
+    """批量上传实时数据API测试"""
+    
+    def test_post_batch(self, client, db_session, sample_sensor):
+        """测试批量提交实时数据并返回逐条状态"""
+        noon = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        response = client.post('/api/realtime-data/batch', json={'readings': [
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 55.0, 'timestamp': noon.isoformat()},
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 68.0, 'timestamp': noon.isoformat()},
+            {'sensor_id': 'NOT_EXIST', 'noise_value': 60.0},
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 500}
+        ]})
+        
+        assert response.status_code == 201
+        data = response.get_json()
+        assert data['accepted_count'] == 2
+        assert data['rejected_count'] == 2
+        assert data['alert_count'] == 1
+        
+        results = data['results']
+        assert [r['status'] for r in results] == ['success', 'success', 'error', 'error']
+        assert results[0]['is_exceeded'] is False
+        assert results[1]['is_exceeded'] is True
+        assert results[1]['alert']['alert_level'] == '中'
+        assert db_session.query(RealtimeData).count() == 2
+    
+    def test_post_batch_offline_sensor(self, client, db_session, sample_sensor):
+        """测试离线传感器的数据被拒绝"""
+        sample_sensor.Status = '离线'
+        db_session.commit()
+        
+        response = client.post('/api/realtime-data/batch', json=[
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 55.0}
+        ])
+        
+        assert response.status_code == 400
+        data = response.get_json()
+        assert data['accepted_count'] == 0
+        assert '离线' in data['results'][0]['message']
+    
+    def test_post_buffered(self, client, db_session, sample_sensor, monkeypatch):
+        """测试 write-behind 模式下返回202并由写入线程落库"""
+        monkeypatch.setattr(Config, 'INGEST_MODE', 'buffered')
+        noon = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        
+        response = client.post('/api/realtime-data', json={
+            'sensor_id': sample_sensor.SensorID,
+            'noise_value': 70.0,
+            'timestamp': noon.isoformat()
+        })
+        assert response.status_code == 202
+        
+        response = client.post('/api/realtime-data/batch', json=[
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 50.0, 'timestamp': noon.isoformat()}
+        ])
+        assert response.status_code == 202
+        assert response.get_json()['results'][0]['status'] == 'queued'
+        
+        ingest_buffer.stop()  # 排空队列
+        
+        assert db_session.query(RealtimeData).count() == 2
+        assert db_session.query(AlertInfo).count() == 1
+        
+        status = client.get('/api/ingest/status').get_json()['data']
+        assert status['mode'] == 'buffered'
+        assert status['buffer']['queue_depth'] == 0
+    
+    def test_post_batch_empty(self, client):
+        """测试空批次"""
+        response = client.post('/api/realtime-data/batch', json={'readings': []})
+        
+        assert response.status_code == 400
 
 
 class TestNoiseDataAPI:
@@ -116,6 +458,72 @@ class TestNoiseDataAPI:
         assert 'statistics' in data
 
 
+class TestListSerializationQueries:
+    """列表接口序列化的查询次数测试"""
+    
+    def add_readings(self, db_session, sample_city, prefix, points, per_sensor):
+        """新增 points 个监测点（编码以 prefix 开头），每个监测点2个传感器，每个传感器 per_sensor 条超标数据（均生成告警）"""
+        timestamp = datetime(2025, 6, 1, 12, 0, 0)
+        for i in range(points):
+            point = MonitoringPoint(
+                PointName=f'序列化测试点{prefix}{i}', PointCode=f'{prefix}{i}', Longitude=121.0, Latitude=31.0,
+                District='测试区', PointType='住宅区', NoiseThresholdDay=0.0, NoiseThresholdNight=0.0,
+                CityID=sample_city.CityID
+            )
+            db_session.add(point)
+            db_session.flush()
+            for j in range(2):
+                sensor_id = f'{prefix}{i}-{j}'
+                db_session.add(Sensor(SensorID=sensor_id, SensorName=f'传感器{i}-{j}', Status='在线', PointID=point.PointID))
+                for k in range(per_sensor):
+                    data = RealtimeData(
+                        NoiseValue=60.0, Timestamp=timestamp + timedelta(seconds=k),
+                        SensorID=sensor_id, PointID=point.PointID
+                    )
+                    db_session.add(data)
+                    db_session.flush()
+                    db_session.add(AlertInfo(AlertLevel='高', TriggerTime=data.Timestamp, DataID=data.DataID))
+        db_session.commit()
+    
+    def count_queries(self, client, db_session, path, query_string):
+        """请求接口，返回 (返回的记录数, 执行的SELECT语句数)"""
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append(statement)
+        
+        cache.clear()  # 总数不从缓存读取，两次请求执行相同的语句
+        engine = db_session.get_bind()
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            data = client.get(path, query_string=query_string).get_json()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        assert data['status'] == 'success'
+        records = data.get('data') or data.get('alerts') or data.get('devices')
+        return len(records), len(statements)
+    
+    @pytest.mark.parametrize('path, query_string', [
+        ('/api/noise-data', {'limit': 1000}),
+        ('/api/realtime-data', {'per_page': 100}),
+        ('/api/alerts', {'per_page': 100}),
+        ('/api/alerts', {'per_page': 100, 'cursor': ''}),
+        ('/api/devices', {}),
+        ('/api/map/data', {}),
+    ])
+    def test_query_count_independent_of_rows(self, client, db_session, sample_city, path, query_string):
+        """测试查询次数与返回的记录数、涉及的传感器和监测点数量无关"""
+        self.add_readings(db_session, sample_city, 'A', points=1, per_sensor=1)
+        few, few_queries = self.count_queries(client, db_session, path, query_string)
+        
+        self.add_readings(db_session, sample_city, 'B', points=5, per_sensor=25)
+        many, many_queries = self.count_queries(client, db_session, path, query_string)
+        
+        assert many > few
+        assert many_queries == few_queries
+
+
 class TestDashboardAPI:
     """仪表板API测试"""
     
@@ -141,4 +549,36 @@ class TestMapAPI:
         data = response.get_json()
         assert data['status'] == 'success'
         assert 'points' in data or 'data' in data
+    
+    def test_map_data_from_latest_readings(self, client, db_session, sample_monitoring_point, sample_sensor, monkeypatch):
+        """测试地图数据来自最新读数表：设备显示最新读数，监测点显示最近 N 条读数的平均值，只执行一条查询"""
+        monkeypatch.setattr('app.Config.POINT_RECENT_WINDOW', 2)
+        db_session.add(Sensor(SensorID='SENSOR002', SensorName='无数据传感器', Status='在线', PointID=sample_monitoring_point.PointID))
+        for i, value in enumerate([40.0, 58.0, 66.0]):
+            db_session.add(RealtimeData(
+                NoiseValue=value, Timestamp=datetime(2025, 6, 1, 12, i, 0),
+                SensorID=sample_sensor.SensorID, PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engine = db_session.get_bind()
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            data = client.get('/api/map/data').get_json()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        
+        assert len(statements) == 1
+        devices = {device['device_id']: device for device in data['devices']}
+        assert (devices['SENSOR001']['recent_noise'], devices['SENSOR001']['is_exceeded']) == (66.0, True)
+        assert devices['SENSOR002']['recent_noise'] is None
+        assert not devices['SENSOR002']['is_exceeded']
+        region = data['regions'][0]
+        assert region['avg_noise'] == pytest.approx(62.0)
+        assert region['device_count'] == 2
 
@@ -2,7 +2,9 @@
 区域相关 API 测试
 """
 import pytest
-from app import MonitoringPoint, City, Sensor
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import MonitoringPoint, City, Sensor, RealtimeData
 
 
 class TestRegionsAPI:
@@ -17,6 +19,69 @@ class TestRegionsAPI:
         assert data['status'] == 'success'
         assert 'regions' in data or 'points' in data or 'data' in data
     
+    def test_regions_today_stats(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试今日统计按每条读数所在时段的昼/夜阈值判断超标（昼间60，夜间50）"""
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        for value, timestamp in [
+            (55.0, today + timedelta(hours=3)),  # 夜间超标
+            (55.0, today + timedelta(hours=12)),  # 昼间未超标
+            (65.0, today + timedelta(hours=12, minutes=30)),  # 昼间超标
+            (90.0, today - timedelta(hours=1))  # 昨天的数据不计入
+        ]:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        region = client.get('/api/regions').get_json()['regions'][0]
+        assert region['sensor_count'] == 1
+        stats = region['recent_stats']
+        assert (stats['data_count'], stats['exceed_count']) == (3, 2)
+        assert stats['avg_noise'] == pytest.approx(175.0 / 3)
+    
+    def test_regions_query_count(self, client, db_session, sample_city):
+        """测试区域列表和区县列表的查询次数与监测点数量无关"""
+        def add_points(prefix, count):
+            for i in range(count):
+                point = MonitoringPoint(
+                    PointName=f'区域测试点{prefix}{i}', PointCode=f'{prefix}{i}', Longitude=121.0, Latitude=31.0,
+                    District=f'{prefix}区{i % 3}', PointType='住宅区', CityID=sample_city.CityID
+                )
+                db_session.add(point)
+                db_session.flush()
+                db_session.add(Sensor(SensorID=f'{prefix}{i}', SensorName=f'传感器{prefix}{i}', PointID=point.PointID))
+                db_session.add(RealtimeData(NoiseValue=55.0, Timestamp=datetime.now(), SensorID=f'{prefix}{i}', PointID=point.PointID))
+            db_session.commit()
+        
+        def count_queries(query_string):
+            statements = []
+            
+            def count(conn, cursor, statement, parameters, context, executemany):
+                statements.append(statement)
+            
+            engine = db_session.get_bind()
+            event.listen(engine, 'before_cursor_execute', count)
+            try:
+                data = client.get('/api/regions', query_string=query_string).get_json()
+            finally:
+                event.remove(engine, 'before_cursor_execute', count)
+            return data, len(statements)
+        
+        add_points('A', 2)
+        _, few_queries = count_queries({})
+        add_points('B', 30)
+        data, many_queries = count_queries({})
+        assert data['count'] == 32
+        assert many_queries == few_queries <= 3
+        
+        data, district_queries = count_queries({'districts_only': 'true'})
+        assert district_queries == 1
+        by_district = {region['district']: region for region in data['regions']}
+        assert (by_district['B区0']['point_count'], by_district['B区0']['sensor_count']) == (10, 10)
+    
     def test_get_region_devices(self, client, db_session, sample_monitoring_point, sample_sensor):
         """测试获取区域设备"""
         response = client.get(f'/api/regions/{sample_monitoring_point.PointID}/devices')
@@ -26,6 +91,18 @@ class TestRegionsAPI:
         assert data['status'] == 'success'
         assert 'devices' in data or 'sensors' in data or 'data' in data
     
+    def test_region_devices_recent_reading(self, client, db_session, sample_monitoring_point, sample_sensor):
+        """测试设备最近读数取采集时间最新的一条（而非最后写入的一条）"""
+        for value, minute in [(55.0, 5), (70.0, 1)]:
+            db_session.add(RealtimeData(
+                NoiseValue=value, Timestamp=datetime(2025, 6, 1, 12, minute, 0),
+                SensorID=sample_sensor.SensorID, PointID=sample_monitoring_point.PointID
+            ))
+            db_session.commit()
+        
+        devices = client.get(f'/api/regions/{sample_monitoring_point.PointID}/devices').get_json()['devices']
+        assert [(device['recent_noise'], device['recent_update']) for device in devices] == [(55.0, '2025-06-01T12:05:00')]
+    
     def test_get_region_devices_nonexistent(self, client):
         """测试获取不存在区域的设备"""
         response = client.get('/api/regions/99999/devices')
@@ -0,0 +1,212 @@
+"""
+报告相关 API 测试
+"""
+import json
+import pytest
+from datetime import datetime, timedelta
+from concurrent.futures import Future
+from time import monotonic, sleep
+import app as app_module
+from app import AlertInfo, RealtimeData, Report, ReportJob, get_db_session, recover_report_jobs, run_report_job
+
+
+def wait_for_job(client, job_id, timeout=10):
+    """轮询任务状态直到完成或失败"""
+    deadline = monotonic() + timeout
+    while True:
+        job = client.get(f'/api/reports/jobs/{job_id}').get_json()['job']
+        if job['job_status'] in ('已完成', '失败') or monotonic() > deadline:
+            return job
+        sleep(0.05)
+
+
+class TestReportsAPI:
+    """报告API测试"""
+
+    def test_generate_report_statistics(self, client, db_session, sample_monitoring_point, sample_sensor, sample_user):
+        """测试报告统计：整小时读取汇总，首尾不足一小时的部分读取原始数据"""
+        start = (datetime.now() - timedelta(days=3)).replace(hour=0, minute=0, second=0, microsecond=0)
+        end = start + timedelta(days=1)
+        readings = [
+            (45.0, start.replace(minute=10)),                            # 夜间未超标（阈值50）
+            (65.0, start.replace(hour=12, minute=30)),                   # 昼间超标（阈值60）
+            (55.0, end.replace(hour=23, minute=59, second=30)),          # 夜间超标，位于最后不足一小时的部分
+            (70.0, end.replace(hour=23, minute=59, second=59, microsecond=500000)),  # 超出报告周期
+            (80.0, start - timedelta(minutes=1))                         # 早于报告周期
+        ]
+        records = []
+        for value, timestamp in readings:
+            record = RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            )
+            db_session.add(record)
+            records.append(record)
+        db_session.flush()
+        for level, record in [('中', records[1]), ('中', records[2]), ('紧急', records[2])]:
+            db_session.add(AlertInfo(
+                AlertLevel=level,
+                TriggerTime=record.Timestamp,
+                DataID=record.DataID
+            ))
+        db_session.commit()
+
+        response = client.post('/api/reports', json={
+            'report_type': '专项报告',
+            'generated_by': sample_user.UserID,
+            'start_date': start.strftime('%Y-%m-%d'),
+            'end_date': end.strftime('%Y-%m-%d')
+        })
+
+        assert response.status_code == 202
+        job = wait_for_job(client, response.get_json()['job_id'])
+        assert job['job_status'] == '已完成'
+        assert job['progress'] == 100
+        report = db_session.get(Report, job['report_id'])
+        content = json.loads(report.Content)
+        statistics = content['statistics']
+        assert statistics['total_data_count'] == 3
+        assert statistics['avg_noise'] == 55.0
+        assert statistics['max_noise'] == 65.0
+        assert statistics['min_noise'] == 45.0
+        assert statistics['exceed_count'] == 2
+        assert statistics['alert_count'] == 3
+        assert statistics['alert_by_level'] == {'低': 0, '中': 2, '高': 0, '紧急': 1}
+        assert content['region_statistics'] == [{
+            'region_id': sample_monitoring_point.PointID,
+            'region_name': sample_monitoring_point.PointName,
+            'region_type': sample_monitoring_point.PointType,
+            'avg_noise': 55.0,
+            'data_count': 3
+        }]
+        assert '存在紧急告警，需要立即处理' in content['recommendations']
+
+
+class TestReportJobs:
+    """报告任务测试"""
+    
+    def test_identical_jobs_are_deduplicated(self, client, db_session, sample_user, monkeypatch):
+        """测试相同类型和周期的进行中任务共用一次计算"""
+        submitted = []
+        
+        class RecordingExecutor:
+            def submit(self, fn, *args):
+                submitted.append(args)
+        
+        monkeypatch.setattr('app.report_executor', RecordingExecutor())
+        payload = {
+            'report_type': '日报',
+            'generated_by': sample_user.UserID,
+            'start_date': '2025-06-01',
+            'end_date': '2025-06-01'
+        }
+        
+        first = client.post('/api/reports', json=payload).get_json()
+        second = client.post('/api/reports', json=payload).get_json()
+        assert second['job_id'] == first['job_id']
+        assert second['job']['job_status'] == '排队中'
+        assert submitted == [(first['job_id'],)]
+        
+        run_report_job(first['job_id'])
+        job = client.get(f"/api/reports/jobs/{first['job_id']}").get_json()['job']
+        assert job['job_status'] == '已完成'
+        assert db_session.get(Report, job['report_id']).ReportPeriod == '2025-06-01 至 2025-06-01'
+        
+        # 任务结束后再次提交会创建新任务
+        third = client.post('/api/reports', json=payload).get_json()
+        assert third['job_id'] != first['job_id']
+    
+    def test_recover_stale_and_orphaned_jobs(self, client, db_session, sample_user, monkeypatch):
+        """测试中断的进行中任务重新排队，遗留的排队任务交给本进程，重复恢复不会重复提交"""
+        submitted = []
+        
+        class PendingExecutor:
+            def submit(self, fn, *args):
+                submitted.append(args)
+                return Future()  # 未执行完
+        
+        monkeypatch.setattr('app.report_executor', PendingExecutor())
+        monkeypatch.setattr('app.report_futures', {})
+        period = {'StartDate': datetime(2025, 6, 1), 'EndDate': datetime(2025, 6, 1, 23, 59, 59), 'GeneratedBy': sample_user.UserID}
+        jobs = [
+            ReportJob(ReportType='日报', JobStatus='进行中', StartedAt=datetime.now() - timedelta(hours=2), ActiveKey='stale', **period),
+            ReportJob(ReportType='周报', JobStatus='排队中', ActiveKey='orphaned', **period),
+            ReportJob(ReportType='月报', JobStatus='进行中', StartedAt=datetime.now(), ActiveKey='running', **period)
+        ]
+        db_session.add_all(jobs)
+        db_session.commit()
+        
+        assert recover_report_jobs() == 2
+        assert recover_report_jobs() == 0
+        assert sorted(submitted) == [(jobs[0].JobID,), (jobs[1].JobID,)]
+        db_session.refresh(jobs[0])
+        db_session.refresh(jobs[2])
+        assert (jobs[0].JobStatus, jobs[2].JobStatus) == ('排队中', '进行中')
+    
+    def test_requeued_job_result_discarded(self, client, db_session, sample_user, monkeypatch):
+        """测试执行超时被重新排队并由其他执行者完成的任务，原执行者的结果被丢弃，不会生成重复报告"""
+        class InlineExecutor:
+            def submit(self, fn, *args):
+                future = Future()
+                future.set_result(fn(*args))
+                return future
+        
+        monkeypatch.setattr('app.report_executor', InlineExecutor())
+        monkeypatch.setattr('app.report_futures', {})
+        job = ReportJob(
+            ReportType='日报', StartDate=datetime(2025, 6, 1), EndDate=datetime(2025, 6, 1, 23, 59, 59),
+            GeneratedBy=sample_user.UserID, ActiveKey='slow'
+        )
+        db_session.add(job)
+        db_session.commit()
+        build_report_content = app_module.build_report_content
+        
+        def slow_build(*args, **kwargs):
+            # 原执行者计算期间任务超时，恢复后由其他执行者认领并完成
+            monkeypatch.setattr('app.build_report_content', build_report_content)
+            with get_db_session() as session:
+                session.query(ReportJob).filter(ReportJob.JobID == job.JobID).update({
+                    'HeartbeatAt': datetime.now() - timedelta(hours=2)
+                }, synchronize_session=False)
+            assert recover_report_jobs() == 1
+            return build_report_content(*args, **kwargs)
+        
+        monkeypatch.setattr('app.build_report_content', slow_build)
+        run_report_job(job.JobID)
+        
+        db_session.refresh(job)
+        assert (job.JobStatus, job.ClaimToken, job.ActiveKey) == ('已完成', None, None)
+        assert db_session.query(Report).count() == 1
+        assert db_session.query(Report).one().ReportID == job.ReportID
+    
+    def test_recovery_task_started_per_process(self, client, monkeypatch):
+        """测试每个进程处理请求时启动定期恢复任务"""
+        started = []
+        
+        class StubTask:
+            running = False
+            
+            def start(self):
+                started.append(True)
+        
+        monkeypatch.setattr('app.report_recovery_task', StubTask())
+        monkeypatch.setattr('app.Config.REPORT_JOB_RECOVERY_SECONDS', 60)
+        client.get('/api/reports/jobs/999')
+        assert started == [True]
+    
+    def test_get_missing_job(self, client):
+        """测试查询不存在的任务"""
+        response = client.get('/api/reports/jobs/999')
+        assert response.status_code == 404
+    
+    def test_invalid_report_period(self, client, sample_user):
+        """测试报告周期格式错误"""
+        response = client.post('/api/reports', json={
+            'report_type': '日报',
+            'generated_by': sample_user.UserID,
+            'start_date': '2025/06/01',
+            'end_date': '2025/06/02'
+        })
+        assert response.status_code == 400
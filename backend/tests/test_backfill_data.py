@@ -0,0 +1,113 @@
+"""
+历史数据回填测试
+"""
+import numpy as np
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.orm import sessionmaker
+import backfill_data
+from app import Base, AlertInfo, HourlyRollup, MonitoringPoint, PointLatest, RealtimeData, Sensor, SensorLatest, get_alert_level
+from backfill_data import backfill_history, create_benchmark_sensors
+from smart_noise_simulator import SmartNoiseSimulator
+
+
+class TestBackfillData:
+    """历史数据回填测试"""
+    
+    def test_create_benchmark_sensors_is_idempotent(self, db_session):
+        """测试重复创建时复用已有的监测点和传感器"""
+        first = create_benchmark_sensors(db_session, 2, 3, 2, rng=np.random.default_rng(1))
+        second = create_benchmark_sensors(db_session, 2, 3, 2, rng=np.random.default_rng(1))
+        
+        assert len(first) == 12
+        assert second == first
+        assert db_session.query(MonitoringPoint).count() == 6
+        assert db_session.query(Sensor).count() == 12
+    
+    def test_backfill_history(self, test_db, db_session):
+        """测试读数、告警和小时汇总一致"""
+        engine, _ = test_db
+        sensors = create_benchmark_sensors(db_session, 1, 4, 1, rng=np.random.default_rng(2))
+        db_session.commit()
+        
+        reading_count, alert_count = backfill_history(
+            engine, sensors, datetime(2025, 6, 1, 20), datetime(2025, 6, 2, 2),
+            interval=600, simulator=SmartNoiseSimulator(seed=3), chunk_rows=50
+        )
+        
+        assert reading_count == 4 * 36
+        assert db_session.query(RealtimeData).count() == reading_count
+        assert db_session.query(AlertInfo).count() == alert_count
+        
+        # 小时汇总（分块写入时同一小时的增量被合并）与原始数据一致
+        assert db_session.query(func.sum(HourlyRollup.SampleCount)).scalar() == reading_count
+        assert db_session.query(HourlyRollup).count() == 4 * 6
+        exceeded = db_session.query(RealtimeData).filter(RealtimeData.is_exceeded).count()
+        assert db_session.query(func.sum(HourlyRollup.ExceedCount)).scalar() == exceeded == alert_count
+        for alert in db_session.query(AlertInfo):
+            reading = alert.realtime_data
+            assert alert.AlertLevel == get_alert_level(reading.NoiseValue, reading.Timestamp, reading.monitoring_point)
+        rollup = db_session.query(HourlyRollup).filter_by(
+            SensorID=sensors[0][0], HourStart=datetime(2025, 6, 1, 22)
+        ).one()
+        values = [value for (value,) in db_session.query(RealtimeData.NoiseValue).filter(
+            RealtimeData.SensorID == sensors[0][0],
+            RealtimeData.Timestamp >= datetime(2025, 6, 1, 22),
+            RealtimeData.Timestamp < datetime(2025, 6, 1, 23)
+        )]
+        assert rollup.SampleCount == len(values) == 6
+        assert rollup.NoiseSum == pytest.approx(sum(values))
+        assert (rollup.NoiseMin, rollup.NoiseMax) == (min(values), max(values))
+        
+        # 最新读数为各传感器最后一个采集时刻的数据
+        latest = {row.SensorID: row for row in db_session.query(SensorLatest)}
+        assert set(latest) == {sensor[0] for sensor in sensors}
+        last = db_session.query(RealtimeData).filter_by(SensorID=sensors[0][0]).order_by(RealtimeData.Timestamp.desc()).first()
+        assert (latest[sensors[0][0]].Timestamp, latest[sensors[0][0]].NoiseValue) == (last.Timestamp, last.NoiseValue)
+        assert db_session.query(PointLatest).count() == 4
+    
+    def test_same_seed_produces_identical_dataset(self, tmp_path):
+        """测试相同种子两次回填的数据完全一致"""
+        dumps = []
+        for name in ('first', 'second'):
+            engine = create_engine(f'sqlite:///{tmp_path / name}.db')
+            Base.metadata.create_all(engine)
+            simulator = SmartNoiseSimulator(seed=42)
+            with sessionmaker(bind=engine)() as session:
+                sensors = create_benchmark_sensors(session, 1, 3, 2, rng=np.random.default_rng(42), created_at=datetime(2025, 6, 1))
+                session.commit()
+            backfill_history(
+                engine, sensors, datetime(2025, 6, 1), datetime(2025, 6, 1, 6),
+                interval=300, simulator=simulator, chunk_rows=100
+            )
+            with engine.connect() as connection:
+                dumps.append([
+                    connection.execute(select(table).order_by(*table.primary_key.columns)).all()
+                    for table in (MonitoringPoint.__table__, Sensor.__table__, RealtimeData.__table__, AlertInfo.__table__, HourlyRollup.__table__)
+                ])
+            engine.dispose()
+        
+        assert len(dumps[0][2]) == 6 * 72
+        assert dumps[0] == dumps[1]
+    
+    def test_rerun_on_existing_sensors_produces_identical_readings(self, client, test_db, db_session, monkeypatch):
+        """测试监测点和传感器已存在时，相同种子重新回填的读数与第一次一致"""
+        engine, _ = test_db
+        monkeypatch.setattr(backfill_data, 'engine', engine)
+        argv = ['--cities', '1', '--points-per-city', '2', '--start', '2025-06-01', '--end', '2025-06-02',
+                '--interval', '1800', '--seed', '7']
+        
+        dumps = []
+        for _ in range(2):
+            backfill_data.main(argv)
+            dumps.append(db_session.execute(
+                select(RealtimeData.SensorID, RealtimeData.Timestamp, RealtimeData.NoiseValue)
+                .order_by(RealtimeData.SensorID, RealtimeData.Timestamp)
+            ).all())
+            for table in (AlertInfo, RealtimeData, HourlyRollup, SensorLatest, PointLatest):
+                db_session.execute(delete(table))
+            db_session.commit()
+        
+        assert len(dumps[0]) == 2 * 48
+        assert dumps[0] == dumps[1]
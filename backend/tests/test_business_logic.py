@@ -1,16 +1,32 @@
 """
 业务逻辑测试
 """
+import json
 import pytest
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from app import (
     calculate_noise_level, 
     check_and_generate_alert,
+    parse_reading,
+    generate_realtime_tick,
+    sensor_registry,
+    stream_broadcaster,
     RealtimeData,
     MonitoringPoint,
     Sensor,
-    AlertInfo
+    AlertInfo,
+    HourlyRollup,
+    SensorLatest,
+    PointLatest,
+    rebuild_latest_readings,
+    WorkerLease,
+    GENERATION_LEASE,
+    claim_lease,
+    release_lease,
+    set_generation_enabled
 )
+from sqlalchemy import event, insert, update
+from smart_noise_simulator import SmartNoiseSimulator
 
 
 class TestNoiseLevelCalculation:
@@ -91,6 +107,301 @@ class TestAlertGeneration:
             assert len(alerts) == 0
 
 
+class TestSensorRegistry:
+    """传感器元数据缓存测试"""
+    
+    def test_registry_lookup(self, db_session, sample_monitoring_point, sample_sensor):
+        """测试从缓存读取传感器及监测点阈值"""
+        sensor = sensor_registry.get(sample_sensor.SensorID, db_session)
+        
+        assert sensor.PointID == sample_monitoring_point.PointID
+        assert sensor.point.NoiseThresholdDay == 60.0
+        assert sensor.point.NoiseThresholdNight == 50.0
+        assert sensor_registry.get('NOT_EXIST', db_session) is None
+    
+    def test_registry_invalidated_on_commit(self, db_session, sample_sensor):
+        """测试传感器变更提交后缓存失效"""
+        assert sensor_registry.get(sample_sensor.SensorID, db_session).Status == '在线'
+        version = sensor_registry.version
+        
+        sample_sensor.Status = '故障'
+        db_session.commit()
+        
+        assert sensor_registry.version > version
+        assert sensor_registry.get(sample_sensor.SensorID, db_session).Status == '故障'
+    
+    def test_registry_not_invalidated_by_readings(self, db_session, sample_sensor, sample_monitoring_point):
+        """测试写入噪音数据不会使缓存失效"""
+        sensor_registry.get(sample_sensor.SensorID, db_session)
+        version = sensor_registry.version
+        
+        db_session.add(RealtimeData(
+            NoiseValue=60.0,
+            Timestamp=datetime.now(),
+            SensorID=sample_sensor.SensorID,
+            PointID=sample_monitoring_point.PointID
+        ))
+        db_session.commit()
+        
+        assert sensor_registry.version == version
+    
+    def test_registry_reloads_on_miss(self, db_session, sample_sensor, monkeypatch):
+        """测试其他进程新增或启用的传感器在未命中时限流重新加载后即可读取"""
+        sensor_registry.get(sample_sensor.SensorID, db_session)
+        # 模拟其他进程的修改：不经过本进程的 ORM 会话，缓存版本号不变
+        db_session.execute(insert(Sensor).values(SensorID='OTHER001', SensorName='其他进程新增', Status='在线', PointID=sample_sensor.PointID))
+        db_session.execute(update(Sensor).where(Sensor.SensorID == sample_sensor.SensorID).values(Status='离线'))
+        db_session.commit()
+        
+        monkeypatch.setattr(sensor_registry, 'miss_reload_interval', 3600)
+        assert sensor_registry.get('OTHER001', db_session) is None  # 间隔内不重新加载
+        
+        monkeypatch.setattr(sensor_registry, 'miss_reload_interval', 0)
+        assert sensor_registry.get('OTHER001', db_session).Status == '在线'
+        
+        db_session.execute(update(Sensor).where(Sensor.SensorID == sample_sensor.SensorID).values(Status='在线'))
+        db_session.commit()
+        assert sensor_registry.get(sample_sensor.SensorID, db_session).Status == '离线'  # 命中缓存
+        assert sensor_registry.get(sample_sensor.SensorID, db_session, online=True).Status == '在线'
+
+
+class TestRealtimeGeneration:
+    """后台实时数据生成测试"""
+    
+    def run_tick(self, db_session, current_time):
+        """执行一轮生成并提交，返回 (生成条数, 执行的SQL语句数)"""
+        statements = []
+        
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        
+        engine = db_session.get_bind()
+        event.listen(engine, 'before_cursor_execute', count)
+        try:
+            generated = generate_realtime_tick(db_session, current_time)
+            db_session.commit()
+        finally:
+            event.remove(engine, 'before_cursor_execute', count)
+        return generated, len(statements)
+    
+    def test_tick_restores_last_values(self, db_session, sample_monitoring_point, sample_sensor, monkeypatch):
+        """测试预取各传感器最近一条读数作为平滑起点，离线传感器不生成数据"""
+        monkeypatch.setattr('app.simulator', SmartNoiseSimulator(seed=1))
+        current_time = datetime(2025, 6, 1, 12, 0, 0)
+        db_session.add(Sensor(SensorID='SENSOR002', SensorName='离线传感器', Status='离线', PointID=sample_monitoring_point.PointID))
+        for value, timestamp in [(30.0, current_time - timedelta(hours=1)), (58.0, current_time - timedelta(seconds=20))]:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        subscriber = stream_broadcaster.subscribe()
+        try:
+            generated, _ = self.run_tick(db_session, current_time)
+            frame = subscriber.get(timeout=1)
+        finally:
+            stream_broadcaster.unsubscribe(subscriber)
+        
+        assert generated == 1
+        record = db_session.query(RealtimeData).filter_by(Timestamp=current_time).one()
+        assert record.SensorID == sample_sensor.SensorID
+        assert abs(record.NoiseValue - 58.0) <= 20 / 60 * 5 + 2 + 0.01
+        assert set(json.loads(record.FrequencySpectrum)) == {'low', 'mid', 'high'}
+        assert db_session.query(HourlyRollup).filter_by(SensorID=sample_sensor.SensorID, HourStart=current_time).one().SampleCount == 1
+        
+        # 提交后推送给实时数据流
+        pushed = json.loads(frame.split('data: ', 1)[1])['data']
+        assert [(item['sensor_id'], item['noise_value']) for item in pushed] == [(record.SensorID, record.NoiseValue)]
+    
+    def test_tick_round_trips_do_not_grow_with_sensors(self, db_session, sample_monitoring_point, monkeypatch):
+        """测试每轮生成的SQL语句数与传感器数量无关，超标读数批量生成告警"""
+        monkeypatch.setattr('app.simulator', SmartNoiseSimulator(seed=2))
+        sample_monitoring_point.NoiseThresholdDay = 0.0  # 所有读数都超标
+        for i in range(2):
+            db_session.add(Sensor(SensorID=f'A{i}', SensorName=f'传感器A{i}', Status='在线', PointID=sample_monitoring_point.PointID))
+        db_session.commit()
+        
+        few, few_statements = self.run_tick(db_session, datetime(2025, 6, 1, 12, 0, 0))
+        for i in range(20):
+            db_session.add(Sensor(SensorID=f'B{i}', SensorName=f'传感器B{i}', Status='在线', PointID=sample_monitoring_point.PointID))
+        db_session.commit()
+        many, many_statements = self.run_tick(db_session, datetime(2025, 6, 1, 12, 0, 30))
+        
+        assert (few, many) == (2, 22)
+        assert many_statements == few_statements
+        assert db_session.query(AlertInfo).count() == 24
+        assert {alert.DataID for alert in db_session.query(AlertInfo)} == {data.DataID for data in db_session.query(RealtimeData)}
+        
+        # 最新读数随同一批写入更新
+        assert db_session.query(SensorLatest).count() == 22
+        assert all(latest.IsExceeded and latest.Timestamp == datetime(2025, 6, 1, 12, 0, 30) for latest in db_session.query(SensorLatest))
+        assert len(db_session.get(PointLatest, sample_monitoring_point.PointID).to_dict()['recent_values']) == 10
+    
+    def test_tick_without_insert_returning(self, db_session, sample_sensor, monkeypatch):
+        """测试不支持 executemany RETURNING 的数据库（MySQL）按存储到秒的时间回查主键"""
+        monkeypatch.setattr('app.simulator', SmartNoiseSimulator(seed=3))
+        engine = db_session.get_bind()
+        monkeypatch.setattr(engine.dialect, 'insert_executemany_returning', False)
+        
+        def truncate_seconds(conn, cursor, statement, parameters, context, executemany):
+            # 模拟 MySQL DATETIME：写入时丢弃微秒
+            if statement.startswith('INSERT INTO realtime_data'):
+                rows = parameters if executemany else [parameters]
+                rows = [tuple(value[:20] + '000000' if isinstance(value, str) and len(value) == 26 and value[19] == '.' else value for value in row) for row in rows]
+                parameters = rows if executemany else rows[0]
+            return statement, parameters
+        
+        event.listen(engine, 'before_cursor_execute', truncate_seconds, retval=True)
+        try:
+            self.run_tick(db_session, datetime(2025, 6, 1, 12, 0, 0, 400000))
+            self.run_tick(db_session, datetime(2025, 6, 1, 12, 0, 0, 900000))  # 同一秒内的第二轮
+        finally:
+            event.remove(engine, 'before_cursor_execute', truncate_seconds)
+        
+        data_ids = [data.DataID for data in db_session.query(RealtimeData).order_by(RealtimeData.DataID)]
+        assert len(data_ids) == 2
+        latest = db_session.get(PointLatest, sample_sensor.PointID).to_dict()
+        assert latest['updated_at'] == datetime(2025, 6, 1, 12, 0, 0).isoformat()
+
+
+class TestLatestReadings:
+    """最新读数维护测试"""
+    
+    def add_reading(self, db_session, sensor, value, timestamp):
+        db_session.add(RealtimeData(NoiseValue=value, Timestamp=timestamp, SensorID=sensor.SensorID, PointID=sensor.PointID))
+        db_session.commit()
+    
+    def test_sensor_latest_ignores_older_readings(self, db_session, sample_sensor):
+        """测试传感器最新读数随写入更新，乱序到达的旧读数不覆盖，超标按读数时段阈值判断"""
+        self.add_reading(db_session, sample_sensor, 55.0, datetime(2025, 6, 1, 23, 0, 0))  # 夜间阈值50
+        latest = db_session.get(SensorLatest, sample_sensor.SensorID)
+        assert (latest.NoiseValue, latest.IsExceeded) == (55.0, 1)
+        
+        self.add_reading(db_session, sample_sensor, 70.0, datetime(2025, 6, 1, 22, 0, 0))
+        db_session.refresh(latest)
+        assert (latest.NoiseValue, latest.Timestamp) == (55.0, datetime(2025, 6, 1, 23, 0, 0))
+        
+        self.add_reading(db_session, sample_sensor, 45.0, datetime(2025, 6, 2, 0, 0, 0))
+        db_session.refresh(latest)
+        assert (latest.NoiseValue, latest.IsExceeded) == (45.0, 0)
+    
+    def test_point_window_trimmed_and_averaged(self, db_session, sample_sensor, monkeypatch):
+        """测试监测点窗口只保留最近 N 条读数（含乱序读数）并计算平均值"""
+        monkeypatch.setattr('app.Config.POINT_RECENT_WINDOW', 3)
+        start = datetime(2025, 6, 1, 12, 0, 0)
+        for i, value in enumerate([40.0, 50.0, 60.0, 70.0]):
+            self.add_reading(db_session, sample_sensor, value, start + timedelta(minutes=i))
+        self.add_reading(db_session, sample_sensor, 80.0, start + timedelta(minutes=1, seconds=30))
+        
+        point = db_session.get(PointLatest, sample_sensor.PointID).to_dict()
+        assert [value for _, value in point['recent_values']] == [80.0, 60.0, 70.0]
+        assert point['avg_noise'] == pytest.approx(70.0)
+        assert point['updated_at'] == (start + timedelta(minutes=3)).isoformat()
+    
+    def test_rebuild_from_history(self, db_session, sample_sensor, monkeypatch):
+        """测试根据已有实时数据重建最新读数"""
+        monkeypatch.setattr('app.Config.POINT_RECENT_WINDOW', 2)
+        start = datetime(2025, 6, 1, 12, 0, 0)
+        for i, value in enumerate([40.0, 50.0, 65.0]):
+            self.add_reading(db_session, sample_sensor, value, start + timedelta(minutes=i))
+        db_session.query(SensorLatest).delete()
+        db_session.query(PointLatest).delete()
+        db_session.commit()
+        
+        assert rebuild_latest_readings(db_session) == 2
+        db_session.commit()
+        latest = db_session.get(SensorLatest, sample_sensor.SensorID)
+        assert (latest.NoiseValue, latest.IsExceeded) == (65.0, 1)
+        assert db_session.get(PointLatest, sample_sensor.PointID).AvgNoise == pytest.approx(57.5)
+    
+    def test_mixed_aware_and_naive_readings(self, client, db_session, sample_sensor):
+        """测试带时区与不带时区的读数混合写入同一监测点时统一按本地时间合并"""
+        start = datetime.now().replace(microsecond=0) - timedelta(minutes=10)
+        aware = start.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')
+        response = client.post('/api/realtime-data/batch', json={'readings': [
+            {'sensor_id': sample_sensor.SensorID, 'noise_value': 45.0, 'timestamp': aware}
+        ]})
+        assert response.status_code == 201
+        
+        for minutes, value in [(1, 50.0), (2, 55.0)]:
+            response = client.post('/api/realtime-data', json={
+                'sensor_id': sample_sensor.SensorID, 'noise_value': value,
+                'timestamp': (start + timedelta(minutes=minutes)).isoformat()
+            })
+            assert response.status_code == 201
+        response = client.post('/api/realtime-data', json={
+            'sensor_id': sample_sensor.SensorID, 'noise_value': 60.0,
+            'timestamp': (start + timedelta(minutes=3)).astimezone(timezone(timedelta(hours=8))).isoformat()
+        })
+        assert response.status_code == 201
+        response = client.post('/api/realtime-data', json={'sensor_id': sample_sensor.SensorID, 'noise_value': 65.0})
+        assert response.status_code == 201
+        
+        point = db_session.get(PointLatest, sample_sensor.PointID)
+        db_session.refresh(point)
+        recent = [(datetime.fromisoformat(timestamp), value) for timestamp, value in json.loads(point.RecentValues)]
+        assert all(timestamp.tzinfo is None for timestamp, _ in recent)
+        assert [value for _, value in recent] == [45.0, 50.0, 55.0, 60.0, 65.0]
+        assert recent[0][0] == start
+    
+    def test_aware_recent_values_merged(self, db_session, sample_sensor):
+        """测试已存储的带时区窗口读数在合并时转换为本地时间"""
+        start = datetime(2025, 6, 1, 12, 0, 0)
+        self.add_reading(db_session, sample_sensor, 50.0, start)
+        point = db_session.get(PointLatest, sample_sensor.PointID)
+        point.RecentValues = json.dumps([[start.astimezone().isoformat(), 50.0]])
+        db_session.commit()
+        
+        self.add_reading(db_session, sample_sensor, 60.0, start + timedelta(minutes=1))
+        db_session.refresh(point)
+        assert json.loads(point.RecentValues) == [
+            [start.isoformat(), 50.0], [(start + timedelta(minutes=1)).isoformat(), 60.0]
+        ]
+        assert point.AvgNoise == pytest.approx(55.0)
+
+
+class TestLeaderElection:
+    """后台任务租约测试"""
+    
+    def test_single_holder_until_expiry(self, db_session):
+        """测试同一时间只有一个进程持有租约，过期后其他进程接管"""
+        assert not claim_lease(db_session, 'worker-a', 30)  # 未开启时不能获取
+        set_generation_enabled(db_session, True)
+        db_session.commit()
+        
+        assert claim_lease(db_session, 'worker-a', 30, status='{}')
+        assert not claim_lease(db_session, 'worker-b', 30)
+        assert claim_lease(db_session, 'worker-a', 30)  # 持有者续租
+        db_session.commit()
+        acquired_at = db_session.get(WorkerLease, GENERATION_LEASE).AcquiredAt
+        
+        db_session.query(WorkerLease).update({'ExpiresAt': datetime.now() - timedelta(seconds=1)})
+        assert claim_lease(db_session, 'worker-b', 30)
+        assert not claim_lease(db_session, 'worker-a', 30)
+        db_session.commit()
+        lease = db_session.get(WorkerLease, GENERATION_LEASE)
+        db_session.refresh(lease)
+        assert lease.HolderID == 'worker-b'
+        assert lease.AcquiredAt > acquired_at
+    
+    def test_release_and_disable(self, db_session):
+        """测试释放后其他进程可立即获取，关闭后任何进程都不能获取"""
+        set_generation_enabled(db_session, True)
+        assert claim_lease(db_session, 'worker-a', 30)
+        release_lease(db_session, 'worker-b')  # 非持有者释放无效
+        assert not claim_lease(db_session, 'worker-b', 30)
+        release_lease(db_session, 'worker-a')
+        assert claim_lease(db_session, 'worker-b', 30)
+        
+        set_generation_enabled(db_session, False)
+        release_lease(db_session, 'worker-b')
+        assert not claim_lease(db_session, 'worker-a', 30)
+        assert db_session.query(WorkerLease).count() == 1
+
+
 class TestDataValidation:
     """数据验证测试"""
     
@@ -131,4 +442,21 @@ class TestDataValidation:
         
         assert min_data.NoiseValue == 0.0
         assert max_data.NoiseValue == 200.0
-
+    
+    def test_parse_reading_normalizes_fields(self):
+        """测试批量读数的环境字段转换为数值，带时区的时间转换为不带时区的本地时间"""
+        timestamp = datetime(2025, 6, 1, 4, 0, 0, tzinfo=timezone(timedelta(hours=8)))
+        fields, error = parse_reading({
+            'sensor_id': 'SENSOR001', 'noise_value': '55', 'temperature': '25.5', 'humidity': '60',
+            'wind_speed': 3, 'timestamp': timestamp.isoformat()
+        })
+        
+        assert error is None
+        assert (fields['Temperature'], fields['Humidity'], fields['WindSpeed']) == (25.5, 60.0, 3.0)
+        assert isinstance(fields['Temperature'], float)
+        assert fields['Timestamp'] == timestamp.astimezone().replace(tzinfo=None)
+        assert fields['Timestamp'].tzinfo is None
+        
+        fields, _ = parse_reading({'sensor_id': 'SENSOR001', 'noise_value': 55, 'timestamp': '2025-06-01T04:00:00Z'})
+        assert fields['Timestamp'] == datetime(2025, 6, 1, 4, 0, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        assert parse_reading({'sensor_id': 'SENSOR001', 'noise_value': 55})[0]['Temperature'] is None
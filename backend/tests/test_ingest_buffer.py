@@ -0,0 +1,100 @@
+"""
+写入缓冲测试
+"""
+import threading
+import pytest
+from time import sleep
+from ingest_buffer import IngestBuffer
+
+
+class TestIngestBuffer:
+    """写入缓冲测试"""
+    
+    def test_flush_by_rows(self):
+        """测试累计满 flush_rows 条后分组提交"""
+        batches = []
+        buffer = IngestBuffer(batches.append, flush_rows=10, flush_interval_ms=5000)
+        
+        assert buffer.submit_many(list(range(25))) == 25
+        buffer.stop()
+        
+        assert [len(b) for b in batches] == [10, 10, 5]
+        assert sum(batches, []) == list(range(25))
+        stats = buffer.stats()
+        assert stats['written'] == 25
+        assert stats['flush_count'] == 3
+        assert stats['queue_depth'] == 0
+    
+    def test_flush_by_interval(self):
+        """测试未满 flush_rows 时按时间间隔提交"""
+        flushed = threading.Event()
+        buffer = IngestBuffer(lambda batch: flushed.set(), flush_rows=1000, flush_interval_ms=20)
+        
+        buffer.submit('reading')
+        
+        assert flushed.wait(2)
+        buffer.stop()
+        assert buffer.stats()['last_flush_ms'] is not None
+    
+    def test_reject_when_full(self):
+        """测试队列满时拒绝写入"""
+        release = threading.Event()
+        buffer = IngestBuffer(lambda batch: release.wait(2), max_size=3, flush_rows=1, flush_interval_ms=10)
+        
+        buffer.submit('first')
+        sleep(0.1)  # 等待写入线程取走第一条并阻塞
+        accepted = buffer.submit_many(['a', 'b', 'c', 'd'])
+        release.set()
+        buffer.stop()
+        
+        assert accepted == 3
+        assert buffer.stats()['rejected'] == 1
+    
+    def test_failed_batch_counted(self):
+        """测试写入失败的批次计入失败数且不影响后续写入"""
+        def write_batch(batch):
+            if 'bad' in batch:
+                raise ValueError('写入失败')
+        
+        buffer = IngestBuffer(write_batch, flush_rows=1, flush_interval_ms=10, retry_backoff_ms=1)
+        buffer.submit_many(['bad', 'good'])
+        buffer.stop()
+        
+        stats = buffer.stats()
+        assert stats['failed'] == 1
+        assert stats['written'] == 1
+    
+    def test_transient_failure_retried(self):
+        """测试暂时性错误（如数据库锁冲突）重试后整批写入，不丢数据"""
+        batches = []
+        failures = [RuntimeError('database is locked')] * 2
+        
+        def write_batch(batch):
+            if failures:
+                raise failures.pop()
+            batches.append(batch)
+        
+        buffer = IngestBuffer(write_batch, flush_rows=10, flush_interval_ms=5000, retry_backoff_ms=1)
+        buffer.submit_many(list(range(10)))
+        buffer.stop()
+        
+        assert batches == [list(range(10))]
+        stats = buffer.stats()
+        assert (stats['written'], stats['failed'], stats['retries'], stats['row_fallbacks']) == (10, 0, 2, 0)
+    
+    def test_bad_row_falls_back_to_row_writes(self):
+        """测试重试仍失败时逐条写入，只丢弃出错的那一条"""
+        written = []
+        
+        def write_batch(batch):
+            if 'bad' in batch:
+                raise ValueError('违反检查约束')
+            written.extend(batch)
+        
+        buffer = IngestBuffer(write_batch, flush_rows=5, flush_interval_ms=5000, max_retries=1, retry_backoff_ms=1)
+        buffer.submit_many(['a', 'b', 'bad', 'c', 'd'])
+        buffer.stop()
+        
+        assert written == ['a', 'b', 'c', 'd']
+        stats = buffer.stats()
+        assert (stats['written'], stats['failed'], stats['retries'], stats['row_fallbacks']) == (4, 1, 1, 1)
@@ -1,9 +1,14 @@
 """
 数据库模型测试
 """
+import sqlite3
 import pytest
-from datetime import datetime
-from app import City, MonitoringPoint, Sensor, SystemUser, RealtimeData, AlertInfo
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import (
+    City, MonitoringPoint, Sensor, SystemUser, RealtimeData, AlertInfo, HourlyRollup, SensorLatest, SchemaMigration,
+    rebuild_hourly_rollups, accumulate_hourly_rollups, migrate_database
+)
 
 
 class TestCity:
@@ -192,6 +197,28 @@ class TestRealtimeData:
         
         db_session.refresh(nighttime_data)
         assert nighttime_data.is_exceeded == False
+    
+    def test_realtime_data_is_exceeded_expression(self, db_session, sample_sensor, sample_monitoring_point):
+        """测试超标判断的 SQL 表达式与 Python 判断一致"""
+        today = datetime.now().replace(minute=0, second=0, microsecond=0)
+        readings = [
+            (65.0, today.replace(hour=12)),  # 昼间超标（阈值60）
+            (55.0, today.replace(hour=12)),  # 昼间未超标
+            (55.0, today.replace(hour=2)),   # 夜间超标（阈值50）
+            (45.0, today.replace(hour=23))   # 夜间未超标
+        ]
+        for value, timestamp in readings:
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=timestamp,
+                SensorID=sample_sensor.SensorID,
+                PointID=sample_monitoring_point.PointID
+            ))
+        db_session.commit()
+        
+        exceeded = db_session.query(RealtimeData).filter(RealtimeData.is_exceeded).all()
+        assert sorted((d.NoiseValue, d.Timestamp.hour) for d in exceeded) == [(55.0, 2), (65.0, 12)]
+        assert all(d.is_exceeded for d in exceeded)
 
 
 class TestAlertInfo:
@@ -212,3 +239,132 @@ class TestAlertInfo:
         assert alert.AlertLevel == '高'
         assert alert.AlertStatus == '未处理'
 
+
+
+class TestHourlyRollup:
+    """小时汇总模型测试"""
+    
+    def add_readings(self, db_session, sensor, values, hour_start):
+        for minute, value in enumerate(values):
+            db_session.add(RealtimeData(
+                NoiseValue=value,
+                Timestamp=hour_start.replace(minute=minute * 10),
+                SensorID=sensor.SensorID,
+                PointID=sensor.PointID
+            ))
+        db_session.commit()
+    
+    def test_rollup_maintained_on_insert(self, db_session, sample_sensor):
+        """测试写入实时数据时增量维护小时汇总"""
+        hour_start = datetime.now().replace(hour=12, minute=0, second=0, microsecond=0)
+        self.add_readings(db_session, sample_sensor, [55.0, 65.0], hour_start)
+        self.add_readings(db_session, sample_sensor, [50.0], hour_start)
+        
+        rollup = db_session.query(HourlyRollup).one()
+        assert rollup.HourStart == hour_start
+        assert rollup.SampleCount == 3
+        assert rollup.NoiseSum == 170.0
+        assert rollup.NoiseMin == 50.0
+        assert rollup.NoiseMax == 65.0
+        assert rollup.ExceedCount == 1  # 昼间阈值60dB
+        assert rollup.to_dict()['avg_noise'] == round(170.0 / 3, 2)
+    
+    def test_rebuild_hourly_rollups(self, db_session, sample_sensor):
+        """测试根据历史数据重建小时汇总"""
+        hour_start = datetime.now().replace(hour=2, minute=0, second=0, microsecond=0)
+        self.add_readings(db_session, sample_sensor, [45.0, 55.0], hour_start)
+        db_session.query(HourlyRollup).delete()
+        db_session.commit()
+        
+        assert rebuild_hourly_rollups(db_session, chunk_size=1) == 2  # 按 DataID 分块读取
+        db_session.commit()
+        
+        rollup = db_session.query(HourlyRollup).one()
+        assert rollup.SampleCount == 2
+        assert rollup.ExceedCount == 1  # 夜间阈值50dB
+    
+    def rollup_snapshot(self, db_session):
+        db_session.expire_all()
+        return sorted(
+            (rollup.SensorID, rollup.PointID, rollup.HourStart, rollup.SampleCount, round(rollup.NoiseSum, 6),
+             rollup.NoiseMin, rollup.NoiseMax, rollup.ExceedCount)
+            for rollup in db_session.query(HourlyRollup)
+        )
+    
+    def assert_matches_rebuild(self, db_session):
+        """当前小时汇总与根据原始数据重建的结果一致"""
+        maintained = self.rollup_snapshot(db_session)
+        rebuild_hourly_rollups(db_session)
+        db_session.commit()
+        assert maintained == self.rollup_snapshot(db_session)
+        return maintained
+    
+    def test_rollup_follows_updates_and_deletes(self, db_session, sample_sensor, sample_monitoring_point):
+        """测试修改、删除实时数据以及修改监测点阈值后小时汇总与原始数据一致"""
+        hour_start = datetime(2025, 6, 1, 12, 0, 0)
+        self.add_readings(db_session, sample_sensor, [55.0, 65.0, 70.0], hour_start)
+        self.add_readings(db_session, sample_sensor, [58.0], hour_start + timedelta(hours=1))
+        readings = db_session.query(RealtimeData).order_by(RealtimeData.Timestamp).all()
+        
+        db_session.delete(readings[2])  # 删除最大值
+        db_session.commit()
+        assert self.assert_matches_rebuild(db_session)[0][3:] == (2, 120.0, 55.0, 65.0, 1)
+        
+        readings[1].NoiseValue = 50.0
+        readings[0].Timestamp = hour_start + timedelta(hours=1, minutes=30)  # 移到下一个小时
+        db_session.commit()
+        assert [row[3] for row in self.assert_matches_rebuild(db_session)] == [1, 2]
+        
+        sample_monitoring_point.NoiseThresholdDay = 52.0
+        db_session.commit()
+        assert [row[7] for row in self.assert_matches_rebuild(db_session)] == [0, 2]
+        
+        other = Sensor(SensorID='SENSOR002', SensorName='传感器2', Status='在线', PointID=sample_monitoring_point.PointID)
+        db_session.add(other)
+        db_session.commit()
+        self.add_readings(db_session, other, [61.0], hour_start)
+        db_session.delete(other)  # 级联删除读数和小时汇总
+        db_session.commit()
+        assert {row[0] for row in self.assert_matches_rebuild(db_session)} == {sample_sensor.SensorID}
+    
+    def test_large_batch_within_parameter_limit(self, db_session, sample_sensor):
+        """测试一次合并大量（传感器, 小时）桶时不受 SQLite 单条语句绑定参数数量的限制"""
+        # 按 SQLite 3.32 之前的默认上限 999 限制当前连接（本机编译的上限较大）
+        dbapi_connection = db_session.connection().connection.dbapi_connection
+        original_limit = dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+        start = datetime(2025, 1, 1)
+        readings = [
+            (sample_sensor.SensorID, sample_sensor.PointID, start + timedelta(hours=i), 55.0)
+            for i in range(500)  # 500 行 × 9 列 > 999
+        ]
+        try:
+            accumulate_hourly_rollups(db_session, readings)
+            accumulate_hourly_rollups(db_session, readings)
+            db_session.commit()
+        finally:
+            dbapi_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, original_limit)
+        
+        assert db_session.query(HourlyRollup).count() == 500
+        assert {rollup.SampleCount for rollup in db_session.query(HourlyRollup)} == {2}
+    
+    def test_migration_rebuilds_history_once(self, client, db_session, sample_sensor):
+        """测试数据库迁移根据升级前的历史数据重建小时汇总和最新读数，已执行的迁移不再重复执行"""
+        hour_start = datetime(2025, 6, 1, 2, 0, 0)
+        # 不经过 ORM 会话写入，模拟升级前已有的历史数据（小时汇总和最新读数均未维护）
+        db_session.execute(insert(RealtimeData), [
+            {'NoiseValue': value, 'Timestamp': hour_start.replace(minute=minute), 'SensorID': sample_sensor.SensorID, 'PointID': sample_sensor.PointID}
+            for minute, value in [(0, 45.0), (10, 55.0), (20, 52.0)]
+        ])
+        db_session.commit()
+        assert db_session.query(HourlyRollup).count() == 0
+        
+        assert migrate_database() == ['hourly_rollup', 'latest_readings']
+        rollup = db_session.query(HourlyRollup).one()
+        assert (rollup.SampleCount, rollup.NoiseSum, rollup.ExceedCount) == (3, 152.0, 2)
+        assert db_session.get(SensorLatest, sample_sensor.SensorID).NoiseValue == 52.0
+        assert {migration.Name for migration in db_session.query(SchemaMigration)} == {'hourly_rollup', 'latest_readings'}
+        
+        self.add_readings(db_session, sample_sensor, [60.0], hour_start.replace(minute=30))
+        assert migrate_database() == []
+        db_session.refresh(rollup)
+        assert rollup.SampleCount == 4
@@ -0,0 +1,113 @@
+"""
+查询计划回归测试
+对热点接口实际执行的 realtime_data 查询运行 EXPLAIN QUERY PLAN，出现全表扫描或额外排序时失败
+"""
+import re
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event
+from app import cache, encode_cursor, MonitoringPoint, Sensor, RealtimeData
+
+
+# SQLite 全表扫描的计划形如 "SCAN realtime_data"，走索引时为 "SEARCH ... USING INDEX" 或 "SCAN ... USING COVERING INDEX"
+FULL_SCAN = re.compile(r'^SCAN realtime_data\w*( AS \w+)?$')
+
+
+@pytest.fixture
+def history(db_session, sample_city):
+    """两个监测点、各两个传感器、最近两天每30分钟一条数据"""
+    points = []
+    for i in range(2):
+        point = MonitoringPoint(
+            PointName=f'计划测试点{i}', PointCode=f'PLAN{i}', Longitude=121.5 + i, Latitude=31.2,
+            District='测试区', PointType='住宅区', NoiseThresholdDay=60.0, NoiseThresholdNight=50.0,
+            CityID=sample_city.CityID
+        )
+        db_session.add(point)
+        db_session.flush()
+        for j in range(2):
+            db_session.add(Sensor(SensorID=f'PLAN{i}{j}', SensorName=f'传感器{i}{j}', Status='在线', PointID=point.PointID))
+        points.append(point)
+    db_session.flush()
+
+    now = datetime.now()
+    for i, point in enumerate(points):
+        for j in range(2):
+            for k in range(96):
+                db_session.add(RealtimeData(
+                    NoiseValue=50.0 + k % 20, Timestamp=now - timedelta(minutes=30 * k),
+                    SensorID=f'PLAN{i}{j}', PointID=point.PointID
+                ))
+    db_session.commit()
+    return points[0].PointID, 'PLAN00'
+
+
+def explain_requests(client, db_session, method, path, **kwargs):
+    """执行请求并返回其中每条 realtime_data 查询的 (SQL, 查询计划明细)"""
+    engine = db_session.get_bind()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT') and 'realtime_data' in statement:
+            statements.append((statement, parameters))
+
+    cache.clear()
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = client.open(path, method=method, **kwargs)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_json()
+
+    plans = []
+    with engine.connect() as conn:
+        for statement, parameters in statements:
+            rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+            plans.append((statement, [row[-1] for row in rows]))
+    assert plans, f'{path} 没有执行 realtime_data 查询'
+    return plans
+
+
+def hot_requests(point_id, sensor_id):
+    """热点请求：{名称: (方法, 路径, 请求参数, 是否检查按时间排序不额外排序)}"""
+    start = (datetime.now() - timedelta(days=1)).isoformat()
+    end = datetime.now().isoformat()
+    return {
+        'realtime_by_point': ('GET', '/api/realtime-data', {'query_string': {'point_id': point_id, 'start_time': start, 'end_time': end}}, True),
+        'realtime_by_sensor': ('GET', '/api/realtime-data', {'query_string': {'sensor_id': sensor_id}}, True),
+        'realtime_cursor_page': ('GET', '/api/realtime-data', {'query_string': {
+            'point_id': point_id, 'cursor': encode_cursor(datetime.now() - timedelta(hours=12), 10 ** 9)
+        }}, True),
+        'alerts_cursor_page': ('GET', '/api/alerts', {'query_string': {'cursor': encode_cursor(datetime.now(), 10 ** 9)}}, True),
+        'noise_by_point_hours': ('GET', '/api/noise-data', {'query_string': {'region_id': point_id, 'hours': 24}}, True),
+        'noise_by_sensor_range': ('GET', '/api/noise-data', {'query_string': {'device_id': sensor_id, 'start_time': start, 'end_time': end}}, True),
+        'trend_by_point': ('GET', '/api/analysis/trend', {'query_string': {'point_id': point_id, 'days': 2}}, False),
+        'trend_by_sensor': ('GET', '/api/analysis/trend', {'query_string': {'sensor_id': sensor_id, 'days': 2}}, False),
+        'trend_analysis': ('POST', '/api/analysis/trend', {'json': {
+            'analysis_type': '日趋势', 'start_date': start, 'end_date': end, 'point_id': point_id
+        }}, False),
+    }
+
+
+class TestHotQueryPlans:
+    """热点查询的执行计划测试"""
+    
+    @pytest.mark.parametrize('name', list(hot_requests(0, '')))
+    def test_no_full_scan(self, client, db_session, history, name):
+        """测试按监测点/传感器和时间过滤的查询走复合索引，列表查询不额外排序"""
+        method, path, kwargs, ordered = hot_requests(*history)[name]
+    
+        for statement, details in explain_requests(client, db_session, method, path, **kwargs):
+            scans = [detail for detail in details if FULL_SCAN.match(detail)]
+            assert not scans, f'{name} 全表扫描 realtime_data:\n{statement}\n{details}'
+            if ordered and 'ORDER BY realtime_data."Timestamp"' in statement:
+                assert 'USE TEMP B-TREE FOR ORDER BY' not in details, f'{name} 未利用索引排序:\n{statement}\n{details}'
+    
+    def test_composite_indexes_exist(self, db_session):
+        """测试 realtime_data 建有 (PointID, Timestamp) 和 (SensorID, Timestamp) 复合索引"""
+        indexes = {
+            tuple(column.name for column in index.columns)
+            for index in RealtimeData.__table__.indexes
+        }
+        assert ('PointID', 'Timestamp') in indexes
+        assert ('SensorID', 'Timestamp') in indexes
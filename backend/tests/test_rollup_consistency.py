@@ -0,0 +1,143 @@
+"""
+小时汇总一致性测试
+升级前写入的历史数据没有经过写入时的小时汇总维护，执行数据库迁移重建后，
+读取小时汇总的统计接口与直接逐条统计原始数据的结果一致
+"""
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+import app as app_module
+from app import HourlyRollup, MonitoringPoint, RealtimeData, Sensor, build_report_content, is_noise_exceeded, migrate_database
+
+
+# 固定的当前时间（不在整点），历史数据和接口中的时间范围都以它为基准
+NOW = datetime(2025, 6, 10, 15, 25, 0)
+
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return NOW
+
+
+@pytest.fixture
+def legacy_history(client, db_session, sample_city, monkeypatch):
+    """两个监测点各两个传感器、最近三天每17分钟一条的历史数据，不经过 ORM 写入（模拟升级前的数据库），然后执行数据库迁移"""
+    monkeypatch.setattr(app_module, 'datetime', FrozenDatetime)
+    points = []
+    for i in range(2):
+        point = MonitoringPoint(
+            PointName=f'一致性测试点{i}', PointCode=f'ROLLUP{i}', Longitude=121.5 + i, Latitude=31.2,
+            District='测试区', PointType='住宅区', NoiseThresholdDay=60.0, NoiseThresholdNight=50.0,
+            CityID=sample_city.CityID
+        )
+        db_session.add(point)
+        db_session.flush()
+        for j in range(2):
+            db_session.add(Sensor(SensorID=f'ROLLUP{i}{j}', SensorName=f'传感器{i}{j}', Status='在线', PointID=point.PointID))
+        points.append(point)
+    db_session.commit()
+    
+    db_session.execute(insert(RealtimeData), [
+        {
+            'NoiseValue': 40.0 + (k * 7 + i * 5 + j * 3) % 40 + 0.5,
+            'Timestamp': NOW - timedelta(minutes=17 * k + 3),
+            'SensorID': f'ROLLUP{i}{j}',
+            'PointID': point.PointID
+        }
+        for i, point in enumerate(points) for j in range(2) for k in range(3 * 24 * 60 // 17)
+    ])
+    db_session.commit()
+    assert db_session.query(HourlyRollup).count() == 0
+    
+    migrate_database()
+    return points
+
+
+def raw_readings(db_session, start_time=None, end_time=None):
+    """逐条读取原始数据，返回 [(读数, 是否超标)]，超标按读数所在时段的昼/夜阈值判断"""
+    query = db_session.query(RealtimeData)
+    if start_time:
+        query = query.filter(RealtimeData.Timestamp >= start_time)
+    if end_time:
+        query = query.filter(RealtimeData.Timestamp <= end_time)
+    return [
+        (reading, is_noise_exceeded(reading.NoiseValue, reading.Timestamp, reading.monitoring_point))
+        for reading in query.all()
+    ]
+
+
+class TestRollupConsistency:
+    """小时汇总与原始数据统计一致性测试"""
+    
+    def test_hourly_pattern_matches_raw(self, client, db_session, legacy_history):
+        """测试24小时模式分析与逐条统计原始数据一致"""
+        for params in ({'days': 2}, {'days': 2, 'region_id': legacy_history[0].PointID}):
+            pattern = client.get('/api/analysis/hourly-pattern', query_string=params).get_json()['pattern']
+            
+            hourly = {}
+            for reading, _ in raw_readings(db_session, NOW - timedelta(days=2)):
+                if 'region_id' not in params or reading.PointID == params['region_id']:
+                    hourly.setdefault(reading.Timestamp.hour, []).append(reading.NoiseValue)
+            expected = [
+                {
+                    'hour': hour,
+                    'avg_noise': round(sum(values) / len(values), 1),
+                    'max_noise': round(max(values), 1),
+                    'min_noise': round(min(values), 1),
+                    'count': len(values)
+                }
+                for hour, values in sorted(hourly.items())
+            ]
+            assert len(expected) == 24
+            assert pattern == expected
+    
+    def test_report_statistics_match_raw(self, db_session, legacy_history):
+        """测试报告统计（首尾不足一小时的周期）与逐条统计原始数据一致"""
+        start_time, end_time = NOW - timedelta(days=2, minutes=41), NOW - timedelta(hours=5, minutes=12)
+        _, content = build_report_content(db_session, '专项报告', start_time, end_time)
+        
+        readings = raw_readings(db_session, start_time, end_time)
+        values = [reading.NoiseValue for reading, _ in readings]
+        statistics = content['statistics']
+        assert statistics['total_data_count'] == len(values)
+        assert statistics['avg_noise'] == round(sum(values) / len(values), 2)
+        assert (statistics['max_noise'], statistics['min_noise']) == (max(values), min(values))
+        assert statistics['exceed_count'] == sum(exceeded for _, exceeded in readings)
+        
+        by_point = {}
+        for reading, _ in readings:
+            by_point.setdefault(reading.PointID, []).append(reading.NoiseValue)
+        assert [(region['region_id'], region['data_count'], region['avg_noise']) for region in content['region_statistics']] == [
+            (point_id, len(point_values), round(sum(point_values) / len(point_values), 2))
+            for point_id, point_values in sorted(by_point.items())
+        ]
+    
+    def test_rollup_total_matches_raw(self, client, legacy_history):
+        """测试列表总数估算在整小时边界（含当前小时）和不限时间时与精确统计一致"""
+        point_id = legacy_history[0].PointID
+        for params in (
+            {},
+            {'point_id': point_id},
+            {'point_id': point_id, 'start_time': (NOW - timedelta(hours=30)).replace(minute=0).isoformat()},
+            {'start_time': (NOW - timedelta(days=2)).replace(minute=0).isoformat(), 'end_time': NOW.replace(hour=3, minute=0).isoformat()}
+        ):
+            estimated = client.get('/api/realtime-data', query_string=params).get_json()['pagination']
+            exact = client.get('/api/realtime-data', query_string=dict(params, exact='true')).get_json()['pagination']
+            assert estimated['total_approximate'] is True
+            assert estimated['total'] == exact['total'] > 0
+    
+    def test_region_today_stats_match_raw(self, client, db_session, legacy_history):
+        """测试区域列表的今日统计与逐条统计原始数据一致"""
+        regions = {region['point_id']: region['recent_stats'] for region in client.get('/api/regions').get_json()['regions']}
+        
+        today = {}
+        for reading, exceeded in raw_readings(db_session, NOW.replace(hour=0, minute=0)):
+            today.setdefault(reading.PointID, []).append((reading.NoiseValue, exceeded))
+        for point in legacy_history:
+            values = [value for value, _ in today[point.PointID]]
+            assert regions[point.PointID] == {
+                'avg_noise': sum(values) / len(values),
+                'data_count': len(values),
+                'exceed_count': sum(exceeded for _, exceeded in today[point.PointID])
+            }
@@ -0,0 +1,142 @@
+"""
+周期任务调度测试
+"""
+import threading
+import pytest
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+import scheduler
+from scheduler import PeriodicTask
+
+
+class TestPeriodicTask:
+    """周期任务调度测试"""
+    
+    def test_fixed_rate_without_drift(self):
+        """测试按计划时间执行，执行耗时不累积成周期漂移"""
+        started = []
+        
+        def work():
+            started.append(monotonic())
+            sleep(0.03)  # 耗时占间隔的一半以上
+        
+        task = PeriodicTask('test', work, 0.05)
+        assert task.start()
+        assert not task.start()  # 已在运行
+        sleep(0.52)
+        task.stop(timeout=1)
+        
+        assert 10 <= len(started) <= 12
+        # 第 k 次执行的开始时间接近 首次 + k*间隔，而不是 k*(间隔+耗时)
+        assert started[-1] - started[0] == pytest.approx((len(started) - 1) * 0.05, abs=0.03)
+        stats = task.stats()
+        assert stats['runs'] == len(started)
+        assert stats['skipped_ticks'] == 0
+        assert stats['last_duration_ms'] >= 30
+        assert not stats['running']
+    
+    def test_overrun_skips_missed_ticks(self):
+        """测试执行超时时跳过错过的周期，不补跑"""
+        calls = []
+        
+        def work():
+            calls.append(monotonic())
+            if len(calls) == 1:
+                sleep(0.17)
+        
+        task = PeriodicTask('slow', work, 0.05)
+        task.start()
+        sleep(0.24)
+        task.stop(timeout=1)
+        
+        stats = task.stats()
+        assert stats['overruns'] == 1
+        assert stats['skipped_ticks'] == 3
+        assert calls[1] - calls[0] == pytest.approx(0.2, abs=0.03)  # 第二次在下一个未错过的周期执行
+    
+    def test_failures_are_counted(self):
+        """测试执行失败不影响后续周期"""
+        done = threading.Event()
+        calls = []
+        
+        def work():
+            calls.append(1)
+            if len(calls) == 1:
+                raise ValueError('模拟失败')
+            done.set()
+        
+        task = PeriodicTask('failing', work, 0.02)
+        task.start()
+        assert done.wait(1)
+        task.stop(timeout=1)
+        
+        stats = task.stats()
+        assert stats['failures'] == 1
+        assert stats['last_error'] == '模拟失败'
+        assert stats['runs'] >= 2
+    
+    def test_aligned_task_waits_for_boundary(self):
+        """测试对齐任务等到下一个周期起点才执行"""
+        task = PeriodicTask('hourly', lambda: None, 3600, align=True)
+        assert 0 < task._seconds_to_boundary() <= 3600
+        task.start()
+        sleep(0.05)
+        stats = task.stats()
+        task.stop(timeout=1)
+        
+        assert stats['runs'] == 0
+        assert 0 < stats['next_run_in_seconds'] <= 3600
+    
+    def test_restart_while_stopping(self):
+        """测试 stop() 后线程尚未退出（正在执行）时 start() 撤销停止，任务继续运行"""
+        running = threading.Event()
+        release = threading.Event()
+        calls = []
+        
+        def work():
+            calls.append(monotonic())
+            if len(calls) == 1:
+                running.set()
+                release.wait(1)
+        
+        task = PeriodicTask('restart', work, 0.02)
+        task.start()
+        assert running.wait(1)
+        task.stop()
+        assert task.start()
+        release.set()
+        sleep(0.1)
+        
+        assert task.running
+        assert len(calls) >= 3
+        assert not task.start()
+        task.stop(timeout=1)
+        assert not task.running
+        assert task.start()  # 线程退出后可以重新启动
+        task.stop(timeout=1)
+    
+    def test_aligned_task_runs_once_per_boundary(self, monkeypatch):
+        """测试系统时间比单调时钟慢时，对齐任务不会在周期起点前提前执行，每个周期只执行一次"""
+        started_mono = monotonic()
+        start_wall = datetime(2025, 6, 1, 12, 0, 0, 30000)
+        
+        class SlowClock(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return start_wall + timedelta(seconds=(monotonic() - started_mono) * 0.8)
+        
+        monkeypatch.setattr(scheduler, 'datetime', SlowClock)
+        periods = []
+        
+        def work():
+            now = SlowClock.now()
+            elapsed = (now - now.replace(hour=0, minute=0, second=0, microsecond=0)).total_seconds()
+            periods.append(round(elapsed / 0.1, 6))
+        
+        task = PeriodicTask('aligned', work, 0.1, align=True)
+        task.start()
+        sleep(0.6)
+        task.stop(timeout=1)
+        
+        assert len(periods) >= 3
+        assert len({int(period) for period in periods}) == len(periods)  # 每次都在新周期的起点之后执行
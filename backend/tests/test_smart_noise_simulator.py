@@ -0,0 +1,101 @@
+"""
+噪音数据模拟器测试
+"""
+import numpy as np
+import pytest
+from datetime import datetime
+from smart_noise_simulator import SmartNoiseSimulator
+
+
+class TestSmartNoiseSimulator:
+    """噪音数据模拟器测试"""
+    
+    def test_smooth_transition_after_long_gap(self):
+        """测试距离上次超过1分钟时的平滑过渡"""
+        simulator = SmartNoiseSimulator()
+        assert simulator._smooth_transition(50.0, 70.0, 120) == 60.0
+        assert simulator._smooth_transition(70.0, 50.0, 120) == 60.0
+        assert simulator._smooth_transition(50.0, 70.0, 600) == 70.0
+    
+    def test_generate_batch_shapes_and_ranges(self):
+        """测试批量生成的字段、形状和取值范围"""
+        simulator = SmartNoiseSimulator()
+        region_types = ['交通干线', '居住区', '工业区', '未知区域'] * 250
+        result = simulator.generate_batch(region_types, datetime(2025, 6, 1, 12), rng=np.random.default_rng(1))
+        
+        assert result['noise_value'].shape == (1000,)
+        assert result['frequency_analysis'].shape == (1000, 3)
+        assert np.allclose(result['frequency_analysis'].sum(axis=1), 1.0)
+        for region_type in set(region_types):
+            low, high = simulator.noise_ranges.get(region_type, (40.0, 70.0))
+            values = result['noise_value'][np.asarray(region_types) == region_type]
+            assert values.min() >= low - 5 and values.max() <= high + 5
+        assert set(result['data_quality']) <= {'优秀', '良好', '一般'}
+        assert set(result['weather']) <= set(simulator.weather_conditions)
+        windy = result['weather'] == 'windy'
+        assert (result['wind_speed'][windy] >= 5).all() and (result['wind_speed'][~windy] <= 5).all()
+    
+    def test_generate_batch_smoothing(self):
+        """测试批量生成的平滑过渡：变化量不超过时间间隔允许的范围（另加±2分贝波动）"""
+        simulator = SmartNoiseSimulator()
+        n = 1000
+        previous = np.full(n, 60.0)
+        elapsed = np.full(n, 30.0)
+        result = simulator.generate_batch(['居住区'] * n, datetime(2025, 6, 1, 3), previous, elapsed, np.random.default_rng(2))
+        assert (np.abs(result['noise_value'] - previous) <= 2.5 + 2 + 0.01).all()
+        
+        # 没有上次值的传感器不做平滑
+        result = simulator.generate_batch(['居住区'] * 2, datetime(2025, 6, 1, 3), [None, 58.0], [None, 30.0], np.random.default_rng(3))
+        assert result['noise_value'][0] <= 40.0
+        assert result['noise_value'][1] >= 53.5
+    
+    def test_generate_batch_offline_devices(self):
+        """测试不在线设备的读数为异常低值、数据质量为无效"""
+        simulator = SmartNoiseSimulator()
+        result = simulator.generate_batch(
+            ['交通干线'] * 2, datetime(2025, 6, 1, 12),
+            rng=np.random.default_rng(4), device_statuses=['离线', '在线']
+        )
+        assert result['noise_value'][0] <= 30
+        assert list(result['data_quality'][:1]) == ['无效']
+        assert result['data_quality'][1] != '无效'
+    
+    def test_generate_batch_is_reproducible(self):
+        """测试相同随机数生成器种子的结果一致"""
+        simulator = SmartNoiseSimulator()
+        first = simulator.generate_batch(['商业区'] * 10, datetime(2025, 6, 1, 12), rng=np.random.default_rng(5))
+        second = simulator.generate_batch(['商业区'] * 10, datetime(2025, 6, 1, 12), rng=np.random.default_rng(5))
+        assert np.array_equal(first['noise_value'], second['noise_value'])
+        assert np.array_equal(first['weather'], second['weather'])
+    
+    def test_same_seed_is_reproducible(self):
+        """测试相同种子的模拟器生成完全相同的数据，不受全局 random 影响"""
+        import random
+        first = SmartNoiseSimulator(seed=7)
+        random.seed(1)
+        first_data = [first.generate_for_sensor('S1', '商业区', datetime(2025, 6, 1, 12, 0, i)) for i in range(5)]
+        second = SmartNoiseSimulator(seed=7)
+        random.seed(2)
+        second_data = [second.generate_for_sensor('S1', '商业区', datetime(2025, 6, 1, 12, 0, i)) for i in range(5)]
+        assert first_data == second_data
+        
+        batch = [SmartNoiseSimulator(seed=7).generate_batch(['商业区'] * 10, datetime(2025, 6, 1, 12)) for _ in range(2)]
+        assert np.array_equal(batch[0]['noise_value'], batch[1]['noise_value'])
+    
+    def test_sensor_state_smoothing(self):
+        """测试模拟器按传感器记录上次值并平滑过渡"""
+        simulator = SmartNoiseSimulator(seed=8)
+        simulator.remember('S1', 80.0, datetime(2025, 6, 1, 2, 59, 30))
+        
+        data = simulator.generate_for_sensor('S1', '交通干线', datetime(2025, 6, 1, 3))
+        assert 80.0 - 2.5 - 2 <= data['noise_value'] <= 80.0 + 2.5 + 2
+        assert simulator.last_value('S1') == (data['noise_value'], datetime(2025, 6, 1, 3))
+        assert simulator.last_value('S2') is None
+        
+        simulator.remember('S2', 80.0, datetime(2025, 6, 1, 3))
+        result = simulator.generate_batch_for_sensors(['S1', 'S2', 'S3'], ['交通干线'] * 3, datetime(2025, 6, 1, 3, 0, 30))
+        assert abs(result['noise_value'][1] - 80.0) <= 2.5 + 2 + 0.01
+        assert [simulator.last_value(s)[0] for s in ('S1', 'S2', 'S3')] == result['noise_value'].tolist()
+        
+        simulator.reset_state()
+        assert simulator.last_value('S1') is None
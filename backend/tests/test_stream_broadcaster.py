@@ -0,0 +1,176 @@
+"""
+实时数据广播测试
+"""
+import json
+import pytest
+from stream_broadcaster import StreamBroadcaster, StreamItem
+
+
+def make_item(index, value, district='海淀区', quality='良好'):
+    """构造一条推送数据（传感器ID为 S{index}，监测点ID为 index，紧凑格式字段为读数和数据质量）"""
+    sensor_id = f'S{index}'
+    return StreamItem(
+        sensor_id, index, district, index,
+        json.dumps({'sensor_id': sensor_id, 'noise_value': value}),
+        (json.dumps(value), json.dumps(quality, ensure_ascii=False)),
+        json.dumps([index, sensor_id])
+    )
+
+
+def parse_frames(text):
+    """解析一个或多个SSE帧，返回 [(事件ID, 事件类型, 数据)]"""
+    frames = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.split('\n'))
+        frames.append((fields.get('id'), fields.get('event'), json.loads(fields['data'])))
+    return frames
+
+
+def parse_frame(text):
+    return parse_frames(text)[0]
+
+
+class TestStreamBroadcaster:
+    """实时数据广播测试"""
+    
+    def test_publish_to_all_subscribers(self):
+        """测试同一帧分发给所有订阅方"""
+        broadcaster = StreamBroadcaster(queue_size=10)
+        first = broadcaster.subscribe()
+        second = broadcaster.subscribe()
+        
+        assert broadcaster.publish([make_item(1, 60.0), make_item(2, 55.0)], '2025-06-01T12:00:00') == 2
+        
+        frame = first.get(timeout=1)
+        assert frame is second.get(timeout=1)  # 只序列化一次
+        assert frame.endswith('\n\n')
+        event_id, _, data = parse_frame(frame)
+        assert event_id == broadcaster.last_event_id
+        assert data == {
+            'status': 'success',
+            'data': [{'sensor_id': 'S1', 'noise_value': 60.0}, {'sensor_id': 'S2', 'noise_value': 55.0}],
+            'timestamp': '2025-06-01T12:00:00'
+        }
+    
+    def test_slow_subscriber_drops_oldest(self):
+        """测试队列满时丢弃最旧的帧，不阻塞发布方"""
+        broadcaster = StreamBroadcaster(queue_size=2)
+        subscriber = broadcaster.subscribe()
+        
+        for i in range(5):
+            broadcaster.publish([make_item(1, float(i))], 'now')
+        
+        frames = [subscriber.get(timeout=1), subscriber.get(timeout=1)]
+        assert [parse_frame(f)[2]['data'][0]['noise_value'] for f in frames] == [3.0, 4.0]
+        assert subscriber.get(timeout=0.01) is None
+        assert broadcaster.stats()['dropped_frames'] == 3
+    
+    def test_unsubscribe(self):
+        """测试取消订阅后不再分发"""
+        broadcaster = StreamBroadcaster()
+        subscriber = broadcaster.subscribe()
+        broadcaster.unsubscribe(subscriber)
+        
+        assert broadcaster.publish([make_item(1, 60.0)], 'now') == 0
+        assert broadcaster.subscriber_count == 0
+    
+    def test_replay_after_last_event_id(self):
+        """测试重连时补发 Last-Event-ID 之后的帧"""
+        broadcaster = StreamBroadcaster()
+        subscriber = broadcaster.subscribe()
+        broadcaster.publish([make_item(1, 1.0)], 'now')
+        last_event_id = parse_frame(subscriber.get(timeout=1))[0]
+        broadcaster.unsubscribe(subscriber)
+        
+        assert broadcaster.has_audience  # 刚断开的订阅方可能重连
+        broadcaster.publish([make_item(1, 2.0)], 'now')
+        broadcaster.publish([make_item(1, 3.0)], 'now')
+        
+        resumed = broadcaster.subscribe(last_event_id)
+        broadcaster.publish([make_item(1, 4.0)], 'now')
+        frames = [parse_frame(resumed.get(timeout=1)) for _ in range(3)]
+        assert [data['data'][0]['noise_value'] for _, _, data in frames] == [2.0, 3.0, 4.0]
+        assert resumed.get(timeout=0.01) is None
+    
+    def test_replay_gap_sends_reset(self):
+        """测试错过的帧已移出缓冲时先发送 reset 事件"""
+        broadcaster = StreamBroadcaster(replay_max_frames=2)
+        for i in range(1, 5):
+            broadcaster.publish([make_item(1, float(i))], 'now')
+        first_event_id = broadcaster.last_event_id.rsplit('-', 1)[0] + '-1'
+        
+        subscriber = broadcaster.subscribe(first_event_id)
+        frames = [parse_frame(subscriber.get(timeout=1)) for _ in range(3)]
+        assert frames[0][1] == 'reset'
+        assert [data['data'][0]['noise_value'] for _, _, data in frames[1:]] == [3.0, 4.0]
+        assert broadcaster.stats()['replay_resets'] == 1
+    
+    def test_replay_from_previous_process(self):
+        """测试来自重启前的事件ID视为断档"""
+        broadcaster = StreamBroadcaster()
+        broadcaster.publish([make_item(1, 60.0)], 'now')
+        
+        subscriber = broadcaster.subscribe('0-99')
+        assert parse_frame(subscriber.get(timeout=1))[1] == 'reset'
+        assert parse_frame(subscriber.get(timeout=1))[2]['data'][0]['noise_value'] == 60.0
+    
+    def test_filtered_subscriber(self):
+        """测试订阅方只收到满足过滤条件的数据"""
+        broadcaster = StreamBroadcaster()
+        district_subscriber = broadcaster.subscribe(filters={'district': {'朝阳区'}})
+        sensor_subscriber = broadcaster.subscribe(filters={'sensor_id': {'S1'}})
+        
+        broadcaster.publish([make_item(1, 60.0), make_item(2, 55.0, district='朝阳区')], 'now')
+        broadcaster.publish([make_item(1, 61.0)], 'now')
+        
+        assert [d['sensor_id'] for d in parse_frame(district_subscriber.get(timeout=1))[2]['data']] == ['S2']
+        assert district_subscriber.get(timeout=0.01) is None  # 第二批没有匹配的数据
+        assert [parse_frame(sensor_subscriber.get(timeout=1))[2]['data'][0]['noise_value'] for _ in range(2)] == [60.0, 61.0]
+    
+    def test_compact_subscriber(self):
+        """测试紧凑格式：连接时发送元数据快照，之后只发送变化的字段，新传感器先补发元数据"""
+        broadcaster = StreamBroadcaster()
+        subscriber = broadcaster.subscribe(compact=True, snapshot=[(1, json.dumps([1, 'S1']))])
+        
+        _, event, meta = parse_frame(subscriber.get(timeout=1))
+        assert event == 'meta'
+        assert meta['snapshot'] is True
+        assert meta['sensors'] == [[1, 'S1']]
+        assert meta['fields'][0] == 'index'
+        
+        broadcaster.publish([make_item(1, 60.0), make_item(2, 55.0)], 'now')
+        (_, meta_event, new_meta), (event_id, delta_event, delta) = parse_frames(subscriber.get(timeout=1))
+        assert meta_event == 'meta' and new_meta == {'snapshot': False, 'sensors': [[2, 'S2']]}
+        assert delta_event == 'delta' and event_id == broadcaster.last_event_id
+        assert delta == {'t': 'now', 'd': [[1, 3, 60.0, '良好'], [2, 3, 55.0, '良好']]}
+        
+        # 只发送相对上次变化的字段，没有变化的传感器不出现
+        broadcaster.publish([make_item(1, 60.0), make_item(2, 56.0)], 'now')
+        assert parse_frames(subscriber.get(timeout=1)) == [(broadcaster.last_event_id, 'delta', {'t': 'now', 'd': [[2, 1, 56.0]]})]
+        broadcaster.publish([make_item(2, 56.0, quality='异常')], 'now')
+        assert parse_frame(subscriber.get(timeout=1))[2]['d'] == [[2, 2, '异常']]
+        broadcaster.publish([make_item(1, 60.0)], 'now')
+        assert subscriber.get(timeout=0.01) is None
+    
+    def test_compact_meta_survives_dropped_frames(self):
+        """测试慢速订阅方丢帧时新传感器的元数据不丢失，并推送 gap 事件后重新发送全部字段"""
+        broadcaster = StreamBroadcaster(queue_size=1)
+        subscriber = broadcaster.subscribe(compact=True)
+        subscriber.get(timeout=1)  # 快照
+        
+        broadcaster.publish([make_item(1, 60.0)], 'first')
+        broadcaster.publish([make_item(1, 61.0)], 'second')  # 队列已满，丢弃第一帧
+        
+        frames = parse_frames(subscriber.get(timeout=1))
+        assert [(event, data.get('status', data)) for _, event, data in frames] == [
+            ('meta', {'snapshot': False, 'sensors': [[1, 'S1']]}),
+            ('gap', 'gap'),
+            ('delta', {'t': 'second', 'd': [[1, 3, 61.0, '良好']]})  # 客户端没有收到第一帧，发送全部字段
+        ]
+        assert frames[1][2]['dropped'] == 1
+        assert broadcaster.stats()['dropped_frames'] == 1
+        assert broadcaster.stats()['gap_resyncs'] == 1
+        assert subscriber.get(timeout=0.01) is None
+        
+        broadcaster.publish([make_item(1, 62.0)], 'third')
+        assert parse_frame(subscriber.get(timeout=1))[2]['d'] == [[1, 1, 62.0]]
@@ -88,6 +88,7 @@ export const deviceAPI = {
 export const reportAPI = {
   get: (params?: any) => api.get('/reports', { params }),
   post: (data: any) => api.post('/reports', data),
+  getJob: (jobId: number) => api.get(`/reports/jobs/${jobId}`),
   delete: (reportId: number) => api.delete(`/reports/${reportId}`)
 }
 